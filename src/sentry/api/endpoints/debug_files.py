@@ -26,6 +26,7 @@ from sentry.tasks.assemble import (
     ChunkFileState,
 )
 from sentry.utils import json
+from sentry.utils.files import iter_file
 
 
 logger = logging.getLogger("sentry.api")
@@ -63,10 +64,8 @@ class DebugFilesEndpoint(ProjectEndpoint):
             raise Http404
 
         try:
-            fp = debug_file.file.getfile()
-            response = StreamingHttpResponse(
-                iter(lambda: fp.read(4096), b""), content_type="application/octet-stream"
-            )
+            fp = debug_file.file.getfile(readahead=True)
+            response = StreamingHttpResponse(iter_file(fp), content_type="application/octet-stream")
             response["Content-Length"] = debug_file.file.size
             response["Content-Disposition"] = 'attachment; filename="%s%s"' % (
                 posixpath.basename(debug_file.debug_id),
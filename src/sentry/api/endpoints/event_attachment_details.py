@@ -11,6 +11,7 @@ from sentry.api.serializers.models.organization import ATTACHMENTS_ROLE_DEFAULT
 from sentry.auth.superuser import is_active_superuser
 from sentry.auth.system import is_system_auth
 from sentry.models import EventAttachment, OrganizationMember
+from sentry.utils.files import iter_file
 
 
 class EventAttachmentDetailsPermission(ProjectPermission):
@@ -52,9 +53,9 @@ class EventAttachmentDetailsEndpoint(ProjectEndpoint):
 
     def download(self, attachment):
         file = attachment.file
-        fp = file.getfile()
+        fp = file.getfile(readahead=True)
         response = StreamingHttpResponse(
-            iter(lambda: fp.read(4096), b""),
+            iter_file(fp),
             content_type=file.headers.get("content-type", "application/octet-stream"),
         )
         response["Content-Length"] = file.size
@@ -306,6 +306,14 @@ def handle_discard(request, group_list, projects, user):
                 GroupHash.objects.filter(group=group).update(
                     group=None, group_tombstone_id=tombstone.id
                 )
+                GroupHash.objects.invalidate_cache(group.project_id)
+                # Hashes cached before the transaction commits still point
+                # at the group, so invalidate once more after the commit.
+                transaction.on_commit(
+                    lambda project_id=group.project_id: GroupHash.objects.invalidate_cache(
+                        project_id
+                    )
+                )
 
     for project in projects:
         _delete_groups(request, project, groups_to_delete.get(project.id), delete_type="discard")
@@ -330,6 +338,7 @@ def _delete_groups(request, project, group_list, delete_type):
     transaction_id = uuid4().hex
 
     GroupHash.objects.filter(project_id=project.id, group__id__in=group_ids).delete()
+    GroupHash.objects.invalidate_cache(project.id)
 
     delete_groups_task.apply_async(
         kwargs={
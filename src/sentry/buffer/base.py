@@ -3,10 +3,13 @@ from __future__ import absolute_import
 import logging
 import six
 
+from collections import defaultdict
+from django.db import router, transaction
 from django.db.models import F
 
 from sentry.signals import buffer_incr_complete
 from sentry.tasks.process_buffer import process_incr
+from sentry.utils import metrics
 from sentry.utils.services import Service
 
 
@@ -32,7 +35,7 @@ class Buffer(Service):
     keep up with the updates.
     """
 
-    __all__ = ("incr", "process", "process_pending", "validate")
+    __all__ = ("incr", "incr_multi", "process", "process_batch", "process_pending", "validate")
 
     def incr(self, model, columns, filters, extra=None):
         """
@@ -42,10 +45,80 @@ class Buffer(Service):
             kwargs={"model": model, "columns": columns, "filters": filters, "extra": extra}
         )
 
+    def incr_multi(self, items):
+        """
+        Apply several increments at once. ``items`` is an iterable of
+        ``(model, columns, filters, extra)`` tuples.
+
+        >>> incr_multi([(Group, {'times_seen': 1}, {'pk': group.pk}, None)])
+        """
+        for model, columns, filters, extra in items:
+            self.incr(model, columns, filters, extra)
+
     def process_pending(self, partition=None):
         return []
 
     def process(self, model, columns, filters, extra=None):
+        created = self._process_update(model, columns, filters, extra)
+
+        buffer_incr_complete.send_robust(
+            model=model,
+            columns=columns,
+            filters=filters,
+            extra=extra,
+            created=created,
+            sender=model,
+        )
+
+    def process_batch(self, items):
+        """
+        Process several increments, given as ``(model, columns, filters, extra)``
+        tuples, writing the rows of each model in a single transaction.
+
+        Rows are written in a stable order so that concurrent batches touching
+        the same rows don't deadlock. If the transaction fails, the rows of
+        that model are retried one by one so a single bad row can't take the
+        rest of the batch down with it.
+        """
+        by_model = defaultdict(list)
+        for item in items:
+            by_model[item[0]].append(item)
+
+        for model, model_items in six.iteritems(by_model):
+            model_items.sort(key=lambda item: sorted(six.iteritems(item[2])))
+
+            try:
+                with transaction.atomic(using=router.db_for_write(model)):
+                    results = [(item, self._process_update(*item)) for item in model_items]
+            except Exception:
+                self.logger.exception(
+                    "buffer.process-batch.failed",
+                    extra={"model": model.__name__, "size": len(model_items)},
+                )
+                for item in model_items:
+                    try:
+                        Buffer.process(self, *item)
+                    except Exception:
+                        self.logger.exception(
+                            "buffer.process.failed", extra={"model": model.__name__}
+                        )
+                continue
+
+            metrics.timing(
+                "buffer.process-batch.size", len(model_items), tags={"model": model.__name__}
+            )
+
+            for (model, columns, filters, extra), created in results:
+                buffer_incr_complete.send_robust(
+                    model=model,
+                    columns=columns,
+                    filters=filters,
+                    extra=extra,
+                    created=created,
+                    sender=model,
+                )
+
+    def _process_update(self, model, columns, filters, extra=None):
         from sentry.models import Group
         from sentry.event_manager import ScoreClause
 
@@ -63,12 +136,4 @@ class Buffer(Service):
             )
 
         _, created = model.objects.create_or_update(values=update_kwargs, **filters)
-
-        buffer_incr_complete.send_robust(
-            model=model,
-            columns=columns,
-            filters=filters,
-            extra=extra,
-            created=created,
-            sender=model,
-        )
+        return created
@@ -0,0 +1,101 @@
+"""
+Compact, versioned serialization for values stored in buffer hashes.
+
+Every encoded payload starts with a single version byte followed by the
+msgpack encoding of the value. Values msgpack cannot represent natively are
+stored as extension types:
+
+- datetimes are stored as UTC seconds and microseconds,
+- decimals are stored as their string representation,
+- model instances are stored as a ``(model path, pk)`` reference and come back
+  as an unsaved instance carrying only the primary key,
+- anything else falls back to an embedded pickle.
+
+Payloads written by older versions of the buffer (pickle or tagged JSON) do
+not start with a version byte and are detected by ``is_encoded``, so callers
+can keep reading them while a deploy rolls out.
+"""
+
+from __future__ import absolute_import
+
+import calendar
+import msgpack
+import six
+
+from datetime import datetime
+from decimal import Decimal
+from django.db import models
+from django.utils import timezone
+
+from sentry.utils import metrics
+from sentry.utils.compat import pickle
+from sentry.utils.imports import import_string
+
+VERSION_1 = b"\x01"
+
+EXT_DATETIME = 1
+EXT_DECIMAL = 2
+EXT_MODEL = 3
+EXT_PICKLE = 4
+
+
+def _pack(value):
+    return msgpack.packb(value, use_bin_type=True, default=_encode_ext)
+
+
+def _unpack(payload):
+    return msgpack.unpackb(payload, raw=False, ext_hook=_decode_ext)
+
+
+def _encode_ext(value):
+    if isinstance(value, datetime):
+        aware = timezone.is_aware(value)
+        if aware:
+            value = value.astimezone(timezone.utc)
+        return msgpack.ExtType(
+            EXT_DATETIME, _pack((calendar.timegm(value.timetuple()), value.microsecond, aware))
+        )
+    elif isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, _pack(six.text_type(value)))
+    elif isinstance(value, models.Model) and value.pk is not None:
+        model = type(value)
+        return msgpack.ExtType(
+            EXT_MODEL, _pack((u"%s.%s" % (model.__module__, model.__name__), value.pk))
+        )
+
+    metrics.incr(
+        "buffer.codec.pickle-fallback", tags={"type": type(value).__name__}, skip_internal=True
+    )
+    return msgpack.ExtType(EXT_PICKLE, pickle.dumps(value, protocol=2))
+
+
+def _decode_ext(code, data):
+    if code == EXT_DATETIME:
+        seconds, microsecond, aware = _unpack(data)
+        rv = datetime.utcfromtimestamp(seconds).replace(microsecond=microsecond)
+        if aware:
+            rv = rv.replace(tzinfo=timezone.utc)
+        return rv
+    elif code == EXT_DECIMAL:
+        return Decimal(_unpack(data))
+    elif code == EXT_MODEL:
+        path, pk = _unpack(data)
+        return import_string(path)(pk=pk)
+    elif code == EXT_PICKLE:
+        return pickle.loads(data)
+    return msgpack.ExtType(code, data)
+
+
+def encode(value):
+    return VERSION_1 + _pack(value)
+
+
+def is_encoded(payload):
+    return payload[:1] == VERSION_1
+
+
+def decode(payload):
+    version = payload[:1]
+    if version != VERSION_1:
+        raise ValueError("unknown buffer codec version: %r" % (version,))
+    return _unpack(payload[1:])
@@ -2,17 +2,21 @@ from __future__ import absolute_import
 
 import six
 
+import atexit
 import contextlib
+import os
 import threading
 from time import time
 from binascii import crc32
+from collections import defaultdict
 
 from datetime import datetime
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from django.utils.encoding import force_bytes
 
-from sentry.buffer import Buffer
+from sentry.buffer import Buffer, codec
 from sentry.exceptions import InvalidConfiguration
 from sentry.tasks.process_buffer import process_incr, process_pending
 from sentry.utils import json, metrics
@@ -25,6 +29,26 @@ _local_buffers = None
 _local_buffers_lock = threading.Lock()
 
 
+def _merge_incr(buffers, model, columns, filters, extra):
+    """
+    Merge an increment into ``buffers``, a mapping of ``(filters, model)`` to
+    ``(columns, extra)``. Counters are summed and extra values are last write
+    wins per column, which is what the Redis hash would end up containing.
+    """
+    key = (tuple(sorted(filters.items())), model)
+
+    stored_columns, stored_extra = buffers.get(key, ({}, None))
+
+    for k, v in six.iteritems(columns):
+        stored_columns[k] = stored_columns.get(k, 0) + v
+
+    if extra:
+        stored_extra = dict(stored_extra or ())
+        stored_extra.update(extra)
+
+    buffers[key] = stored_columns, stored_extra
+
+
 @contextlib.contextmanager
 def batch_buffers_incr():
     global _local_buffers
@@ -42,8 +66,10 @@ def batch_buffers_incr():
             buffers_to_flush = _local_buffers
             _local_buffers = None
 
-            for (filters, model), (columns, extra) in buffers_to_flush.items():
-                buffer.incr(model=model, columns=columns, filters=dict(filters), extra=extra)
+            buffer.incr_multi(
+                (model, columns, dict(filters), extra)
+                for (filters, model), (columns, extra) in six.iteritems(buffers_to_flush)
+            )
 
 
 class PendingBuffer(object):
@@ -74,15 +100,57 @@ class PendingBuffer(object):
 
 
 class RedisBuffer(Buffer):
+    """
+    Buffers increments in Redis hashes which are periodically flushed to the
+    database by ``process_pending``.
+
+    When ``coalesce_max_keys`` is set, increments are additionally coalesced
+    in process memory and merged per ``(model, filters)`` key. The coalesced
+    increments are written with a single pipeline per Redis host once either
+    ``coalesce_max_keys`` distinct keys have been collected, or
+    ``coalesce_max_age`` seconds have passed since the first increment of the
+    current window. Anything still pending is flushed when the process exits.
+
+    Filters and extra columns are written as pickles by default, which every
+    version of this buffer can read. Switching to the more compact codec (see
+    ``sentry.buffer.codec``) takes two deploys: first upgrade all workers,
+    which read both formats, then set ``legacy_pickle_writes`` to ``False``.
+    """
+
     key_expire = 60 * 60  # 1 hour
     pending_key = "b:p"
-
-    def __init__(self, pending_partitions=1, incr_batch_size=2, **options):
+    # stay well within the 60 second ``process_pending`` lock
+    pending_scan_timeout = 30
+
+    def __init__(
+        self,
+        pending_partitions=1,
+        incr_batch_size=2,
+        coalesce_max_keys=0,
+        coalesce_max_age=1.0,
+        legacy_pickle_writes=True,
+        pending_chunk_size=0,
+        pending_max_queue_size=0,
+        **options
+    ):
         self.cluster, options = get_cluster_from_options("SENTRY_BUFFER_OPTIONS", options)
         self.pending_partitions = pending_partitions
         self.incr_batch_size = incr_batch_size
+        self.coalesce_max_keys = coalesce_max_keys
+        self.coalesce_max_age = coalesce_max_age
+        self.legacy_pickle_writes = legacy_pickle_writes
+        self.pending_chunk_size = pending_chunk_size
+        self.pending_max_queue_size = pending_max_queue_size
         assert self.pending_partitions > 0
         assert self.incr_batch_size > 0
+        assert self.coalesce_max_keys >= 0
+        assert self.coalesce_max_age > 0
+        assert self.pending_chunk_size >= 0
+
+        self._coalesce_lock = threading.Lock()
+        self._reset_coalesce_state()
+        if self.coalesce_max_keys:
+            atexit.register(self.flush)
 
     def validate(self):
         try:
@@ -172,6 +240,13 @@ class RedisBuffer(Buffer):
         else:
             raise TypeError("invalid type: {}".format(type_))
 
+    def _reset_coalesce_state(self):
+        self._coalesce_pid = os.getpid()
+        self._coalesce_buffers = {}
+        self._coalesce_incrs = 0
+        self._coalesce_started = None
+        self._coalesce_timer = None
+
     def incr(self, model, columns, filters, extra=None):
         """
         Increment the key by doing the following:
@@ -185,34 +260,124 @@ class RedisBuffer(Buffer):
         if _local_buffers is not None:
             with _local_buffers_lock:
                 if _local_buffers is not None:
-                    frozen_filters = tuple(sorted(filters.items()))
-                    key = (frozen_filters, model)
+                    _merge_incr(_local_buffers, model, columns, filters, extra)
+                    return
 
-                    stored_columns, stored_extra = _local_buffers.get(key, ({}, None))
+        if self.coalesce_max_keys:
+            self._coalesce_incr(model, columns, filters, extra)
+            return
 
-                    for k, v in columns.items():
-                        stored_columns[k] = stored_columns.get(k, 0) + v
+        self.incr_multi([(model, columns, filters, extra)])
 
-                    if extra is not None:
-                        stored_extra = extra
+    def _coalesce_incr(self, model, columns, filters, extra):
+        with self._coalesce_lock:
+            if self._coalesce_pid != os.getpid():
+                # Anything collected before a fork belongs to (and will be
+                # flushed by) the parent process.
+                self._reset_coalesce_state()
 
-                    _local_buffers[key] = stored_columns, stored_extra
-                    return
+            _merge_incr(self._coalesce_buffers, model, columns, filters, extra)
+            self._coalesce_incrs += 1
 
-        # TODO(dcramer): longer term we'd rather not have to serialize values
-        # here (unless it's to JSON)
-        key = self._make_key(model, filters)
-        pending_key = self._make_pending_key_from_key(key)
-        # We can't use conn.map() due to wanting to support multiple pending
-        # keys (one per Redis partition)
-        conn = self.cluster.get_local_client_for_key(key)
+            if self._coalesce_started is None:
+                self._coalesce_started = time()
+                self._coalesce_timer = threading.Timer(self.coalesce_max_age, self._flush_timer)
+                self._coalesce_timer.daemon = True
+                self._coalesce_timer.start()
+
+            should_flush = len(self._coalesce_buffers) >= self.coalesce_max_keys or (
+                time() - self._coalesce_started >= self.coalesce_max_age
+            )
 
-        pipe = conn.pipeline()
+        if should_flush:
+            self.flush()
+
+    def _flush_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            self.logger.exception("buffer.coalesce.flush-failed")
+
+    def flush(self):
+        """
+        Write all increments coalesced in this process to Redis.
+        """
+        with self._coalesce_lock:
+            if self._coalesce_pid != os.getpid():
+                self._reset_coalesce_state()
+                return
+
+            buffers = self._coalesce_buffers
+            incrs = self._coalesce_incrs
+            started = self._coalesce_started
+            if self._coalesce_timer is not None:
+                self._coalesce_timer.cancel()
+            self._reset_coalesce_state()
+
+        if not buffers:
+            return
+
+        metrics.timing("buffer.coalesce.incrs", incrs)
+        metrics.timing("buffer.coalesce.keys", len(buffers))
+        metrics.timing("buffer.coalesce.ratio", float(incrs) / len(buffers))
+        metrics.timing("buffer.coalesce.age", time() - started)
+
+        with metrics.timer("buffer.coalesce.flush"):
+            self.incr_multi(
+                (model, columns, dict(filters), extra)
+                for (filters, model), (columns, extra) in six.iteritems(buffers)
+            )
+
+    def incr_multi(self, items):
+        """
+        Apply several increments, using a single pipeline per Redis host.
+        """
+        router = self.cluster.get_router()
+        hosts = defaultdict(list)
+        for model, columns, filters, extra in items:
+            key = self._make_key(model, filters)
+            hosts[router.get_host_for_key(key)].append((key, model, columns, filters, extra))
+
+        for host_id, host_items in six.iteritems(hosts):
+            # We can't use conn.map() due to wanting to support multiple pending
+            # keys (one per Redis partition)
+            pipe = self.cluster.get_local_client(host_id).pipeline()
+            for key, model, columns, filters, extra in host_items:
+                self._incr_pipeline(pipe, key, model, columns, filters, extra)
+            pipe.execute()
+
+            for key, model, columns, filters, extra in host_items:
+                metrics.incr(
+                    "buffer.incr",
+                    skip_internal=True,
+                    tags={"module": model.__module__, "model": model.__name__},
+                )
+
+    def _encode(self, value):
+        if self.legacy_pickle_writes:
+            return pickle.dumps(value)
+        return codec.encode(value)
+
+    def _decode_filters(self, payload):
+        if codec.is_encoded(payload):
+            return codec.decode(payload)
+        elif payload.startswith("{"):
+            return self._load_values(json.loads(payload))
+        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+        return pickle.loads(payload)
+
+    def _decode_extra(self, payload):
+        if codec.is_encoded(payload):
+            return codec.decode(payload)
+        elif payload.startswith("["):
+            return self._load_value(json.loads(payload))
+        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
+        return pickle.loads(payload)
+
+    def _incr_pipeline(self, pipe, key, model, columns, filters, extra):
+        pending_key = self._make_pending_key_from_key(key)
         pipe.hsetnx(key, "m", "%s.%s" % (model.__module__, model.__name__))
-        # TODO(dcramer): once this goes live in production, we can kill the pickle path
-        # (this is to ensure a zero downtime deploy where we can transition event processing)
-        pipe.hsetnx(key, "f", pickle.dumps(filters))
-        # pipe.hsetnx(key, 'f', json.dumps(self._dump_values(filters)))
+        pipe.hsetnx(key, "f", self._encode(filters))
         for column, amount in six.iteritems(columns):
             pipe.hincrby(key, "i+" + column, amount)
 
@@ -221,19 +386,9 @@ class RedisBuffer(Buffer):
             # hook here
             # e.g. "update score if last_seen or times_seen is changed"
             for column, value in six.iteritems(extra):
-                # TODO(dcramer): once this goes live in production, we can kill the pickle path
-                # (this is to ensure a zero downtime deploy where we can transition event processing)
-                pipe.hset(key, "e+" + column, pickle.dumps(value))
-                # pipe.hset(key, 'e+' + column, json.dumps(self._dump_value(value)))
+                pipe.hset(key, "e+" + column, self._encode(value))
         pipe.expire(key, self.key_expire)
         pipe.zadd(pending_key, time(), key)
-        pipe.execute()
-
-        metrics.incr(
-            "buffer.incr",
-            skip_internal=True,
-            tags={"module": model.__module__, "model": model.__name__},
-        )
 
     def process_pending(self, partition=None):
         if partition is None and self.pending_partitions > 1:
@@ -252,6 +407,13 @@ class RedisBuffer(Buffer):
         if not client.set(lock_key, "1", nx=True, ex=60):
             return
 
+        if self.pending_chunk_size:
+            try:
+                self._process_pending_chunked(pending_key)
+            finally:
+                client.delete(lock_key)
+            return
+
         pending_buffer = PendingBuffer(self.incr_batch_size)
 
         try:
@@ -278,15 +440,105 @@ class RedisBuffer(Buffer):
         finally:
             client.delete(lock_key)
 
+    def _get_process_incr_queue_size(self):
+        from sentry.monitoring.queues import backend
+
+        if backend is None:
+            return 0
+        return backend.get_size(
+            getattr(process_incr, "queue", None) or settings.CELERY_DEFAULT_QUEUE
+        )
+
+    def _process_pending_chunked(self, pending_key):
+        """
+        Drain the pending set in chunks of ``pending_chunk_size`` keys per
+        host, oldest first, instead of loading it all at once. Stops early
+        when the ``process_incr`` queue holds more than
+        ``pending_max_queue_size`` tasks, or when ``pending_scan_timeout``
+        seconds have passed; the remainder is picked up by the next run.
+        """
+        started = time()
+        pending_buffer = PendingBuffer(self.incr_batch_size)
+        keycount = 0
+        chunks = 0
+
+        while time() - started < self.pending_scan_timeout:
+            if self.pending_max_queue_size:
+                queue_size = self._get_process_incr_queue_size()
+                if queue_size >= self.pending_max_queue_size:
+                    metrics.incr("buffer.pending-throttled", skip_internal=False)
+                    self.logger.info(
+                        "buffer.pending-throttled",
+                        extra={"pending_key": pending_key, "queue_size": queue_size},
+                    )
+                    break
+
+            with self.cluster.all() as conn:
+                results = conn.zrangebyscore(
+                    pending_key,
+                    "-inf",
+                    "+inf",
+                    start=0,
+                    num=self.pending_chunk_size,
+                    withscores=True,
+                )
+
+            results = dict(
+                (host_id, rows) for host_id, rows in six.iteritems(results.value) if rows
+            )
+            if not results:
+                break
+
+            if not chunks:
+                oldest = min(rows[0][1] for rows in six.itervalues(results))
+                metrics.timing("buffer.pending-age", time() - oldest)
+
+            chunks += 1
+            with self.cluster.all() as conn:
+                for host_id, rows in six.iteritems(results):
+                    keys = [key for key, _ in rows]
+                    keycount += len(keys)
+                    for key in keys:
+                        pending_buffer.append(key)
+                        if pending_buffer.full():
+                            process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
+                    conn.target([host_id]).zrem(pending_key, *keys)
+
+        # queue up remainder of pending keys
+        if not pending_buffer.empty():
+            process_incr.apply_async(kwargs={"batch_keys": pending_buffer.flush()})
+
+        metrics.timing("buffer.pending-size", keycount)
+        metrics.timing("buffer.pending-chunks", chunks)
+
     def process(self, key=None, batch_keys=None):
         assert not (key is None and batch_keys is None)
         assert not (key is not None and batch_keys is not None)
 
         if key is not None:
-            batch_keys = [key]
-
-        for key in batch_keys:
             self._process_single_incr(key)
+        elif len(batch_keys) == 1:
+            self._process_single_incr(batch_keys[0])
+        else:
+            self._process_batch_incr(batch_keys)
+
+    def _load_incr(self, values):
+        """
+        Decode the contents of a buffer hash into the ``(model, columns,
+        filters, extra)`` arguments for ``Buffer.process``.
+        """
+        model = import_string(values.pop("m"))
+        filters = self._decode_filters(values.pop("f"))
+
+        incr_values = {}
+        extra_values = {}
+        for k, v in six.iteritems(values):
+            if k.startswith("i+"):
+                incr_values[k[2:]] = int(v)
+            elif k.startswith("e+"):
+                extra_values[k[2:]] = self._decode_extra(v)
+
+        return model, incr_values, filters, extra_values
 
     def _process_single_incr(self, key):
         client = self.cluster.get_routing_client()
@@ -313,25 +565,57 @@ class RedisBuffer(Buffer):
                 self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
                 return
 
-            model = import_string(values.pop("m"))
-            if values["f"].startswith("{"):
-                filters = self._load_values(json.loads(values.pop("f")))
-            else:
-                # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                filters = pickle.loads(values.pop("f"))
-
-            incr_values = {}
-            extra_values = {}
-            for k, v in six.iteritems(values):
-                if k.startswith("i+"):
-                    incr_values[k[2:]] = int(v)
-                elif k.startswith("e+"):
-                    if v.startswith("["):
-                        extra_values[k[2:]] = self._load_value(json.loads(v))
-                    else:
-                        # TODO(dcramer): legacy pickle support - remove in Sentry 9.1
-                        extra_values[k[2:]] = pickle.loads(v)
-
-            super(RedisBuffer, self).process(model, incr_values, filters, extra_values)
+            super(RedisBuffer, self).process(*self._load_incr(values))
         finally:
             client.delete(lock_key)
+
+    def _process_batch_incr(self, keys):
+        # Same as ``_process_single_incr``, but locks, reads and clears all
+        # keys with one round-trip per host and hands the results to
+        # ``process_batch`` so they are written in bulk.
+        with self.cluster.map() as conn:
+            lock_results = [
+                (key, conn.set(self._make_lock_key(key), "1", nx=True, ex=10)) for key in keys
+            ]
+
+        locked_keys = []
+        for key, result in lock_results:
+            if result.value:
+                locked_keys.append(key)
+            else:
+                metrics.incr("buffer.revoked", tags={"reason": "locked"}, skip_internal=False)
+                self.logger.debug("buffer.revoked.locked", extra={"redis_key": key})
+
+        if not locked_keys:
+            return
+
+        try:
+            router = self.cluster.get_router()
+            hosts = defaultdict(list)
+            for key in locked_keys:
+                hosts[router.get_host_for_key(key)].append(key)
+
+            items = []
+            for host_id, host_keys in six.iteritems(hosts):
+                pipe = self.cluster.get_local_client(host_id).pipeline()
+                for key in host_keys:
+                    pipe.hgetall(key)
+                    pipe.zrem(self._make_pending_key_from_key(key), key)
+                    pipe.delete(key)
+                results = pipe.execute()
+
+                for key, values in zip(host_keys, results[::3]):
+                    if not values:
+                        metrics.incr(
+                            "buffer.revoked", tags={"reason": "empty"}, skip_internal=False
+                        )
+                        self.logger.debug("buffer.revoked.empty", extra={"redis_key": key})
+                        continue
+                    items.append(self._load_incr(values))
+
+            if items:
+                self.process_batch(items)
+        finally:
+            with self.cluster.map() as conn:
+                for key in locked_keys:
+                    conn.delete(self._make_lock_key(key))
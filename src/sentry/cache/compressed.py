@@ -0,0 +1,147 @@
+from __future__ import absolute_import
+
+import six
+import zlib
+
+from sentry.utils import json, metrics
+from sentry.utils.imports import import_string
+
+from .base import BaseCache
+
+# Every payload written by this cache starts with one of these markers.
+PLAIN = b"j"
+COMPRESSED = b"z"
+CHUNKED = b"c"
+
+
+class CompressedCache(BaseCache):
+    """
+    Wraps another cache backend and stores values as (optionally compressed)
+    JSON. Payloads of at least ``compress_threshold`` bytes are compressed
+    with zlib, and payloads that are still larger than ``chunk_size`` bytes
+    afterwards are split into several cache keys, which keeps large events
+    below the value size limits of the inner store.
+
+    Meant to be used as the processing cache, e.g.::
+
+        SENTRY_CACHE = "sentry.cache.compressed.CompressedCache"
+        SENTRY_CACHE_OPTIONS = {
+            "backend": "sentry.cache.redis.RbCache",
+            "options": {"cluster": "default"},
+        }
+
+    Values written by the inner backend directly (e.g. before switching to
+    this backend) can still be read.
+    """
+
+    def __init__(
+        self,
+        backend,
+        options=None,
+        compress_threshold=1024,
+        compress_level=3,
+        chunk_size=512 * 1024,
+        **kwargs
+    ):
+        self.inner = import_string(backend)(**(options or {}))
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.chunk_size = chunk_size
+        assert self.chunk_size > 0
+        BaseCache.__init__(self, **kwargs)
+
+    def _make_chunk_key(self, key, index):
+        return u"{}:c:{}".format(key, index)
+
+    def _encode(self, key, value, raw):
+        """
+        Returns the payloads to write for ``value`` as a mapping of inner
+        cache keys to payloads, plus the header of a chunked value (or
+        ``None``) which must only be written once all chunks are in place.
+        """
+        payload = value if raw else json.dumps(value)
+        if isinstance(payload, six.text_type):
+            payload = payload.encode("utf-8")
+
+        size = len(payload)
+        if size >= self.compress_threshold:
+            payload = COMPRESSED + zlib.compress(payload, self.compress_level)
+        else:
+            payload = PLAIN + payload
+
+        metrics.timing("cache.payload.size.raw", size)
+        metrics.timing("cache.payload.size.stored", len(payload))
+        metrics.timing("cache.payload.compression-ratio", float(size) / len(payload))
+
+        if len(payload) <= self.chunk_size:
+            return {key: payload}, None
+
+        chunks = {}
+        for index, offset in enumerate(six.moves.xrange(0, len(payload), self.chunk_size)):
+            chunks[self._make_chunk_key(key, index)] = payload[offset : offset + self.chunk_size]
+        metrics.timing("cache.payload.chunks", len(chunks))
+        return chunks, CHUNKED + json.dumps({"chunks": len(chunks)}).encode("utf-8")
+
+    def _decode(self, payload, raw):
+        if not isinstance(payload, six.binary_type):
+            # written by the inner backend itself
+            return payload
+
+        marker, payload = payload[:1], payload[1:]
+        if marker == COMPRESSED:
+            payload = zlib.decompress(payload)
+        elif marker != PLAIN:
+            # legacy JSON payload written by the inner backend itself
+            payload = marker + payload
+
+        if raw:
+            return payload
+        return json.loads(payload)
+
+    def _is_chunked(self, payload):
+        return isinstance(payload, six.binary_type) and payload[:1] == CHUNKED
+
+    def _get_chunks(self, key, header, version):
+        chunk_count = json.loads(header[1:])["chunks"]
+        chunk_keys = [self._make_chunk_key(key, index) for index in range(chunk_count)]
+        chunks = self.inner.get_many(chunk_keys, version=version, raw=True)
+        if len(chunks) != chunk_count:
+            # some chunks already expired
+            return None
+        return b"".join(chunks[chunk_key] for chunk_key in chunk_keys)
+
+    def set(self, key, value, timeout, version=None, raw=False):
+        self.set_many({key: value}, timeout, version=version, raw=raw)
+
+    def set_many(self, values, timeout, version=None, raw=False):
+        payloads = {}
+        headers = {}
+        for key, value in six.iteritems(values):
+            key_payloads, header = self._encode(key, value, raw)
+            payloads.update(key_payloads)
+            if header is not None:
+                headers[key] = header
+
+        self.inner.set_many(payloads, timeout, version=version, raw=True)
+        if headers:
+            self.inner.set_many(headers, timeout, version=version, raw=True)
+
+    def get(self, key, version=None, raw=False):
+        return self.get_many([key], version=version, raw=raw).get(key)
+
+    def get_many(self, keys, version=None, raw=False):
+        rv = {}
+        for key, payload in six.iteritems(self.inner.get_many(keys, version=version, raw=True)):
+            if self._is_chunked(payload):
+                payload = self._get_chunks(key, payload, version)
+                if payload is None:
+                    continue
+            rv[key] = self._decode(payload, raw)
+        return rv
+
+    def delete(self, key, version=None):
+        payload = self.inner.get(key, version=version, raw=True)
+        if self._is_chunked(payload):
+            for index in range(json.loads(payload[1:])["chunks"]):
+                self.inner.delete(self._make_chunk_key(key, index), version=version)
+        self.inner.delete(key, version=version)
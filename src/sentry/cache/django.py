@@ -14,3 +14,9 @@ class DjangoCache(BaseCache):
 
     def get(self, key, version=None, raw=False):
         return cache.get(key, version=version or self.version)
+
+    def get_many(self, keys, version=None, raw=False):
+        return cache.get_many(keys, version=version or self.version)
+
+    def set_many(self, values, timeout, version=None, raw=False):
+        cache.set_many(values, timeout, version=version or self.version)
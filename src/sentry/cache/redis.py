@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 
+import six
+
 from sentry.utils import json
 from sentry.utils.redis import get_cluster_from_options, redis_clusters
 
@@ -18,15 +20,21 @@ class CommonRedisCache(BaseCache):
         self.client = client
         BaseCache.__init__(self, **options)
 
-    def set(self, key, value, timeout, version=None, raw=False):
-        key = self.make_key(key, version=version)
+    def _dumps(self, key, value, raw):
         v = json.dumps(value) if not raw else value
         if len(v) > self.max_size:
             raise ValueTooLarge("Cache key too large: %r %r" % (key, len(v)))
+        return v
+
+    def _set(self, client, key, v, timeout):
         if timeout:
-            self.client.setex(key, int(timeout), v)
+            client.setex(key, int(timeout), v)
         else:
-            self.client.set(key, v)
+            client.set(key, v)
+
+    def set(self, key, value, timeout, version=None, raw=False):
+        key = self.make_key(key, version=version)
+        self._set(self.client, key, self._dumps(key, value, raw), timeout)
 
     def delete(self, key, version=None):
         key = self.make_key(key, version=version)
@@ -46,6 +54,29 @@ class RbCache(CommonRedisCache):
         client = cluster.get_routing_client()
         CommonRedisCache.__init__(self, client, **options)
 
+    def get_many(self, keys, version=None, raw=False):
+        # The mapping client batches the GETs per host.
+        with self.client.map() as client:
+            results = [(key, client.get(self.make_key(key, version=version))) for key in keys]
+
+        rv = {}
+        for key, result in results:
+            if result.value is not None:
+                rv[key] = json.loads(result.value) if not raw else result.value
+        return rv
+
+    def set_many(self, values, timeout, version=None, raw=False):
+        # Serialize everything up front so a value that is too large doesn't
+        # leave a partially written batch behind.
+        prepared = []
+        for key, value in six.iteritems(values):
+            key = self.make_key(key, version=version)
+            prepared.append((key, self._dumps(key, value, raw)))
+
+        with self.client.map() as client:
+            for key, v in prepared:
+                self._set(client, key, v, timeout)
+
 
 # Confusing legacy name for RbCache.  We don't actually have a pure redis cache
 RedisCache = RbCache
@@ -55,3 +86,20 @@ class RedisClusterCache(CommonRedisCache):
     def __init__(self, cluster_id, **options):
         client = redis_clusters.get(cluster_id)
         CommonRedisCache.__init__(self, client=client, **options)
+
+    def get_many(self, keys, version=None, raw=False):
+        keys = list(keys)
+        results = self.client.mget([self.make_key(key, version=version) for key in keys])
+
+        rv = {}
+        for key, result in zip(keys, results):
+            if result is not None:
+                rv[key] = json.loads(result) if not raw else result
+        return rv
+
+    def set_many(self, values, timeout, version=None, raw=False):
+        with self.client.pipeline(transaction=False) as pipe:
+            for key, value in six.iteritems(values):
+                key = self.make_key(key, version=version)
+                self._set(pipe, key, self._dumps(key, value, raw), timeout)
+            pipe.execute()
@@ -1006,6 +1006,17 @@ CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
 # CACHES backend.
 CACHE_VERSION = 1
 
+# Process local cache in front of the Django cache for environments, releases
+# and their relations to projects and groups, which are upserted for (almost)
+# every event. Entries are kept for at most ``SENTRY_RELATIONS_CACHE_TTL``
+# seconds since deletions in other processes can't invalidate them.
+SENTRY_RELATIONS_CACHE_SIZE = 10000
+SENTRY_RELATIONS_CACHE_TTL = 300
+
+# Number of processed frames (e.g. deobfuscated Java frames) to keep in a
+# process local cache in front of the shared frame cache. Disabled with 0.
+SENTRY_FRAME_CACHE_LOCAL_SIZE = 0
+
 # Digests backend
 SENTRY_DIGESTS = "sentry.digests.backends.dummy.DummyBackend"
 SENTRY_DIGESTS_OPTIONS = {}
@@ -1123,6 +1134,14 @@ SENTRY_SOURCE_FETCH_SOCKET_TIMEOUT = 2
 # Maximum content length for source files before we abort fetching
 SENTRY_SOURCE_FETCH_MAX_SIZE = 40 * 1024 * 1024
 
+# Number of threads used to fetch the source files (and sourcemaps) of an
+# event concurrently. With 1 they are fetched one after another.
+SENTRY_SOURCE_FETCH_CONCURRENCY = 8
+
+# Maximum total size (in estimated bytes of memory) of the parsed sourcemaps
+# every worker keeps around across events.
+SENTRY_SOURCEMAP_CACHE_SIZE = 100 * 1024 * 1024
+
 # Fields which managed users cannot change via Sentry UI. Username and password
 # cannot be changed by managed users. Optionally include 'email' and
 # 'name' in SENTRY_MANAGED_USER_FIELDS.
@@ -139,9 +139,10 @@ class NodeData(collections.MutableMapping):
             self.data["_ref"] = ref
             self.data["_ref_version"] = self.field.ref_version
 
-    def save(self):
+    def get_write_data(self):
         """
-        Write current data back to nodestore.
+        Returns the data to write to nodestore, or ``None`` if there is
+        nothing to write.
         """
 
         # We never loaded any data for reading or writing, so there
@@ -155,6 +156,16 @@ class NodeData(collections.MutableMapping):
         if isinstance(to_write, CANONICAL_TYPES):
             to_write = dict(to_write.items())
 
+        return to_write
+
+    def save(self):
+        """
+        Write current data back to nodestore.
+        """
+        to_write = self.get_write_data()
+        if to_write is None:
+            return
+
         nodestore.set(self.id, to_write)
 
 
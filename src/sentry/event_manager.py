@@ -15,7 +15,7 @@ from django.db.models import Func
 from django.utils import timezone
 from django.utils.encoding import force_text
 
-from sentry import buffer, eventtypes, eventstream, tsdb
+from sentry import buffer, eventtypes, eventstream, nodestore, tsdb
 from sentry.constants import (
     DEFAULT_STORE_NORMALIZER_ARGS,
     LOG_LEVELS,
@@ -212,6 +212,70 @@ def add_meta_errors(errors, meta):
             errors.append(error)
 
 
+class EventBatch(object):
+    """
+    Collects the nodestore writes and eventstream inserts of the events saved
+    with ``EventManager.save(..., batch=batch)``, so that these can be sent
+    for all events at once with ``flush``.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.inserts = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add(self, node, **insert_kwargs):
+        self.nodes.append(node)
+        self.inserts.append(insert_kwargs)
+
+    def flush(self):
+        """
+        Writes all collected nodes and publishes the events whose node could
+        be written. Failures only affect the event they occur for.
+
+        Returns the positions, in the order they were added, of the events
+        that could not be written to nodestore or published.
+        """
+        nodes, self.nodes = self.nodes, []
+        inserts, self.inserts = self.inserts, []
+
+        values = {}
+        for node in nodes:
+            data = node.get_write_data()
+            if data is not None:
+                values[node.id] = data
+
+        try:
+            nodestore.set_multi(values)
+            saved = [True] * len(nodes)
+        except Exception:
+            logger.exception("event-batch.nodestore-failed")
+            saved = []
+            for node in nodes:
+                try:
+                    node.save()
+                except Exception:
+                    logger.exception("event-batch.nodestore-failed")
+                    saved.append(False)
+                else:
+                    saved.append(True)
+
+        failed = []
+        for index, (was_saved, insert_kwargs) in enumerate(zip(saved, inserts)):
+            if not was_saved:
+                failed.append(index)
+                continue
+            try:
+                eventstream.insert(**insert_kwargs)
+            except Exception:
+                logger.exception("event-batch.eventstream-failed")
+                failed.append(index)
+
+        return failed
+
+
 def _decode_event(data, content_encoding):
     if isinstance(data, six.binary_type):
         if content_encoding == "gzip":
@@ -455,8 +519,12 @@ class EventManager(object):
 
         return trim(message.strip(), settings.SENTRY_MAX_MESSAGE_LENGTH)
 
-    def save(self, project_id, raw=False, assume_normalized=False):
+    def save(self, project_id, raw=False, assume_normalized=False, batch=None):
         """
+        When an ``EventBatch`` is passed as ``batch``, the event is not
+        written to nodestore and not published to the eventstream until the
+        batch is flushed.
+
         We re-insert events with duplicate IDs into Snuba, which is responsible
         for deduplicating events. Since deduplication in Snuba is on the primary
         key (based on event ID, project ID and day), events with same IDs are only
@@ -714,7 +782,8 @@ class EventManager(object):
             )
 
         # Write the event to Nodestore
-        event.data.save()
+        if batch is None:
+            event.data.save()
 
         if event_user:
             counters = [
@@ -751,7 +820,7 @@ class EventManager(object):
                 project.update(first_event=date)
                 first_event_received.send_robust(project=project, event=event, sender=Project)
 
-        eventstream.insert(
+        insert_kwargs = dict(
             group=group,
             event=event,
             is_new=is_new,
@@ -765,6 +834,10 @@ class EventManager(object):
             # about post processing and handling the commit.
             skip_consume=raw,
         )
+        if batch is None:
+            eventstream.insert(**insert_kwargs)
+        else:
+            batch.add(event.data, **insert_kwargs)
 
         metric_tags = {"from_relay": "_relay_processed" in self._data}
 
@@ -823,9 +896,15 @@ class EventManager(object):
         return euser
 
     def _find_hashes(self, project, hash_list):
-        return map(
-            lambda hash: GroupHash.objects.get_or_create(project=project, hash=hash)[0], hash_list
-        )
+        return GroupHash.objects.get_or_create_many(project, hash_list)
+
+    def _find_existing_group(self, all_hashes):
+        for h in all_hashes:
+            if h.group_id is not None:
+                return Group.objects.get(id=h.group_id)
+            if h.group_tombstone_id is not None:
+                raise HashDiscarded("Matches group tombstone %s" % h.group_tombstone_id)
+        return None
 
     def _save_aggregate(self, event, hashes, release, **kwargs):
         project = event.project
@@ -833,18 +912,19 @@ class EventManager(object):
         # attempt to find a matching hash
         all_hashes = self._find_hashes(project, hashes)
 
-        existing_group_id = None
-        for h in all_hashes:
-            if h.group_id is not None:
-                existing_group_id = h.group_id
-                break
-            if h.group_tombstone_id is not None:
-                raise HashDiscarded("Matches group tombstone %s" % h.group_tombstone_id)
+        try:
+            existing_group = self._find_existing_group(all_hashes)
+        except Group.DoesNotExist:
+            # The cached hashes still point at a group that has been deleted
+            # since, look them up again.
+            GroupHash.objects.invalidate_cache(project.id)
+            all_hashes = self._find_hashes(project, hashes)
+            existing_group = self._find_existing_group(all_hashes)
 
         # XXX(dcramer): this has the opportunity to create duplicate groups
         # it should be resolved by the hash merging function later but this
         # should be better tested/reviewed
-        if existing_group_id is None:
+        if existing_group is None:
             # it's possible the release was deleted between
             # when we queried for the release and now, so
             # make sure it still exists
@@ -871,7 +951,7 @@ class EventManager(object):
             )
 
         else:
-            group = Group.objects.get(id=existing_group_id)
+            group = existing_group
 
             group_is_new = False
 
@@ -15,6 +15,7 @@ from sentry.grouping.variants import (
 from sentry.grouping.enhancer import Enhancements, InvalidEnhancerConfig, ENHANCEMENT_BASES
 from sentry.grouping.utils import (
     DEFAULT_FINGERPRINT_VALUES,
+    config_cache,
     hash_from_values,
     resolve_fingerprint_values,
 )
@@ -61,15 +62,19 @@ def _get_project_enhancements_config(project):
     cache_key = (
         "grouping-enhancements:" + md5_text("%s|%s" % (enhancements_base, enhancements)).hexdigest()
     )
-    rv = cache.get(cache_key)
+    rv = config_cache.get(cache_key)
     if rv is not None:
         return rv
 
-    try:
-        rv = Enhancements.from_config_string(enhancements, bases=[enhancements_base]).dumps()
-    except InvalidEnhancerConfig:
-        rv = get_default_enhancements()
-    cache.set(cache_key, rv)
+    rv = cache.get(cache_key)
+    if rv is None:
+        try:
+            rv = Enhancements.from_config_string(enhancements, bases=[enhancements_base]).dumps()
+        except InvalidEnhancerConfig:
+            rv = get_default_enhancements()
+        cache.set(cache_key, rv)
+
+    config_cache.set(cache_key, rv)
     return rv
 
 
@@ -116,15 +121,21 @@ def get_fingerprinting_config_for_project(project):
     from sentry.utils.hashlib import md5_text
 
     cache_key = "fingerprinting-rules:" + md5_text(rules).hexdigest()
+    rv = config_cache.get(cache_key)
+    if rv is not None:
+        return rv
+
     rv = cache.get(cache_key)
     if rv is not None:
-        return FingerprintingRules.from_json(rv)
+        rv = FingerprintingRules.from_json(rv)
+    else:
+        try:
+            rv = FingerprintingRules.from_config_string(rules)
+        except InvalidFingerprintingConfig:
+            rv = FingerprintingRules([])
+        cache.set(cache_key, rv.to_json())
 
-    try:
-        rv = FingerprintingRules.from_config_string(rules)
-    except InvalidFingerprintingConfig:
-        rv = FingerprintingRules([])
-    cache.set(cache_key, rv.to_json())
+    config_cache.set(cache_key, rv)
     return rv
 
 
@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import os
+import re
 import six
 import base64
 import msgpack
@@ -14,8 +15,9 @@ from sentry import projectoptions
 from sentry.stacktraces.functions import set_in_app
 from sentry.stacktraces.platform import get_behavior_family_for_platform
 from sentry.grouping.component import GroupingComponent
-from sentry.grouping.utils import get_rule_bool
+from sentry.grouping.utils import config_cache, get_rule_bool
 from sentry.utils.compat import implements_to_string
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.glob import glob_match
 from sentry.utils.safe import get_path
 
@@ -86,11 +88,39 @@ ACTION_FLAGS = {
 }
 REVERSE_ACTION_FLAGS = dict((v, k) for k, v in six.iteritems(ACTION_FLAGS))
 
+# The number of distinct frames for which the matching rules are remembered
+# per compiled set of rules.
+MATCH_CACHE_SIZE = 5000
+
+_glob_special_re = re.compile(r"[*?\[\]{}\\]")
+
 
 class InvalidEnhancerConfig(Exception):
     pass
 
 
+def _get_frame_match_value(key, frame_data, platform):
+    """Returns the value of the frame that matchers of the given key are
+    matched against.
+    """
+    if key == "path":
+        return frame_data.get("abs_path") or frame_data.get("filename") or ""
+    if key == "package":
+        return frame_data.get("package") or ""
+    if key == "family":
+        return get_behavior_family_for_platform(frame_data.get("platform") or platform)
+    if key == "app":
+        return frame_data.get("in_app")
+    if key == "function":
+        from sentry.stacktraces.functions import get_function_name_for_frame
+
+        return get_function_name_for_frame(frame_data, platform) or "<unknown>"
+    if key == "module":
+        return frame_data.get("module") or "<unknown>"
+    # should not happen :)
+    return "<unknown>"
+
+
 class Match(object):
     def __init__(self, key, pattern):
         self.key = key
@@ -104,12 +134,14 @@ class Match(object):
         )
 
     def matches_frame(self, frame_data, platform):
+        return self.matches_value(_get_frame_match_value(self.key, frame_data, platform))
+
+    def matches_value(self, value):
+        """Matches the value of the frame attribute selected by the key (see
+        `_get_frame_match_value`) against the pattern.
+        """
         # Path matches are always case insensitive
         if self.key in ("path", "package"):
-            if self.key == "package":
-                value = frame_data.get("package") or ""
-            else:
-                value = frame_data.get("abs_path") or frame_data.get("filename") or ""
             if glob_match(
                 value, self.pattern, ignorecase=True, doublestar=True, path_normalize=True
             ):
@@ -123,28 +155,38 @@ class Match(object):
         # families need custom handling as well
         if self.key == "family":
             flags = self.pattern.split(",")
-            if "all" in flags:
-                return True
-            family = get_behavior_family_for_platform(frame_data.get("platform") or platform)
-            return family in flags
+            return "all" in flags or value in flags
 
         # in-app matching is just a bool
         if self.key == "app":
             ref_val = get_rule_bool(self.pattern)
-            return ref_val is not None and ref_val == frame_data.get("in_app")
+            return ref_val is not None and ref_val == value
 
         # all other matches are case sensitive
-        if self.key == "function":
-            from sentry.stacktraces.functions import get_function_name_for_frame
-
-            value = get_function_name_for_frame(frame_data, platform) or "<unknown>"
-        elif self.key == "module":
-            value = frame_data.get("module") or "<unknown>"
-        else:
-            # should not happen :)
-            value = "<unknown>"
         return glob_match(value, self.pattern)
 
+    def compile(self):
+        """Returns a function that is equivalent to `matches_value` but
+        avoids the glob matching where the pattern allows it.
+        """
+        if self.key == "family":
+            flags = frozenset(self.pattern.split(","))
+            if "all" in flags:
+                return lambda value: True
+            return lambda value: value in flags
+
+        if self.key == "app":
+            ref_val = get_rule_bool(self.pattern)
+            return lambda value: ref_val is not None and ref_val == value
+
+        # Case sensitive patterns without any glob syntax are plain
+        # comparisons.
+        if self.key in ("function", "module") and not _glob_special_re.search(self.pattern):
+            pattern = self.pattern
+            return lambda value: value == pattern
+
+        return self.matches_value
+
     def _to_config_structure(self):
         if self.key == "family":
             arg = "".join(filter(None, [FAMILIES.get(x) for x in self.pattern.split(",")]))
@@ -290,7 +332,88 @@ class StacktraceState(object):
         return "%s by grouping enhancement rule (%s)" % (hint, description)
 
 
+class CompiledRules(object):
+    """The rules of an `Enhancements` object prepared for matching a lot of
+    frames.
+
+    Identical matchers of different rules are only evaluated once, and the
+    indices of the rules matching a frame are remembered by the values of
+    the frame the matchers look at, so that frames which look the same (within
+    a stacktrace or across events) are only classified once.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.keys = sorted(set(m.key for rule in rules for m in rule.matchers))
+        key_indices = dict((key, idx) for idx, key in enumerate(self.keys))
+
+        matcher_indices = {}
+        self.matchers = []
+        self.rule_matchers = []
+        for rule in rules:
+            indices = []
+            for m in rule.matchers:
+                idx = matcher_indices.get((m.key, m.pattern))
+                if idx is None:
+                    idx = matcher_indices[m.key, m.pattern] = len(self.matchers)
+                    self.matchers.append((key_indices[m.key], m.compile()))
+                indices.append(idx)
+            self.rule_matchers.append(indices)
+
+        self.cache = LRUCache(MATCH_CACHE_SIZE)
+
+    def get_frame_values(self, frame_data, platform):
+        return tuple(_get_frame_match_value(key, frame_data, platform) for key in self.keys)
+
+    def get_matching_rules(self, values):
+        """Returns the set of indices of the rules matching a frame with the
+        given values (see `get_frame_values`).
+        """
+        rv = self.cache.get(values)
+        if rv is not None:
+            return rv
+
+        results = [None] * len(self.matchers)
+        matching = []
+        for rule_idx, indices in enumerate(self.rule_matchers):
+            if not indices:
+                continue
+            for idx in indices:
+                result = results[idx]
+                if result is None:
+                    key_idx, matches = self.matchers[idx]
+                    result = results[idx] = bool(matches(values[key_idx]))
+                if not result:
+                    break
+            else:
+                matching.append(rule_idx)
+
+        rv = frozenset(matching)
+        self.cache.set(values, rv)
+        return rv
+
+    def iter_matching_frames(self, frames, platform):
+        """Yields ``(rule, idx)`` for all the frames every rule matches, in
+        rule order.  Frames are looked at again when their in-app flag was
+        changed in the meantime (by the action of an earlier rule), which
+        gives the same results as matching every rule against every frame.
+        """
+        frame_matches = [None] * len(frames)
+        for rule_idx, rule in enumerate(self.rules):
+            for idx, frame in enumerate(frames):
+                in_app = frame.get("in_app")
+                cached = frame_matches[idx]
+                if cached is None or cached[0] != in_app:
+                    values = self.get_frame_values(frame, platform)
+                    cached = frame_matches[idx] = (in_app, self.get_matching_rules(values))
+                if rule_idx in cached[1]:
+                    yield rule, idx
+
+
 class Enhancements(object):
+    # compiled on first use, see `_get_compiled_rules`
+    _compiled_rules = None
+
     def __init__(self, rules, changelog=None, version=None, bases=None, id=None):
         self.id = id
         self.rules = rules
@@ -306,22 +429,19 @@ class Enhancements(object):
         """This applies the frame modifications to the frames itself.  This
         does not affect grouping.
         """
-        for rule in self.iter_rules():
-            for idx, frame in enumerate(frames):
-                actions = rule.get_matching_frame_actions(frame, platform)
-                for action in actions or ():
-                    action.apply_modifications_to_frame(frames, idx)
+        for rule, idx in self._get_compiled_rules().iter_matching_frames(frames, platform):
+            for action in rule.actions:
+                action.apply_modifications_to_frame(frames, idx)
 
     def update_frame_components_contributions(self, components, frames, platform):
         stacktrace_state = StacktraceState()
 
         # Apply direct frame actions and update the stack state alongside
-        for rule in self.iter_rules():
-            for idx, (component, frame) in enumerate(izip(components, frames)):
-                actions = rule.get_matching_frame_actions(frame, platform)
-                for action in actions or ():
-                    action.update_frame_components_contributions(components, frames, idx, rule=rule)
-                    action.modify_stacktrace_state(stacktrace_state, rule)
+        compiled_rules = self._get_compiled_rules()
+        for rule, idx in compiled_rules.iter_matching_frames(frames[: len(components)], platform):
+            for action in rule.actions:
+                action.update_frame_components_contributions(components, frames, idx, rule=rule)
+                action.modify_stacktrace_state(stacktrace_state, rule)
 
         # Use the stack state to update frame contributions again to trim
         # down to max-frames.  min-frames is handled on the other hand for
@@ -392,6 +512,11 @@ class Enhancements(object):
             msgpack.dumps(self._to_config_structure()).encode("zlib")
         ).strip("=")
 
+    def _get_compiled_rules(self):
+        if self._compiled_rules is None:
+            self._compiled_rules = CompiledRules(list(self.iter_rules()))
+        return self._compiled_rules
+
     def iter_rules(self):
         for base in self.bases:
             base = ENHANCEMENT_BASES.get(base)
@@ -412,16 +537,28 @@ class Enhancements(object):
 
     @classmethod
     def loads(cls, data):
+        """Loads enhancements from the format returned by `dumps`.  The
+        result is cached in process and must not be modified.
+        """
         if six.PY2 and isinstance(data, six.text_type):
             data = data.encode("ascii", "ignore")
+
+        cache_key = ("enhancements", data)
+        rv = config_cache.get(cache_key)
+        if rv is not None:
+            return rv
+
         padded = data + b"=" * (4 - (len(data) % 4))
         try:
-            return cls._from_config_structure(
+            rv = cls._from_config_structure(
                 msgpack.loads(base64.urlsafe_b64decode(padded).decode("zlib"))
             )
         except (LookupError, AttributeError, TypeError, ValueError) as e:
             raise ValueError("invalid grouping enhancement config: %s" % e)
 
+        config_cache.set(cache_key, rv)
+        return rv
+
     @classmethod
     def from_config_string(self, s, bases=None, id=None):
         try:
@@ -585,3 +722,15 @@ def _load_configs():
 
 ENHANCEMENT_BASES = _load_configs()
 del _load_configs
+
+
+def _prime_config_cache():
+    # Projects without custom rules use the plain bases, which this way never
+    # have to be decoded.
+    for base in ENHANCEMENT_BASES:
+        enhancements = Enhancements(rules=[], bases=[base])
+        config_cache.set(("enhancements", enhancements.dumps()), enhancements)
+
+
+_prime_config_cache()
+del _prime_config_cache
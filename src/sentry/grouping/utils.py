@@ -4,6 +4,7 @@ from hashlib import md5
 
 from django.utils.encoding import force_bytes
 
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.safe import get_path
 from sentry.stacktraces.processing import get_crash_frame_from_event_data
 
@@ -15,6 +16,13 @@ FUNCTION_FINGERPRINT_VALUES = frozenset(["{{ function }}", "{{function}}"])
 MODULE_FINGERPRINT_VALUES = frozenset(["{{ module }}", "{{module}}"])
 PACKAGE_FINGERPRINT_VALUES = frozenset(["{{ package }}", "{{package}}"])
 
+# Parsed grouping configs (enhancements and fingerprinting rules) are needed
+# for every event, so they are kept around in process.  All keys are derived
+# from the configuration itself, which means that changing the project options
+# simply results in a different key.
+CONFIG_CACHE_SIZE = 1000
+config_cache = LRUCache(CONFIG_CACHE_SIZE)
+
 
 def hash_from_values(values):
     result = md5()
@@ -2,18 +2,27 @@ from __future__ import absolute_import
 
 import logging
 import msgpack
+import multiprocessing
+import signal
+import six
+import time
+
+from collections import defaultdict
 
 from sentry.utils.batching_kafka_consumer import AbstractBatchWorker
 
+from django import db
 from django.conf import settings
 from django.core.cache import cache
 
+from sentry import options
 from sentry.cache import default_cache
 from sentry.models import Project
 from sentry.signals import event_accepted
-from sentry.tasks.store import preprocess_event
-from sentry.utils import json
+from sentry.tasks.store import preprocess_event, save_events_inline, should_process
+from sentry.utils import json, metrics
 from sentry.utils.cache import cache_key_for_event
+from sentry.utils.canonical import CanonicalKeyDict
 from sentry.utils.kafka import create_batching_kafka_consumer
 
 logger = logging.getLogger(__name__)
@@ -40,78 +49,262 @@ class ConsumerType(object):
 
 
 class IngestConsumerWorker(AbstractBatchWorker):
+    def __init__(self, allow_inline_save=True):
+        # Whether events that need no processing may be saved directly in the
+        # consumer (see the ``store.ingest-consumer-save-inline`` option).
+        # Attachments are passed to ``save_event`` through the processing
+        # cache, so this must be off for consumers of events with attachments.
+        self.allow_inline_save = allow_inline_save
+
     def process_message(self, message):
+        # Only decode here, everything that talks to the network is done for
+        # the whole batch in ``flush_batch``.
         message = msgpack.unpackb(message.value(), use_list=False)
-        payload = message["payload"]
-        start_time = float(message["start_time"])
-        event_id = message["event_id"]
-        project_id = message["project_id"]
-        remote_addr = message.get("remote_addr")
-
-        # check that we haven't already processed this event (a previous instance of the forwarder
-        # died before it could commit the event queue offset)
-        deduplication_key = "ev:{}:{}".format(project_id, event_id)
-        if cache.get(deduplication_key) is not None:
-            logger.warning(
-                "pre-process-forwarder detected a duplicated event" " with id:%s for project:%s.",
-                event_id,
-                project_id,
-            )
-            return True  # message already processed do not reprocess
-
-        try:
-            project = Project.objects.get_from_cache(id=project_id)
-        except Project.DoesNotExist:
-            logger.error("Project for ingested event does not exist: %s", project_id)
-            return True
 
         # Parse the JSON payload. This is required to compute the cache key and
         # call process_event. The payload will be put into Kafka raw, to avoid
         # serializing it again.
         # XXX: Do not use CanonicalKeyDict here. This may break preprocess_event
         # which assumes that data passed in is a raw dictionary.
-        data = json.loads(payload)
+        return {
+            "data": json.loads(message["payload"]),
+            "start_time": float(message["start_time"]),
+            "event_id": message["event_id"],
+            "project_id": message["project_id"],
+            "remote_addr": message.get("remote_addr"),
+        }
+
+    def flush_batch(self, batch):
+        with metrics.timer("ingest_consumer.flush_batch"):
+            self._flush_batch(batch)
+
+    def _flush_batch(self, batch):
+        # check that we haven't already processed these events (a previous instance of the
+        # forwarder died before it could commit the event queue offset)
+        events = {}
+        for event in batch:
+            deduplication_key = "ev:{}:{}".format(event["project_id"], event["event_id"])
+            events.setdefault(deduplication_key, event)
+
+        for deduplication_key in cache.get_many(list(events)):
+            event = events.pop(deduplication_key)
+            logger.warning(
+                "pre-process-forwarder detected a duplicated event" " with id:%s for project:%s.",
+                event["event_id"],
+                event["project_id"],
+            )
+
+        if not events:
+            return
+
+        projects = {
+            project.id: project
+            for project in Project.objects.get_many_from_cache(
+                set(event["project_id"] for event in six.itervalues(events))
+            )
+        }
+
+        save_inline = self.allow_inline_save and options.get("store.ingest-consumer-save-inline")
 
         cache_timeout = 3600
-        cache_key = cache_key_for_event(data)
-        default_cache.set(cache_key, data, cache_timeout)
+        to_process = []
+        to_save = []
+        for deduplication_key, event in six.iteritems(events):
+            project = projects.get(event["project_id"])
+            if project is None:
+                logger.error("Project for ingested event does not exist: %s", event["project_id"])
+                continue
+            if save_inline and not should_process(CanonicalKeyDict(event["data"])):
+                to_save.append((deduplication_key, project, event))
+            else:
+                to_process.append(
+                    (deduplication_key, cache_key_for_event(event["data"]), project, event)
+                )
 
-        # Preprocess this event, which spawns either process_event or
-        # save_event. Pass data explicitly to avoid fetching it again from the
+        # Only events that still need a task hop go through the processing
         # cache.
-        preprocess_event(
-            cache_key=cache_key,
-            data=data,
-            start_time=start_time,
-            event_id=event_id,
-            project=project,
-        )
+        if to_process:
+            default_cache.set_many(
+                {cache_key: event["data"] for _, cache_key, _, event in to_process}, cache_timeout
+            )
+
+        metrics.timing("ingest_consumer.batch_size", len(batch))
+        metrics.timing("ingest_consumer.batch_projects", len(projects))
+        metrics.timing("ingest_consumer.batch_saved_inline", len(to_save))
 
-        # remember for an 1 hour that we saved this event (deduplication protection)
-        cache.set(deduplication_key, "", 3600)
+        processed = []
+        try:
+            for deduplication_key, cache_key, project, event in to_process:
+                data = event["data"]
+
+                # Preprocess this event, which spawns either process_event or
+                # save_event. Pass data explicitly to avoid fetching it again from the
+                # cache.
+                preprocess_event(
+                    cache_key=cache_key,
+                    data=data,
+                    start_time=event["start_time"],
+                    event_id=event["event_id"],
+                    project=project,
+                )
+                processed.append(deduplication_key)
+
+                # emit event_accepted once everything is done
+                event_accepted.send_robust(
+                    ip=event["remote_addr"], data=data, project=project, sender=self.process_message
+                )
+
+            for deduplication_key, project, event in to_save:
+                # emit event_accepted before saving, since saving mutates the data
+                event_accepted.send_robust(
+                    ip=event["remote_addr"],
+                    data=event["data"],
+                    project=project,
+                    sender=self.process_message,
+                )
 
-        # emit event_accepted once everything is done
-        event_accepted.send_robust(
-            ip=remote_addr, data=data, project=project, sender=self.process_message
+            if to_save:
+                failed = save_events_inline(
+                    [
+                        {
+                            "data": event["data"],
+                            "start_time": event["start_time"],
+                            "event_id": event["event_id"],
+                        }
+                        for _, _, event in to_save
+                    ]
+                )
+                failed_event_ids = set(item["event_id"] for item in failed)
+                if failed_event_ids:
+                    metrics.incr(
+                        "ingest_consumer.save_inline_failed",
+                        amount=len(failed_event_ids),
+                        skip_internal=False,
+                    )
+
+                for deduplication_key, project, event in to_save:
+                    if event["event_id"] in failed_event_ids:
+                        # Hand events that could not be saved inline to the
+                        # store tasks, which retry them.
+                        cache_key = cache_key_for_event(event["data"])
+                        default_cache.set(cache_key, event["data"], cache_timeout)
+                        preprocess_event(
+                            cache_key=cache_key,
+                            data=event["data"],
+                            start_time=event["start_time"],
+                            event_id=event["event_id"],
+                            project=project,
+                        )
+                    processed.append(deduplication_key)
+        finally:
+            # remember for an 1 hour that we saved these events (deduplication protection)
+            if processed:
+                cache.set_many(dict.fromkeys(processed, ""), 3600)
+
+    def shutdown(self):
+        pass
+
+
+class _RawMessage(object):
+    """
+    Stand-in for a Kafka message that only carries its value, which is all
+    ``IngestConsumerWorker.process_message`` looks at.
+    """
+
+    __slots__ = ("_value",)
+
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+
+# The worker used by each process of a ``MultiprocessIngestConsumerWorker``
+# pool, created once per process by ``_init_pool_process``.
+_pool_worker = None
+
+
+def _init_pool_process(allow_inline_save):
+    global _pool_worker
+
+    # Shutdown is coordinated by the parent process, which waits for the
+    # batch in flight before closing the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    _pool_worker = IngestConsumerWorker(allow_inline_save=allow_inline_save)
+
+
+def _process_partition_batch(partition, messages):
+    start = time.time()
+    batch = [_pool_worker.process_message(_RawMessage(value)) for value in messages]
+    _pool_worker.flush_batch(batch)
+    end = time.time()
+    lag = max(end - event["start_time"] for event in batch) if batch else 0
+    return partition, len(batch), end - start, lag
+
+
+class MultiprocessIngestConsumerWorker(AbstractBatchWorker):
+    """
+    Hands the messages of each batch to a pool of worker processes, one task
+    per partition so that messages of a partition are still processed in
+    order. ``flush_batch`` only returns once every partition of the batch
+    has been processed, which means offsets are only committed for work that
+    has been done.
+    """
+
+    # upper bound for a single batch, after which the consumer gives up
+    # (without committing) instead of waiting on a lost worker forever
+    batch_timeout = 5 * 60
+
+    def __init__(self, processes, allow_inline_save=True):
+        # Don't let the pool inherit open database connections.
+        db.connections.close_all()
+        self.processes = processes
+        self.pool = multiprocessing.Pool(
+            processes, initializer=_init_pool_process, initargs=(allow_inline_save,)
         )
 
-        # Return *something* so that it counts against batch size
-        return True
+    def process_message(self, message):
+        return message.partition(), message.value()
 
     def flush_batch(self, batch):
-        pass
+        partitions = defaultdict(list)
+        for partition, value in batch:
+            partitions[partition].append(value)
+
+        with metrics.timer("ingest_consumer.flush_batch", tags={"mode": "multiprocess"}):
+            results = [
+                self.pool.apply_async(_process_partition_batch, (partition, values))
+                for partition, values in six.iteritems(partitions)
+            ]
+            for result in results:
+                partition, count, duration, lag = result.get(self.batch_timeout)
+                tags = {"partition": partition}
+                metrics.timing("ingest_consumer.worker.batch_size", count, tags=tags)
+                metrics.timing("ingest_consumer.worker.duration", duration, tags=tags)
+                metrics.timing("ingest_consumer.worker.lag", lag, tags=tags)
 
     def shutdown(self):
-        pass
+        self.pool.close()
+        self.pool.join()
 
 
-def get_ingest_consumer(consumer_type, once=False, **options):
+def get_ingest_consumer(consumer_type, once=False, processes=1, **options):
     """
     Handles events coming via a kafka queue.
 
     The events should have already been processed (normalized... ) upstream (by Relay).
+
+    With more than one process, messages are polled in this process and
+    processed by a pool of ``processes`` worker processes.
     """
     topic_name = ConsumerType.get_topic_name(consumer_type)
-    return create_batching_kafka_consumer(
-        topic_name=topic_name, worker=IngestConsumerWorker(), **options
-    )
+    allow_inline_save = consumer_type != ConsumerType.Attachments
+    if processes > 1:
+        worker = MultiprocessIngestConsumerWorker(
+            processes=processes, allow_inline_save=allow_inline_save
+        )
+    else:
+        worker = IngestConsumerWorker(allow_inline_save=allow_inline_save)
+    return create_batching_kafka_consumer(topic_name=topic_name, worker=worker, **options)
@@ -1,10 +1,13 @@
 from __future__ import absolute_import, print_function
 
+from hashlib import sha1
 from six import text_type
 from symbolic import SourceView
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.strings import codec_lookup
 
-__all__ = ["SourceCache", "SourceMapCache"]
+__all__ = ["SourceCache", "SourceMapCache", "ParsedSourceMapCache"]
 
 
 def is_utf8(codec):
@@ -84,3 +87,50 @@ class SourceMapCache(object):
             sourcemap = self.get(sourcemap_url)
             return (sourcemap_url, sourcemap)
         return (None, None)
+
+
+# Rough number of bytes a parsed sourcemap keeps in memory for every token
+# (its generated and original position, source and name).
+SOURCEMAP_TOKEN_SIZE = 24
+
+
+def estimate_sourcemap_size(body, view):
+    """
+    Estimates the memory used by the parsed sourcemap ``view``. Besides the
+    index of its tokens, the view holds on to most of the raw sourcemap
+    ``body`` (the names, source names and embedded sources).
+    """
+    return len(body) + len(view) * SOURCEMAP_TOKEN_SIZE
+
+
+class ParsedSourceMapCache(object):
+    """
+    A process wide cache of parsed sourcemaps, so that a worker processing
+    many events of the same release parses every sourcemap only once.
+
+    Entries are keyed by the checksum of the raw sourcemap (in addition to
+    the release, dist and url it was fetched for) and weighed by
+    ``estimate_sourcemap_size``, which the total size is bounded by.
+    """
+
+    def __init__(self, maxsize):
+        self._cache = LRUCache(maxsize, getsize=lambda value: value[1])
+
+    def get_or_parse(self, key, body, parse):
+        key = key + (sha1(body).hexdigest(),)
+        rv = self._cache.get(key)
+        if rv is not None:
+            metrics.incr("sourcemaps.parsed_cache", tags={"result": "hit"}, skip_internal=True)
+            return rv[0]
+
+        metrics.incr("sourcemaps.parsed_cache", tags={"result": "miss"}, skip_internal=True)
+        view = parse(body)
+
+        evicted = self._cache.set(key, (view, estimate_sourcemap_size(body, view)))
+        if evicted > 0:
+            metrics.incr("sourcemaps.parsed_cache.evicted", amount=evicted, skip_internal=True)
+        metrics.timing("sourcemaps.parsed_cache.size", self._cache.size)
+        return view
+
+    def clear(self):
+        self._cache.clear()
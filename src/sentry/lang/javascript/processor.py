@@ -6,10 +6,15 @@ import logging
 import re
 import sys
 import base64
+import functools
 import six
+import threading
 import zlib
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.db import close_old_connections
 from os.path import splitext
 from requests.utils import get_encoding_from_headers
 from six.moves.urllib.parse import urlsplit
@@ -36,7 +41,7 @@ from sentry.utils import metrics
 from sentry.utils.urls import non_standard_url_join
 from sentry.stacktraces.processing import StacktraceProcessor
 
-from .cache import SourceCache, SourceMapCache
+from .cache import ParsedSourceMapCache, SourceCache, SourceMapCache
 
 # number of surrounding lines (on each side) to fetch
 LINES_OF_CONTEXT = 5
@@ -69,6 +74,11 @@ MAX_RESOURCE_FETCHES = 100
 
 logger = logging.getLogger(__name__)
 
+_fetch_pool = None
+_fetch_pool_lock = threading.Lock()
+
+parsed_sourcemaps = ParsedSourceMapCache(settings.SENTRY_SOURCEMAP_CACHE_SIZE)
+
 
 class UnparseableSourcemap(http.BadSource):
     error_type = EventError.JS_INVALID_SOURCEMAP
@@ -217,11 +227,19 @@ def fetch_release_file(filename, release, dist=None):
             "Checking database for release artifact %r (release_id=%s)", filename, release.id
         )
 
-        possible_files = list(
-            ReleaseFile.objects.filter(
-                release=release, dist=dist, ident__in=filename_idents
-            ).select_related("file")
-        )
+        manifest = ReleaseFile.objects.get_manifest(release, dist)
+        if manifest is None:
+            possible_files = list(
+                ReleaseFile.objects.filter(
+                    release=release, dist=dist, ident__in=filename_idents
+                ).select_related("file")
+            )
+        else:
+            # Only the first file (in priority order) known to exist is loaded.
+            ids = [manifest[ident] for ident in filename_idents if ident in manifest][:1]
+            possible_files = (
+                list(ReleaseFile.objects.filter(id__in=ids).select_related("file")) if ids else []
+            )
 
         if len(possible_files) == 0:
             logger.debug(
@@ -397,19 +415,49 @@ def fetch_sourcemap(url, project=None, release=None, dist=None, allow_scraping=T
             )
         except TypeError as e:
             raise UnparseableSourcemap({"url": "<base64>", "reason": e.message})
+        cache_key = (None, None, None)
     else:
         result = fetch_file(
             url, project=project, release=release, dist=dist, allow_scraping=allow_scraping
         )
         body = result.body
+        cache_key = (release and release.id, dist and dist.name, url)
     try:
-        return SourceMapView.from_json_bytes(body)
+        return parsed_sourcemaps.get_or_parse(cache_key, body, SourceMapView.from_json_bytes)
     except Exception as exc:
         # This is in debug because the product shows an error already.
         logger.debug(six.text_type(exc), exc_info=True)
         raise UnparseableSourcemap({"url": http.expose_url(url)})
 
 
+def _call_in_pool(func, item):
+    # Every pool thread has its own database connection, which is neither
+    # closed nor recycled by anything else.
+    close_old_connections()
+    try:
+        return func(item)
+    finally:
+        close_old_connections()
+
+
+def fetch_concurrently(func, items):
+    """
+    Calls ``func`` for every item on a shared thread pool (sized by
+    ``SENTRY_SOURCE_FETCH_CONCURRENCY``) and returns the results in order.
+    """
+    global _fetch_pool
+
+    items = list(items)
+    concurrency = settings.SENTRY_SOURCE_FETCH_CONCURRENCY
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    with _fetch_pool_lock:
+        if _fetch_pool is None:
+            _fetch_pool = ThreadPoolExecutor(max_workers=concurrency)
+    return list(_fetch_pool.map(functools.partial(_call_in_pool, func), items))
+
+
 def is_data_uri(url):
     return url[:BASE64_PREAMBLE_LENGTH] == BASE64_SOURCEMAP_PREAMBLE
 
@@ -745,61 +793,97 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
         return self.cache.get(filename)
 
     def cache_source(self, filename):
-        sourcemaps = self.sourcemaps
-        cache = self.cache
-
-        self.fetch_count += 1
-
-        if self.fetch_count > self.max_fetches:
-            cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
-            return
+        self.cache_sources([filename])
 
+    def _fetch_source(self, filename):
         # TODO: respect cache-control/max-age headers to some extent
         logger.debug("Fetching remote source %r", filename)
         try:
-            result = fetch_file(
-                filename,
-                project=self.project,
-                release=self.release,
-                dist=self.dist,
-                allow_scraping=self.allow_scraping,
+            return (
+                fetch_file(
+                    filename,
+                    project=self.project,
+                    release=self.release,
+                    dist=self.dist,
+                    allow_scraping=self.allow_scraping,
+                ),
+                None,
             )
         except http.BadSource as exc:
-            cache.add_error(filename, exc.data)
-            return
+            return None, exc.data
 
-        cache.add(filename, result.body, result.encoding)
-        cache.alias(result.url, filename)
+    def _fetch_sourcemap(self, sourcemap_url):
+        try:
+            return (
+                fetch_sourcemap(
+                    sourcemap_url,
+                    project=self.project,
+                    release=self.release,
+                    dist=self.dist,
+                    allow_scraping=self.allow_scraping,
+                ),
+                None,
+            )
+        except http.BadSource as exc:
+            return None, exc.data
 
-        sourcemap_url = discover_sourcemap(result)
-        if not sourcemap_url:
-            return
+    def cache_sources(self, filenames):
+        """
+        Fetches the given files and then all of their sourcemaps.  Both steps
+        fetch concurrently, while the results are added to the caches in
+        order on the calling thread.
+        """
+        sourcemaps = self.sourcemaps
+        cache = self.cache
 
-        logger.debug("Found sourcemap %r for minified script %r", sourcemap_url[:256], result.url)
-        sourcemaps.link(filename, sourcemap_url)
-        if sourcemap_url in sourcemaps:
-            return
+        to_fetch = []
+        for filename in filenames:
+            self.fetch_count += 1
+            if self.fetch_count > self.max_fetches:
+                cache.add_error(filename, {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES})
+            else:
+                to_fetch.append(filename)
 
-        # pull down sourcemap
-        try:
-            sourcemap_view = fetch_sourcemap(
-                sourcemap_url,
-                project=self.project,
-                release=self.release,
-                dist=self.dist,
-                allow_scraping=self.allow_scraping,
+        # maps sourcemap urls to the files referencing them
+        sourcemaps_to_fetch = OrderedDict()
+        for filename, (result, error) in zip(
+            to_fetch, fetch_concurrently(self._fetch_source, to_fetch)
+        ):
+            if error is not None:
+                cache.add_error(filename, error)
+                continue
+
+            cache.add(filename, result.body, result.encoding)
+            cache.alias(result.url, filename)
+
+            sourcemap_url = discover_sourcemap(result)
+            if not sourcemap_url:
+                continue
+
+            logger.debug(
+                "Found sourcemap %r for minified script %r", sourcemap_url[:256], result.url
             )
-        except http.BadSource as exc:
-            cache.add_error(filename, exc.data)
-            return
+            sourcemaps.link(filename, sourcemap_url)
+            if sourcemap_url not in sourcemaps:
+                sourcemaps_to_fetch.setdefault(sourcemap_url, []).append(filename)
+
+        # pull down sourcemaps
+        sourcemap_urls = list(sourcemaps_to_fetch)
+        for sourcemap_url, (sourcemap_view, error) in zip(
+            sourcemap_urls, fetch_concurrently(self._fetch_sourcemap, sourcemap_urls)
+        ):
+            if error is not None:
+                for filename in sourcemaps_to_fetch[sourcemap_url]:
+                    cache.add_error(filename, error)
+                continue
 
-        sourcemaps.add(sourcemap_url, sourcemap_view)
+            sourcemaps.add(sourcemap_url, sourcemap_view)
 
-        # cache any inlined sources
-        for src_id, source_name in sourcemap_view.iter_sources():
-            source_view = sourcemap_view.get_sourceview(src_id)
-            if source_view is not None:
-                self.cache.add(non_standard_url_join(sourcemap_url, source_name), source_view)
+            # cache any inlined sources
+            for src_id, source_name in sourcemap_view.iter_sources():
+                source_view = sourcemap_view.get_sourceview(src_id)
+                if source_view is not None:
+                    self.cache.add(non_standard_url_join(sourcemap_url, source_name), source_view)
 
     def populate_source_cache(self, frames):
         """
@@ -822,8 +906,7 @@ class JavaScriptStacktraceProcessor(StacktraceProcessor):
                 continue
             pending_file_list.add(f["abs_path"])
 
-        for idx, filename in enumerate(pending_file_list):
-            self.cache_source(filename=filename)
+        self.cache_sources(pending_file_list)
 
     def close(self):
         StacktraceProcessor.close(self)
@@ -1,12 +1,14 @@
 from __future__ import absolute_import, print_function
 
 from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete
 from django.utils import timezone
 
 from sentry.constants import ENVIRONMENT_NAME_PATTERN, ENVIRONMENT_NAME_MAX_LENGTH
 from sentry.db.models import BoundedPositiveIntegerField, FlexibleForeignKey, Model, sane_repr
 from sentry.utils.cache import cache
 from sentry.utils.hashlib import md5_text
+from sentry.utils.relations import relations_cache
 import re
 
 OK_NAME_PATTERN = re.compile(ENVIRONMENT_NAME_PATTERN)
@@ -80,28 +82,32 @@ class Environment(Model):
 
         cache_key = cls.get_cache_key(project.organization_id, name)
 
-        env = cache.get(cache_key)
+        env = relations_cache.get(cache_key)
         if env is None:
             env = cls.objects.get_or_create(name=name, organization_id=project.organization_id)[0]
-            cache.set(cache_key, env, 3600)
+            relations_cache.set(cache_key, env, 3600)
 
         env.add_project(project)
 
         return env
 
+    @classmethod
+    def get_project_cache_key(cls, environment_id, project_id):
+        return "envproj:c:%s:%s" % (environment_id, project_id)
+
     def add_project(self, project, is_hidden=None):
-        cache_key = "envproj:c:%s:%s" % (self.id, project.id)
+        cache_key = self.get_project_cache_key(self.id, project.id)
 
-        if cache.get(cache_key) is None:
+        if relations_cache.get(cache_key) is None:
             try:
                 with transaction.atomic():
                     EnvironmentProject.objects.create(
                         project=project, environment=self, is_hidden=is_hidden
                     )
-                cache.set(cache_key, 1, 3600)
+                relations_cache.set(cache_key, 1, 3600)
             except IntegrityError:
                 # We've already created the object, should still cache the action.
-                cache.set(cache_key, 1, 3600)
+                relations_cache.set(cache_key, 1, 3600)
 
     @staticmethod
     def get_name_from_path_segment(segment):
@@ -111,3 +117,19 @@ class Environment(Model):
         # other contexts (incl. request query string parameters), the empty
         # string should be used.
         return segment if segment != "none" else ""
+
+
+post_delete.connect(
+    lambda instance, **kwargs: relations_cache.delete(
+        Environment.get_cache_key(instance.organization_id, instance.name)
+    ),
+    sender=Environment,
+    weak=False,
+)
+post_delete.connect(
+    lambda instance, **kwargs: relations_cache.delete(
+        Environment.get_project_cache_key(instance.environment_id, instance.project_id)
+    ),
+    sender=EnvironmentProject,
+    weak=False,
+)
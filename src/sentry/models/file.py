@@ -1,8 +1,9 @@
 from __future__ import absolute_import
 
+import io
 import os
-import six
 import mmap
+import bisect
 import tempfile
 
 from hashlib import sha1
@@ -319,16 +320,19 @@ class File(Model):
         app_label = "sentry"
         db_table = "sentry_file"
 
-    def _get_chunked_blob(self, mode=None, prefetch=False, prefetch_to=None, delete=True):
+    def _get_chunked_blob(
+        self, mode=None, prefetch=False, prefetch_to=None, delete=True, readahead=False
+    ):
         return ChunkedFileBlobIndexWrapper(
             FileBlobIndex.objects.filter(file=self).select_related("blob").order_by("offset"),
             mode=mode,
             prefetch=prefetch,
             prefetch_to=prefetch_to,
             delete=delete,
+            readahead=readahead,
         )
 
-    def getfile(self, mode=None, prefetch=False, as_tempfile=False):
+    def getfile(self, mode=None, prefetch=False, as_tempfile=False, readahead=False):
         """Returns a file object.  By default the file is fetched on
         demand but if prefetch is enabled the file is fully prefetched
         into a tempfile before reading can happen.
@@ -336,10 +340,13 @@ class File(Model):
         Additionally if `as_tempfile` is passed a NamedTemporaryFile is
         returned instead which can help in certain situations where a
         tempfile is necessary.
+
+        When reading a large file sequentially, `readahead` fetches the
+        next chunk in the background while the current one is read.
         """
         if as_tempfile:
             prefetch = True
-        impl = self._get_chunked_blob(mode, prefetch)
+        impl = self._get_chunked_blob(mode, prefetch, readahead=readahead)
         if as_tempfile:
             return impl.detach_tempfile()
         return FileObj(impl, self.name)
@@ -451,17 +458,35 @@ class FileBlobIndex(Model):
         unique_together = (("file", "blob", "offset"),)
 
 
-class ChunkedFileBlobIndexWrapper(object):
-    def __init__(self, indexes, mode=None, prefetch=False, prefetch_to=None, delete=True):
+class ChunkedFileBlobIndexWrapper(io.RawIOBase):
+    """
+    A read only, seekable file object over the blobs of a file.
+
+    By default blobs are opened on demand while reading (with ``readahead``
+    the next blob is already opened in a background thread while the current
+    one is read), with ``prefetch`` all blobs are fetched into a tempfile
+    upfront.
+    """
+
+    def __init__(
+        self, indexes, mode=None, prefetch=False, prefetch_to=None, delete=True, readahead=False
+    ):
         # eager load from database incase its a queryset
         self._indexes = list(indexes)
+        self._offsets = [idx.offset for idx in self._indexes]
         self._curfile = None
         self._curidx = None
+        self._curpos = None
+        self._readahead = None
+        self._readahead_executor = None
+        self._closed = False
         if prefetch:
             self.prefetched = True
             self._prefetch(prefetch_to, delete)
         else:
             self.prefetched = False
+            if readahead:
+                self._readahead_executor = ThreadPoolExecutor(max_workers=1)
         self.mode = mode
         self.open()
 
@@ -471,6 +496,16 @@ class ChunkedFileBlobIndexWrapper(object):
     def __exit__(self, exc_type, exc_value, tb):
         self.close()
 
+    @property
+    def closed(self):
+        return self._closed
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
     def detach_tempfile(self):
         if not self.prefetched:
             raise TypeError("Can only detech tempfiles in prefetch mode")
@@ -480,26 +515,69 @@ class ChunkedFileBlobIndexWrapper(object):
         rv.seek(0)
         return rv
 
-    def _nextidx(self):
+    def _discard_readahead(self):
+        if self._readahead is None:
+            return
+        _, future = self._readahead
+        self._readahead = None
+
+        def close_file(future):
+            if not future.cancelled() and future.exception() is None:
+                future.result().close()
+
+        future.add_done_callback(close_file)
+
+    def _openidx(self, pos):
+        """
+        Makes the blob at position ``pos`` of the index the current one, or
+        moves past the last blob if there is none.
+        """
         assert not self.prefetched, "this makes no sense"
         old_file = self._curfile
         try:
-            try:
-                self._curidx = six.next(self._idxiter)
-                self._curfile = self._curidx.blob.getfile()
-            except StopIteration:
+            self._curfile = None
+            if pos >= len(self._indexes):
                 self._curidx = None
-                self._curfile = None
+                self._curpos = None
+                self._discard_readahead()
+                return
+
+            self._curidx = self._indexes[pos]
+            self._curpos = pos
+            if self._readahead is not None and self._readahead[0] == pos:
+                future = self._readahead[1]
+                self._readahead = None
+                self._curfile = future.result()
+            else:
+                self._discard_readahead()
+                self._curfile = self._curidx.blob.getfile()
+
+            if self._readahead_executor is not None:
+                if pos + 1 < len(self._indexes):
+                    self._readahead = (
+                        pos + 1,
+                        self._readahead_executor.submit(self._indexes[pos + 1].blob.getfile),
+                    )
+                else:
+                    # Nothing left to read ahead, blobs opened after seeking
+                    # back are read on demand.
+                    self._readahead_executor.shutdown(wait=False)
+                    self._readahead_executor = None
         finally:
             if old_file is not None:
                 old_file.close()
 
+    def _nextidx(self):
+        self._openidx(self._curpos + 1)
+
     @property
     def size(self):
-        return sum(i.blob.size for i in self._indexes)
+        if not self._indexes:
+            return 0
+        return self._indexes[-1].offset + self._indexes[-1].blob.size
 
     def open(self):
-        self.closed = False
+        self._closed = False
         self.seek(0)
 
     def _prefetch(self, prefetch_to=None, delete=True):
@@ -533,30 +611,39 @@ class ChunkedFileBlobIndexWrapper(object):
         self._curfile = f
 
     def close(self):
+        self._discard_readahead()
+        if self._readahead_executor is not None:
+            self._readahead_executor.shutdown(wait=False)
+            self._readahead_executor = None
         if self._curfile:
             self._curfile.close()
         self._curfile = None
         self._curidx = None
-        self.closed = True
+        self._curpos = None
+        self._closed = True
 
-    def seek(self, pos):
+    def seek(self, pos, whence=io.SEEK_SET):
         if self.closed:
             raise ValueError("I/O operation on closed file")
 
         if self.prefetched:
-            return self._curfile.seek(pos)
+            self._curfile.seek(pos, whence)
+            return self._curfile.tell()
 
+        if whence == io.SEEK_CUR:
+            pos += self.tell()
+        elif whence == io.SEEK_END:
+            pos += self.size
         if pos < 0:
             raise IOError("Invalid argument")
-        for n, idx in enumerate(self._indexes[::-1]):
-            if idx.offset <= pos:
-                if idx != self._curidx:
-                    self._idxiter = iter(self._indexes[-(n + 1) :])
-                    self._nextidx()
-                break
-        else:
+        if not self._indexes:
             raise ValueError("Cannot seek to pos")
+
+        idx = bisect.bisect_right(self._offsets, pos) - 1
+        if idx != self._curpos:
+            self._openidx(idx)
         self._curfile.seek(pos - self._curidx.offset)
+        return pos
 
     def tell(self):
         if self.closed:
@@ -567,6 +654,25 @@ class ChunkedFileBlobIndexWrapper(object):
             return self.size
         return self._curidx.offset + self._curfile.tell()
 
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+
+        if self.prefetched:
+            return self._curfile.readinto(b)
+
+        view = memoryview(b)
+        size = len(view)
+        n = 0
+        while n < size and self._curfile is not None:
+            blob_result = self._curfile.read(size - n)
+            if not blob_result:
+                self._nextidx()
+            else:
+                view[n : n + len(blob_result)] = blob_result
+                n += len(blob_result)
+        return n
+
     def read(self, n=-1):
         if self.closed:
             raise ValueError("I/O operation on closed file")
@@ -574,28 +680,35 @@ class ChunkedFileBlobIndexWrapper(object):
         if self.prefetched:
             return self._curfile.read(n)
 
-        result = bytearray()
+        # Blobs are read in one piece where possible, so that their contents
+        # are only copied once when joining them.
+        result = []
 
         # Read to the end of the file
-        if n < 0:
+        if n is None or n < 0:
             while self._curfile is not None:
-                blob_result = self._curfile.read(32768)
+                blob_result = self._curfile.read()
                 if not blob_result:
                     self._nextidx()
                 else:
-                    result.extend(blob_result)
+                    result.append(blob_result)
 
         # Read until a certain number of bytes are read
         else:
             while n > 0 and self._curfile is not None:
-                blob_result = self._curfile.read(min(n, 32768))
+                blob_result = self._curfile.read(n)
                 if not blob_result:
                     self._nextidx()
                 else:
                     n -= len(blob_result)
-                    result.extend(blob_result)
+                    result.append(blob_result)
+
+        if len(result) == 1:
+            return result[0]
+        return b"".join(result)
 
-        return bytes(result)
+    def readall(self):
+        return self.read()
 
 
 class FileBlobOwner(Model):
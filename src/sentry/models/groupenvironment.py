@@ -5,7 +5,7 @@ from django.db.models.signals import post_delete
 from django.utils import timezone
 
 from sentry.db.models import FlexibleForeignKey, Model, sane_repr
-from sentry.utils.cache import cache
+from sentry.utils.relations import relations_cache
 
 
 class GroupEnvironment(Model):
@@ -38,12 +38,12 @@ class GroupEnvironment(Model):
     @classmethod
     def get_or_create(cls, group_id, environment_id, defaults=None):
         cache_key = cls._get_cache_key(group_id, environment_id)
-        instance = cache.get(cache_key)
+        instance = relations_cache.get(cache_key)
         if instance is None:
             instance, created = cls.objects.get_or_create(
                 group_id=group_id, environment_id=environment_id, defaults=defaults
             )
-            cache.set(cache_key, instance, 3600)
+            relations_cache.set(cache_key, instance, 3600)
         else:
             created = False
 
@@ -51,7 +51,7 @@ class GroupEnvironment(Model):
 
 
 post_delete.connect(
-    lambda instance, **kwargs: cache.delete(
+    lambda instance, **kwargs: relations_cache.delete(
         GroupEnvironment._get_cache_key(instance.group_id, instance.environment_id)
     ),
     sender=GroupEnvironment,
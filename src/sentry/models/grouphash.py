@@ -1,9 +1,123 @@
 from __future__ import absolute_import
 
-from django.db import models
+import six
+
+from django.core.cache import cache
+from django.db import connections, models, router
 from django.utils.translation import ugettext_lazy as _
+from uuid import uuid4
+
+from sentry.db.models import BaseManager, BoundedPositiveIntegerField, FlexibleForeignKey, Model
+
+
+class GroupHashManager(BaseManager):
+    # Hashes that are associated with a group (or tombstone) are cached for a
+    # short time since they are resolved for every event. Anything that
+    # reassigns existing hashes (merges, unmerges, tombstones and deletions)
+    # must call ``invalidate_cache`` for the project afterwards. Deletions that
+    # don't (e.g. through ``sentry.deletions`` or cleanup) are caught by the
+    # event manager, which looks the hashes up again if their group is gone.
+    cache_ttl = 60
+    cache_version_ttl = 3600
+
+    def _get_cache_version_key(self, project_id):
+        return u"grouphash:version:{}".format(project_id)
+
+    def _get_cache_version(self, project_id):
+        key = self._get_cache_version_key(project_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, self.cache_version_ttl)
+            version = cache.get(key)
+        return version
+
+    def _make_cache_key(self, project_id, version, hash):
+        return u"grouphash:{}:{}:{}".format(project_id, version, hash)
+
+    def invalidate_cache(self, project_id):
+        cache.set(self._get_cache_version_key(project_id), uuid4().hex, self.cache_version_ttl)
+
+    def _get_or_create_rows(self, project, hashes):
+        using = router.db_for_write(self.model)
+        rows = {h.hash: h for h in self.using(using).filter(project=project, hash__in=hashes)}
+
+        missing = [h for h in hashes if h not in rows]
+        if not missing:
+            return rows
 
-from sentry.db.models import BoundedPositiveIntegerField, FlexibleForeignKey, Model
+        cursor = connections[using].cursor()
+        try:
+            cursor.execute(
+                """
+                insert into sentry_grouphash (project_id, hash)
+                select %s, unnest(%s::varchar[])
+                on conflict (project_id, hash) do nothing
+                returning id, hash
+            """,
+                [project.id, missing],
+            )
+            for id, hash in cursor.fetchall():
+                rows[hash] = self.model(id=id, project=project, hash=hash)
+        finally:
+            cursor.close()
+
+        # Anything that was not returned has been inserted concurrently.
+        missing = [h for h in missing if h not in rows]
+        if missing:
+            rows.update(
+                (h.hash, h) for h in self.using(using).filter(project=project, hash__in=missing)
+            )
+
+        return rows
+
+    def get_or_create_many(self, project, hashes):
+        """
+        Returns the ``GroupHash`` for each of ``hashes`` (in the same order),
+        creating the ones that do not exist yet.
+
+        This requires at most three queries regardless of the number of
+        hashes, and none if all of them are cached.
+        """
+        unique_hashes = set(hashes)
+        if not unique_hashes:
+            return []
+
+        version = self._get_cache_version(project.id)
+        cache_keys = {self._make_cache_key(project.id, version, h): h for h in unique_hashes}
+
+        results = {}
+        for key, (id, group_id, group_tombstone_id, state) in six.iteritems(
+            cache.get_many(list(cache_keys))
+        ):
+            hash = cache_keys[key]
+            results[hash] = self.model(
+                id=id,
+                project=project,
+                hash=hash,
+                group_id=group_id,
+                group_tombstone_id=group_tombstone_id,
+                state=state,
+            )
+
+        missing = [h for h in unique_hashes if h not in results]
+        if missing:
+            rows = self._get_or_create_rows(project, missing)
+            results.update(rows)
+            cache.set_many(
+                {
+                    self._make_cache_key(project.id, version, h.hash): (
+                        h.id,
+                        h.group_id,
+                        h.group_tombstone_id,
+                        h.state,
+                    )
+                    for h in six.itervalues(rows)
+                    if h.group_id is not None or h.group_tombstone_id is not None
+                },
+                self.cache_ttl,
+            )
+
+        return [results[h] for h in hashes]
 
 
 class GroupHash(Model):
@@ -21,6 +135,8 @@ class GroupHash(Model):
         choices=[(State.LOCKED_IN_MIGRATION, _("Locked (Migration in Progress)"))], null=True
     )
 
+    objects = GroupHashManager()
+
     class Meta:
         app_label = "sentry"
         db_table = "sentry_grouphash"
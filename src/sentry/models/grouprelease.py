@@ -2,10 +2,11 @@ from __future__ import absolute_import
 
 from datetime import timedelta
 from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete
 from django.utils import timezone
 
-from sentry.utils.cache import cache
 from sentry.utils.hashlib import md5_text
+from sentry.utils.relations import relations_cache
 from sentry.db.models import BoundedPositiveIntegerField, Model, sane_repr
 
 
@@ -36,7 +37,7 @@ class GroupRelease(Model):
     def get_or_create(cls, group, release, environment, datetime, **kwargs):
         cache_key = cls.get_cache_key(group.id, release.id, environment.name)
 
-        instance = cache.get(cache_key)
+        instance = relations_cache.get(cache_key)
         if instance is None:
             try:
                 with transaction.atomic():
@@ -58,7 +59,7 @@ class GroupRelease(Model):
                     ),
                     False,
                 )
-            cache.set(cache_key, instance, 3600)
+            relations_cache.set(cache_key, instance, 3600)
         else:
             created = False
 
@@ -70,5 +71,14 @@ class GroupRelease(Model):
                 id=instance.id, last_seen__lt=datetime - timedelta(seconds=60)
             ).update(last_seen=datetime)
             instance.last_seen = datetime
-            cache.set(cache_key, instance, 3600)
+            relations_cache.set(cache_key, instance, 3600)
         return instance
+
+
+post_delete.connect(
+    lambda instance, **kwargs: relations_cache.delete(
+        GroupRelease.get_cache_key(instance.group_id, instance.release_id, instance.environment)
+    ),
+    sender=GroupRelease,
+    weak=False,
+)
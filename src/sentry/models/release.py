@@ -7,6 +7,7 @@ import itertools
 
 from django.db import models, IntegrityError, transaction
 from django.db.models import F
+from django.db.models.signals import post_delete
 from django.utils import timezone
 from time import time
 
@@ -26,6 +27,7 @@ from sentry.signals import issue_resolved, release_commits_updated
 from sentry.utils import metrics
 from sentry.utils.cache import cache
 from sentry.utils.hashlib import md5_text
+from sentry.utils.relations import relations_cache
 from sentry.utils.retries import TimedRetryPolicy
 
 logger = logging.getLogger(__name__)
@@ -135,7 +137,7 @@ class Release(Model):
 
         cache_key = cls.get_cache_key(project.organization_id, version)
 
-        release = cache.get(cache_key)
+        release = relations_cache.get(cache_key)
         if release in (None, -1):
             # TODO(dcramer): if the cache result is -1 we could attempt a
             # default create here instead of default get
@@ -172,7 +174,7 @@ class Release(Model):
 
             # TODO(dcramer): upon creating a new release, check if it should be
             # the new "latest release" for this project
-            cache.set(cache_key, release, 3600)
+            relations_cache.set(cache_key, release, 3600)
 
         return release
 
@@ -602,3 +604,12 @@ class Release(Model):
             kick_off_status_syncs.apply_async(
                 kwargs={"project_id": group_project_lookup[group_id], "group_id": group_id}
             )
+
+
+post_delete.connect(
+    lambda instance, **kwargs: relations_cache.delete(
+        Release.get_cache_key(instance.organization_id, instance.version)
+    ),
+    sender=Release,
+    weak=False,
+)
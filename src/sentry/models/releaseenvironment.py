@@ -2,9 +2,10 @@ from __future__ import absolute_import
 
 from datetime import timedelta
 from django.db import models
+from django.db.models.signals import post_delete
 from django.utils import timezone
 
-from sentry.utils.cache import cache
+from sentry.utils.relations import relations_cache
 from sentry.db.models import BoundedPositiveIntegerField, FlexibleForeignKey, Model, sane_repr
 
 
@@ -32,9 +33,9 @@ class ReleaseEnvironment(Model):
 
     @classmethod
     def get_or_create(cls, project, release, environment, datetime, **kwargs):
-        cache_key = cls.get_cache_key(project.id, release.id, environment.id)
+        cache_key = cls.get_cache_key(project.organization_id, release.id, environment.id)
 
-        instance = cache.get(cache_key)
+        instance = relations_cache.get(cache_key)
         if instance is None:
             instance, created = cls.objects.get_or_create(
                 release_id=release.id,
@@ -42,7 +43,7 @@ class ReleaseEnvironment(Model):
                 environment_id=environment.id,
                 defaults={"first_seen": datetime, "last_seen": datetime},
             )
-            cache.set(cache_key, instance, 3600)
+            relations_cache.set(cache_key, instance, 3600)
         else:
             created = False
 
@@ -54,5 +55,16 @@ class ReleaseEnvironment(Model):
                 id=instance.id, last_seen__lt=datetime - timedelta(seconds=60)
             ).update(last_seen=datetime)
             instance.last_seen = datetime
-            cache.set(cache_key, instance, 3600)
+            relations_cache.set(cache_key, instance, 3600)
         return instance
+
+
+post_delete.connect(
+    lambda instance, **kwargs: relations_cache.delete(
+        ReleaseEnvironment.get_cache_key(
+            instance.organization_id, instance.release_id, instance.environment_id
+        )
+    ),
+    sender=ReleaseEnvironment,
+    weak=False,
+)
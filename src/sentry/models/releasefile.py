@@ -1,11 +1,110 @@
 from __future__ import absolute_import
 
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models.signals import post_delete, post_save
 from six.moves.urllib.parse import urlsplit, urlunsplit
+from uuid import uuid4
 
-from sentry.db.models import BoundedPositiveIntegerField, FlexibleForeignKey, Model, sane_repr
+from sentry.db.models import (
+    BaseManager,
+    BoundedPositiveIntegerField,
+    FlexibleForeignKey,
+    Model,
+    sane_repr,
+)
+from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.hashlib import sha1_text
 
+# Changes only invalidate the local manifests of the process making them,
+# which is why they are only kept locally for a short time.  The size is the
+# total number of files of all manifests.
+_local_manifests = LRUCache(
+    100000, ttl=60, getsize=lambda manifest: len(manifest) if manifest != -1 else 1
+)
+
+
+class ReleaseFileManager(BaseManager):
+    # Shared manifests are versioned per release (and dist).  Changes bump
+    # the version right away and once more when their transaction commits,
+    # so that a manifest built while the change was not yet visible to other
+    # connections is never used afterwards.
+    manifest_cache_ttl = 3600
+    # Manifests of releases without files are only cached briefly, since
+    # files are usually uploaded while events already arrive.
+    empty_manifest_cache_ttl = 60
+    manifest_version_ttl = 3600
+    # Releases with more files than this are looked up file by file.
+    max_manifest_files = 5000
+
+    def _get_local_manifest_key(self, release_id, dist_id):
+        return (release_id, dist_id)
+
+    def _get_manifest_version_key(self, release_id, dist_id):
+        return u"releasefile:manifest:version:{}:{}".format(release_id, dist_id or "")
+
+    def _get_manifest_version(self, release_id, dist_id):
+        key = self._get_manifest_version_key(release_id, dist_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid4().hex, self.manifest_version_ttl)
+            version = cache.get(key)
+        return version
+
+    def _get_manifest_cache_key(self, release_id, dist_id, version):
+        return u"releasefile:manifest:v2:{}:{}:{}".format(release_id, dist_id or "", version)
+
+    def get_manifest(self, release, dist=None):
+        """
+        Returns a mapping of the idents of all files of the release (and
+        dist) to the ids of the release files, so that looking up files that
+        do not exist does not require any queries.  Returns ``None`` if the
+        release has too many files.
+        """
+        dist_id = dist and dist.id
+        local_key = self._get_local_manifest_key(release.id, dist_id)
+        manifest = _local_manifests.get(local_key)
+        if manifest is None:
+            version = self._get_manifest_version(release.id, dist_id)
+            cache_key = self._get_manifest_cache_key(release.id, dist_id, version)
+            manifest = cache.get(cache_key)
+            if manifest is None:
+                rows = list(
+                    self.filter(release=release, dist=dist).values_list("ident", "id")[
+                        : self.max_manifest_files + 1
+                    ]
+                )
+                if len(rows) > self.max_manifest_files:
+                    manifest = -1
+                else:
+                    manifest = dict(rows)
+                cache.set(
+                    cache_key,
+                    manifest,
+                    self.manifest_cache_ttl if manifest else self.empty_manifest_cache_ttl,
+                )
+            _local_manifests.set(local_key, manifest)
+
+        if manifest == -1:
+            return None
+        return manifest
+
+    def _bump_manifest_version(self, release_id, dist_id):
+        _local_manifests.delete(self._get_local_manifest_key(release_id, dist_id))
+        cache.set(
+            self._get_manifest_version_key(release_id, dist_id),
+            uuid4().hex,
+            self.manifest_version_ttl,
+        )
+
+    def invalidate_manifest(self, release_id, dist_id):
+        self._bump_manifest_version(release_id, dist_id)
+        # Outside of a transaction this runs right away.
+        transaction.on_commit(
+            lambda: self._bump_manifest_version(release_id, dist_id),
+            using=router.db_for_write(self.model),
+        )
+
 
 class ReleaseFile(Model):
     r"""
@@ -25,6 +124,8 @@ class ReleaseFile(Model):
     name = models.TextField()
     dist = FlexibleForeignKey("sentry.Distribution", null=True)
 
+    objects = ReleaseFileManager()
+
     __repr__ = sane_repr("release", "ident")
 
     class Meta:
@@ -77,3 +178,19 @@ class ReleaseFile(Model):
         if query:
             urls.append("~" + urlunsplit(uri_relative_without_query))
         return urls
+
+
+post_save.connect(
+    lambda instance, **kwargs: ReleaseFile.objects.invalidate_manifest(
+        instance.release_id, instance.dist_id
+    ),
+    sender=ReleaseFile,
+    weak=False,
+)
+post_delete.connect(
+    lambda instance, **kwargs: ReleaseFile.objects.invalidate_manifest(
+        instance.release_id, instance.dist_id
+    ),
+    sender=ReleaseFile,
+    weak=False,
+)
@@ -10,6 +10,7 @@ from google.cloud.bigtable.row_set import RowSet
 from simplejson import JSONEncoder, _default_decoder
 from django.utils import timezone
 
+from sentry.nodestore import codec
 from sentry.nodestore.base import NodeStorage
 
 # Cache an instance of the encoder we want to use
@@ -62,6 +63,10 @@ class BigtableNodeStorage(NodeStorage):
     ...     default_ttl=timedelta(days=30),
     ...     compression=True,
     ... )
+
+    When ``codec`` is set to the name of a codec (see
+    ``sentry.nodestore.codec``), rows are written with that codec instead of
+    (optionally compressed) JSON. Rows are read in either format.
     """
 
     max_size = 1024 * 1024 * 10
@@ -80,6 +85,7 @@ class BigtableNodeStorage(NodeStorage):
         automatic_expiry=False,
         default_ttl=None,
         compression=False,
+        codec=None,
         thread_pool_size=5,  # TODO(mattrobenolt): Remove this
         **kwargs
     ):
@@ -90,6 +96,7 @@ class BigtableNodeStorage(NodeStorage):
         self.automatic_expiry = automatic_expiry
         self.default_ttl = default_ttl
         self.compression = compression
+        self.codec = codec
         self.skip_deletes = automatic_expiry and "_SENTRY_CLEANUP" in os.environ
 
     @property
@@ -148,6 +155,8 @@ class BigtableNodeStorage(NodeStorage):
         # decompress the data.
         if flags & self._FLAG_COMPRESSED:
             data = zlib_decompress(data)
+        elif codec.is_encoded(data):
+            return codec.decode(data)
 
         return json_loads(data)
 
@@ -156,7 +165,10 @@ class BigtableNodeStorage(NodeStorage):
         row.commit()
 
     def encode_row(self, id, data, ttl=None):
-        data = json_dumps(data)
+        if self.codec is not None:
+            data = codec.encode(data, self.codec)
+        else:
+            data = json_dumps(data)
 
         row = self.connection.row(id)
         # Call to delete is just a state mutation,
@@ -190,9 +202,10 @@ class BigtableNodeStorage(NodeStorage):
 
         # Track flags for metadata about this row.
         # This only flag we're tracking now is whether compression
-        # is on or not for the data column.
+        # is on or not for the data column. Codecs take care of
+        # compression themselves.
         flags = 0
-        if self.compression:
+        if self.compression and self.codec is None:
             flags |= self._FLAG_COMPRESSED
             data = zlib_compress(data)
 
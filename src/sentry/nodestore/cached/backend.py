@@ -0,0 +1,232 @@
+from __future__ import absolute_import
+
+import msgpack
+import six
+import threading
+import zlib
+
+from sentry.nodestore.base import NodeStorage
+from sentry.utils import metrics
+from sentry.utils.datastructures import LRUCache
+from sentry.utils.imports import import_string
+from sentry.utils.redis import clusters
+
+# Nodestore backends are thread local, the local tier is shared by all
+# threads of a process (``LRUCache`` is thread safe.)
+_local_caches = {}
+_local_caches_lock = threading.Lock()
+
+
+def _get_local_cache(size, ttl):
+    with _local_caches_lock:
+        try:
+            return _local_caches[size, ttl]
+        except KeyError:
+            rv = _local_caches[size, ttl] = LRUCache(size, ttl=ttl, getsize=len)
+            return rv
+
+
+class CachedNodeStorage(NodeStorage):
+    """
+    Wraps another nodestore backend with a read-through cache, since node
+    data is usually read several times shortly after it has been written
+    (post processing, plugins, digests, the issue details page.)
+
+    The first tier is an LRU shared by all threads of a process and bounded by
+    the size of the serialized nodes in bytes (``local_cache_size``), the
+    second one is an optional Redis cluster shared by all processes, whose
+    entries expire after ``cache_ttl`` seconds::
+
+        SENTRY_NODESTORE = "sentry.nodestore.cached.CachedNodeStorage"
+        SENTRY_NODESTORE_OPTIONS = {
+            "backend": "sentry.nodestore.django.DjangoNodeStorage",
+            "options": {},
+            "cluster": "default",
+        }
+
+    Writes go to the wrapped backend first and then replace the cached
+    values, deletes remove them from both tiers. The local tier of other
+    processes is not invalidated though, so these keep serving the previous
+    value for up to ``local_cache_ttl`` seconds. Most nodes are never changed
+    after they have been written, set it to ``0`` to disable the local tier
+    where that matters.
+
+    Nodes are cached as msgpack. Nodes that msgpack can't represent exactly
+    (e.g. holding sets, tuples or datetimes) are not cached.
+    """
+
+    def __init__(
+        self,
+        backend,
+        options=None,
+        local_cache_size=50 * 1024 * 1024,
+        local_cache_ttl=60,
+        cluster=None,
+        cache_ttl=3600,
+        compress_level=3,
+    ):
+        self.inner = import_string(backend)(**(options or {}))
+        if local_cache_size and local_cache_ttl:
+            self.local_cache = _get_local_cache(local_cache_size, local_cache_ttl)
+        else:
+            self.local_cache = None
+        if cluster is not None:
+            self.client = clusters.get(cluster).get_routing_client()
+        else:
+            self.client = None
+        self.cache_ttl = cache_ttl
+        self.compress_level = compress_level
+
+    def _make_key(self, id):
+        return u"nodestore:cache:{}".format(id)
+
+    def _encode(self, data):
+        """
+        Returns the serialized node, or ``None`` if the node can't be cached.
+        ``strict_types`` makes msgpack reject tuples and subclasses of dicts
+        and lists, instead of turning them into lists and plain dicts.
+        """
+        try:
+            return msgpack.packb(data, use_bin_type=True, strict_types=True)
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    def _decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+    def _record(self, tier, hits, misses):
+        if hits:
+            metrics.incr(
+                "nodestore.cache",
+                amount=hits,
+                tags={"tier": tier, "result": "hit"},
+                skip_internal=True,
+            )
+        if misses:
+            metrics.incr(
+                "nodestore.cache",
+                amount=misses,
+                tags={"tier": tier, "result": "miss"},
+                skip_internal=True,
+            )
+
+    def _get_local(self, id_list, rv):
+        missing = []
+        for id in id_list:
+            payload = self.local_cache.get(id)
+            if payload is None:
+                missing.append(id)
+            else:
+                # Every caller gets its own copy since node data is mutable.
+                rv[id] = self._decode(payload)
+        self._record("local", len(id_list) - len(missing), len(missing))
+        return missing
+
+    def _get_shared(self, id_list):
+        with self.client.map() as client:
+            results = [(id, client.get(self._make_key(id))) for id in id_list]
+
+        payloads = {}
+        for id, result in results:
+            if result.value is not None:
+                payloads[id] = zlib.decompress(result.value)
+        self._record("shared", len(payloads), len(id_list) - len(payloads))
+        return payloads
+
+    def _set_local(self, payloads):
+        evicted = 0
+        for id, payload in six.iteritems(payloads):
+            evicted += self.local_cache.set(id, payload)
+        if evicted > 0:
+            metrics.incr(
+                "nodestore.cache.evicted",
+                amount=evicted,
+                tags={"tier": "local"},
+                skip_internal=True,
+            )
+        metrics.timing("nodestore.cache.size", self.local_cache.size, tags={"tier": "local"})
+
+    def _set_shared(self, payloads):
+        with self.client.map() as client:
+            for id, payload in six.iteritems(payloads):
+                client.setex(
+                    self._make_key(id), self.cache_ttl, zlib.compress(payload, self.compress_level)
+                )
+
+    def _set_cached(self, values):
+        payloads = {}
+        uncacheable = []
+        for id, data in six.iteritems(values):
+            payload = self._encode(data)
+            if payload is None:
+                uncacheable.append(id)
+            else:
+                payloads[id] = payload
+
+        if uncacheable:
+            metrics.incr("nodestore.cache.uncacheable", amount=len(uncacheable), skip_internal=True)
+            # don't keep serving what was cached for these before
+            self._delete_cached(uncacheable)
+
+        if not payloads:
+            return
+        if self.local_cache is not None:
+            self._set_local(payloads)
+        if self.client is not None:
+            self._set_shared(payloads)
+
+    def _delete_cached(self, id_list):
+        if self.local_cache is not None:
+            for id in id_list:
+                self.local_cache.delete(id)
+        if self.client is not None:
+            with self.client.map() as client:
+                for id in id_list:
+                    client.delete(self._make_key(id))
+
+    def get(self, id):
+        return self.get_multi([id])[id]
+
+    def get_multi(self, id_list):
+        rv = {}
+        missing = list(id_list)
+
+        if missing and self.local_cache is not None:
+            missing = self._get_local(missing, rv)
+
+        if missing and self.client is not None:
+            payloads = self._get_shared(missing)
+            for id, payload in six.iteritems(payloads):
+                rv[id] = self._decode(payload)
+            if payloads and self.local_cache is not None:
+                self._set_local(payloads)
+            missing = [id for id in missing if id not in payloads]
+
+        if missing:
+            results = self.inner.get_multi(missing)
+            rv.update(results)
+            self._set_cached({id: data for id, data in six.iteritems(results) if data is not None})
+
+        return rv
+
+    def set(self, id, data, ttl=None):
+        self.inner.set(id, data, ttl=ttl)
+        self._set_cached({id: data})
+
+    def set_multi(self, values):
+        self.inner.set_multi(values)
+        self._set_cached(values)
+
+    def delete(self, id):
+        self.delete_multi([id])
+
+    def delete_multi(self, id_list):
+        self.inner.delete_multi(id_list)
+        self._delete_cached(id_list)
+
+    def cleanup(self, cutoff_timestamp):
+        # Cached nodes are not removed here, they expire on their own.
+        self.inner.cleanup(cutoff_timestamp)
+
+    def validate(self):
+        self.inner.validate()
@@ -0,0 +1,90 @@
+"""
+Serialization of node data.
+
+Every encoded payload starts with a single byte identifying the codec it was
+written with, followed by the codec specific encoding of the node. Payloads
+written before a codec was configured (zlib streams, which start with
+``0x78``, and plain JSON objects) never start with one of these bytes, so
+backends can use ``is_encoded`` to tell both apart and keep reading nodes
+written by older versions.
+
+Additional codecs can be added with ``register``.
+"""
+
+from __future__ import absolute_import
+
+import msgpack
+import zlib
+
+_codecs_by_name = {}
+_codecs_by_id = {}
+
+
+class Codec(object):
+    # single byte stored in front of every payload, must be unique
+    id = None
+    # name used to configure the codec of a backend
+    name = None
+
+    def encode(self, data):
+        raise NotImplementedError
+
+    def decode(self, payload):
+        raise NotImplementedError
+
+
+class MsgpackCodec(Codec):
+    id = b"\x01"
+    name = "msgpack"
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+class MsgpackZlibCodec(MsgpackCodec):
+    id = b"\x02"
+    name = "msgpack-zlib"
+    compress_level = 3
+
+    def encode(self, data):
+        return zlib.compress(MsgpackCodec.encode(self, data), self.compress_level)
+
+    def decode(self, payload):
+        return MsgpackCodec.decode(self, zlib.decompress(payload))
+
+
+def register(codec):
+    if codec.id in _codecs_by_id or codec.name in _codecs_by_name:
+        raise ValueError("nodestore codec already registered: %r" % (codec.name,))
+    _codecs_by_id[codec.id] = codec
+    _codecs_by_name[codec.name] = codec
+
+
+register(MsgpackCodec())
+register(MsgpackZlibCodec())
+
+
+def encode(data, codec):
+    """
+    Encodes ``data`` with the codec registered as ``codec``.
+    """
+    try:
+        codec = _codecs_by_name[codec]
+    except KeyError:
+        raise ValueError("unknown nodestore codec: %r" % (codec,))
+    return codec.id + codec.encode(data)
+
+
+def is_encoded(payload):
+    return payload[:1] in _codecs_by_id
+
+
+def decode(payload):
+    try:
+        codec = _codecs_by_id[payload[:1]]
+    except KeyError:
+        raise ValueError("unknown nodestore codec: %r" % (payload[:1],))
+    return codec.decode(payload[1:])
@@ -1,33 +1,113 @@
 from __future__ import absolute_import
 
+import logging
 import math
+import six
 
+from base64 import b64decode, b64encode
+from django.db import connections, router
 from django.utils import timezone
 
-from sentry.db.models import create_or_update
+from sentry.nodestore import codec
 from sentry.nodestore.base import NodeStorage
+from sentry.utils import metrics
 
 from .models import Node
 
+logger = logging.getLogger("sentry")
+
+# Maximum number of rows written by a single ``set_multi`` statement.
+SET_MULTI_BATCH_SIZE = 100
+
 
 class DjangoNodeStorage(NodeStorage):
+    """
+    Stores nodes in the ``nodestore_node`` table.
+
+    By default nodes are written as compressed pickles. When ``codec`` is
+    set to the name of a codec (see ``sentry.nodestore.codec``), new nodes
+    are written with that codec instead. Nodes are always read in either
+    format, so a codec should only be configured once every reader
+    understands it.
+    """
+
+    def __init__(self, codec=None):
+        self.codec = codec
+
+    def _encode(self, data):
+        if self.codec is not None:
+            try:
+                return b64encode(codec.encode(data, self.codec)).decode("utf-8")
+            except TypeError:
+                # the codec can't represent this node, pickle it instead
+                metrics.incr(
+                    "nodestore.codec.fallback", tags={"codec": self.codec}, skip_internal=True
+                )
+        return Node._meta.get_field("data").get_prep_value(data)
+
+    def _is_encoded(self, value):
+        # Only the first base64 quantum is decoded to sniff the codec id.
+        # Legacy payloads are zlib streams, whose base64 starts with "e".
+        try:
+            return codec.is_encoded(b64decode(value[:4]))
+        except (TypeError, ValueError):
+            return False
+
+    def _decode(self, value):
+        if value and self._is_encoded(value):
+            try:
+                return codec.decode(b64decode(value))
+            except Exception as e:
+                # same as reading a malformed legacy payload
+                logger.exception(e)
+                return {}
+        return Node._meta.get_field("data").to_python(value)
+
     def delete(self, id):
         Node.objects.filter(id=id).delete()
 
     def get(self, id):
-        try:
-            return Node.objects.get(id=id).data
-        except Node.DoesNotExist:
-            return None
+        return self.get_multi([id])[id]
 
     def get_multi(self, id_list):
-        return {n.id: n.data for n in Node.objects.filter(id__in=id_list)}
+        # Fetch the raw column values so that no model instances have to be
+        # built, and decode every payload exactly once.
+        rv = dict.fromkeys(id_list)
+        if not rv:
+            return rv
+        for id, data in Node.objects.filter(id__in=list(rv)).values_list("id", "data"):
+            rv[id] = self._decode(data)
+        return rv
 
     def delete_multi(self, id_list):
         Node.objects.filter(id__in=id_list).delete()
 
     def set(self, id, data, ttl=None):
-        create_or_update(Node, id=id, values={"data": data, "timestamp": timezone.now()})
+        self.set_multi({id: data})
+
+    def set_multi(self, values):
+        if not values:
+            return
+
+        timestamp = timezone.now()
+        rows = [(id, self._encode(data), timestamp) for id, data in six.iteritems(values)]
+
+        cursor = connections[router.db_for_write(Node)].cursor()
+        try:
+            for offset in six.moves.xrange(0, len(rows), SET_MULTI_BATCH_SIZE):
+                batch = rows[offset : offset + SET_MULTI_BATCH_SIZE]
+                cursor.execute(
+                    """
+                    insert into nodestore_node (id, data, timestamp)
+                    values %s
+                    on conflict (id) do update
+                    set data = excluded.data, timestamp = excluded.timestamp
+                """
+                    % ", ".join(["(%s, %s, %s)"] * len(batch)),
+                    [value for row in batch for value in row],
+                )
+        finally:
+            cursor.close()
 
     def cleanup(self, cutoff_timestamp):
         from sentry.db.deletion import BulkDeleteQuery
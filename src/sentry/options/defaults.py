@@ -166,6 +166,10 @@ register("store.save-event-skips-nodestore", default=False, flags=FLAG_PRIORITIZ
 # Skip saving an event to postgres
 register("store.skip-pg-save", default=True, flags=FLAG_PRIORITIZE_DISK)
 
+# Save events that don't need processing directly in the ingest consumer,
+# without going through the processing cache and the task queue
+register("store.ingest-consumer-save-inline", default=False, flags=FLAG_PRIORITIZE_DISK)
+
 # Symbolicator refactors
 # - Disabling minidump stackwalking in endpoints
 register("symbolicator.minidump-refactor-projects-opt-in", type=Sequence, default=[])  # unused
@@ -418,6 +418,12 @@ def batching_kafka_options(group):
     help="Specify which type of consumer to create, i.e. from which topic to consume messages.",
     type=click.Choice(["events", "transactions", "attachments"]),
 )
+@click.option(
+    "--processes",
+    type=int,
+    default=1,
+    help="Process messages in this many worker processes. Defaults to 1.",
+)
 @batching_kafka_options("ingest-consumer")
 @configuration
 def ingest_consumer(consumer_type, **options):
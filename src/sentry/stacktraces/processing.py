@@ -3,12 +3,14 @@ from __future__ import absolute_import
 import six
 import logging
 from datetime import datetime
+from django.conf import settings
 from django.utils import timezone
 
 from collections import namedtuple, OrderedDict
 
 from sentry.models import Project, Release
 from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
 from sentry.utils.hashlib import hash_values
 from sentry.utils.safe import get_path, safe_execute
 from sentry.stacktraces.functions import set_in_app, trim_function_name
@@ -21,6 +23,15 @@ StacktraceInfo.__hash__ = lambda x: id(x)
 StacktraceInfo.__eq__ = lambda a, b: a is b
 StacktraceInfo.__ne__ = lambda a, b: a is not b
 
+FRAME_CACHE_TIMEOUT = 3600
+
+# Optional process local tier of the frame cache for frames that show up in
+# many events (e.g. common framework frames).
+if settings.SENTRY_FRAME_CACHE_LOCAL_SIZE:
+    local_frame_cache = LRUCache(settings.SENTRY_FRAME_CACHE_LOCAL_SIZE, ttl=FRAME_CACHE_TIMEOUT)
+else:
+    local_frame_cache = None
+
 
 class ProcessableFrame(object):
     def __init__(self, frame, idx, processor, stacktrace_info, processable_frames):
@@ -32,6 +43,9 @@ class ProcessableFrame(object):
         self.cache_key = None
         self.cache_value = None
         self.processable_frames = processable_frames
+        # set by the processing task to write new cache values in one batch
+        # once processing is done.
+        self.pending_cache_values = None
 
     def __repr__(self):
         return "<ProcessableFrame %r #%r at %r>" % (
@@ -65,7 +79,10 @@ class ProcessableFrame(object):
 
     def set_cache_value(self, value):
         if self.cache_key is not None:
-            cache.set(self.cache_key, value, 3600)
+            if self.pending_cache_values is not None:
+                self.pending_cache_values[self.cache_key] = value
+            else:
+                store_frame_cache({self.cache_key: value})
             return True
         return False
 
@@ -80,9 +97,16 @@ class ProcessableFrame(object):
 
 
 class StacktraceProcessingTask(object):
-    def __init__(self, processable_stacktraces, processors):
+    def __init__(self, processable_stacktraces, processors, pending_cache_values=None):
         self.processable_stacktraces = processable_stacktraces
         self.processors = processors
+        self.pending_cache_values = pending_cache_values
+
+    def store_cache_values(self):
+        """Writes the cache values set on the frames in one batch."""
+        if self.pending_cache_values:
+            store_frame_cache(self.pending_cache_values)
+            self.pending_cache_values.clear()
 
     def close(self):
         for frame in self.iter_processable_frames():
@@ -414,17 +438,40 @@ def get_crash_frame_from_event_data(data, frame_filter=None):
 
 def lookup_frame_cache(keys):
     rv = {}
+    missing = []
     for key in keys:
-        rv[key] = cache.get(key)
+        value = local_frame_cache.get(key) if local_frame_cache is not None else None
+        if value is not None:
+            rv[key] = value
+        else:
+            missing.append(key)
+
+    if missing:
+        values = cache.get_many(missing)
+        if local_frame_cache is not None:
+            for key, value in six.iteritems(values):
+                if value is not None:
+                    local_frame_cache.set(key, value)
+        rv.update(values)
+
     return rv
 
 
+def store_frame_cache(values):
+    cache.set_many(values, FRAME_CACHE_TIMEOUT)
+    if local_frame_cache is not None:
+        for key, value in six.iteritems(values):
+            if value is not None:
+                local_frame_cache.set(key, value)
+
+
 def get_stacktrace_processing_task(infos, processors):
     """Returns a list of all tasks for the processors.  This can skip over
     processors that seem to not handle any frames.
     """
     by_processor = {}
     to_lookup = {}
+    pending_cache_values = {}
 
     # by_stacktrace_info requires stable sorting as it is used in
     # StacktraceProcessingTask.iter_processable_stacktraces. This is important
@@ -434,6 +481,7 @@ def get_stacktrace_processing_task(infos, processors):
     for info in infos:
         processable_frames = get_processable_frames(info, processors)
         for processable_frame in processable_frames:
+            processable_frame.pending_cache_values = pending_cache_values
             processable_frame.processor.preprocess_frame(processable_frame)
             by_processor.setdefault(processable_frame.processor, []).append(processable_frame)
             by_stacktrace_info.setdefault(processable_frame.stacktrace_info, []).append(
@@ -447,7 +495,9 @@ def get_stacktrace_processing_task(infos, processors):
         processable_frame.cache_value = frame_cache.get(cache_key)
 
     return StacktraceProcessingTask(
-        processable_stacktraces=by_stacktrace_info, processors=by_processor
+        processable_stacktraces=by_stacktrace_info,
+        processors=by_processor,
+        pending_cache_values=pending_cache_values,
     )
 
 
@@ -506,6 +556,11 @@ def process_stacktraces(data, make_processors=None, set_raw_stacktrace=True):
                 changed = True
 
     finally:
+        try:
+            processing_task.store_cache_values()
+        except Exception:
+            # Failing to cache frames must not keep processors from closing.
+            logger.exception("Failed to store frame cache values")
         for processor in processors:
             processor.close()
         processing_task.close()
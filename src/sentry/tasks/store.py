@@ -528,10 +528,15 @@ def save_attachments(cache_key, event):
 
 
 def _do_save_event(
-    cache_key=None, data=None, start_time=None, event_id=None, project_id=None, **kwargs
+    cache_key=None, data=None, start_time=None, event_id=None, project_id=None, batch=None, **kwargs
 ):
     """
     Saves an event to the database.
+
+    When an ``EventBatch`` is passed as ``batch``, writing the event to
+    nodestore and publishing it to the eventstream is left to the caller,
+    as is deleting the event from the processing cache once the batch has
+    been flushed. The saved event is returned.
     """
     from sentry.event_manager import HashDiscarded, EventManager
     from sentry import quotas
@@ -587,7 +592,7 @@ def _do_save_event(
     try:
         manager = EventManager(data)
         # event.project.organization is populated after this statement.
-        event = manager.save(project_id, assume_normalized=True)
+        event = manager.save(project_id, assume_normalized=True, batch=batch)
 
         # This is where we can finally say that we have accepted the event.
         track_outcome(
@@ -633,19 +638,102 @@ def _do_save_event(
             save_attachments(cache_key, event)
 
     finally:
-        if cache_key:
-            default_cache.delete(cache_key)
-
-            # For the unlikely case that we did not manage to persist the
-            # event we also delete the key always.
-            if event is None or features.has(
-                "organizations:event-attachments", event.project.organization, actor=None
-            ):
-                attachment_cache.delete(cache_key)
+        if cache_key and batch is None:
+            _delete_cache_keys(cache_key, event)
 
         if start_time:
             metrics.timing("events.time-to-process", time() - start_time, instance=data["platform"])
 
+    return event
+
+
+def _delete_cache_keys(cache_key, event):
+    default_cache.delete(cache_key)
+
+    # For the unlikely case that we did not manage to persist the
+    # event we also delete the key always.
+    if event is None or features.has(
+        "organizations:event-attachments", event.project.organization, actor=None
+    ):
+        attachment_cache.delete(cache_key)
+
+
+def _do_save_event_batch(items):
+    """
+    Saves several events to the database, sharing the work that doesn't
+    depend on a single event: fetching the payloads from the processing
+    cache, looking up projects and organizations, writing to nodestore and
+    publishing to the eventstream.
+
+    ``items`` is a sequence of dictionaries holding the arguments of
+    ``save_event``. Failing to save an event does not affect the others,
+    the items of the events that failed to save are returned.
+    """
+    from sentry.db.models.manager import BaseManager
+    from sentry.event_manager import EventBatch
+    from sentry.models import Organization
+
+    original_items = items
+    items = [dict(item) for item in items]
+    metrics.timing("events.save-batch.size", len(items))
+
+    cache_keys = [
+        item["cache_key"] for item in items if item.get("cache_key") and not item.get("data")
+    ]
+    if cache_keys:
+        cached = default_cache.get_many(cache_keys)
+        for item in items:
+            if not item.get("data") and item.get("cache_key") in cached:
+                item["data"] = cached[item["cache_key"]]
+
+    project_ids = set()
+    for item in items:
+        project_id = item.get("project_id") or (item.get("data") or {}).get("project")
+        if project_id is not None:
+            project_ids.add(project_id)
+
+    batch = EventBatch()
+    with BaseManager.local_cache():
+        # Fill the local cache that ``EventManager.save`` reads these from.
+        projects = Project.objects.get_many_from_cache(project_ids)
+        Organization.objects.get_many_from_cache(set(p.organization_id for p in projects))
+
+        failed = []
+        saved = []
+        for original_item, item in zip(original_items, items):
+            start = len(batch)
+            try:
+                event = _do_save_event(batch=batch, **item)
+            except Exception:
+                error_logger.exception("Failed to save event in batch")
+                failed.append(original_item)
+            else:
+                saved.append((original_item, item.get("cache_key"), event, start, len(batch)))
+
+        flush_failed = set(batch.flush())
+
+    for original_item, cache_key, event, start, end in saved:
+        if any(index in flush_failed for index in range(start, end)):
+            failed.append(original_item)
+        elif cache_key:
+            # Only drop the payload once the event has been fully written, the
+            # caller may retry failed events from the processing cache.
+            _delete_cache_keys(cache_key, event)
+
+    return failed
+
+
+def save_events_inline(items):
+    """
+    Saves events that don't need any processing in the current process,
+    skipping the processing cache and the ``save_event`` task. Used by the
+    ingest consumer, which already has the (normalized) payloads at hand.
+
+    Returns the items of the events that failed to save.
+    """
+    metrics.incr("events.save-inline", amount=len(items), skip_internal=False)
+    return _do_save_event_batch(items)
+
 
 @instrumented_task(
     name="sentry.tasks.store.save_event",
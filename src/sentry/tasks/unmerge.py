@@ -193,6 +193,7 @@ def migrate_events(
         GroupHash.objects.filter(project_id=project.id, hash__in=fingerprints).update(
             group=destination_id
         )
+        GroupHash.objects.invalidate_cache(project.id)
 
         # Create activity records for the source and destination group.
         Activity.objects.create(
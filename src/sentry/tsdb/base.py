@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import collections
+import itertools
 import six
 
 from collections import OrderedDict
@@ -380,19 +381,17 @@ class BaseTSDB(Service):
         Given a set of values (as returned from ``get_range``), roll them up
         using the ``rollup`` time (in seconds).
         """
-        normalize_ts_to_epoch = self.normalize_ts_to_epoch
-        result = {}
-        for key, points in six.iteritems(values):
-            result[key] = []
-            last_new_ts = None
-            for (ts, count) in points:
-                new_ts = normalize_ts_to_epoch(ts, rollup)
-                if new_ts == last_new_ts:
-                    result[key][-1][1] += count
-                else:
-                    result[key].append([new_ts, count])
-                    last_new_ts = new_ts
-        return result
+        # Points are sorted, so every output bucket is a run of consecutive
+        # points that normalize to the same epoch.
+        return {
+            key: [
+                [new_ts, sum(count for _, count in bucket)]
+                for new_ts, bucket in itertools.groupby(
+                    points, key=lambda p: self.normalize_ts_to_epoch(p[0], rollup)
+                )
+            ]
+            for key, points in six.iteritems(values)
+        }
 
     def record(self, model, key, values, timestamp=None, environment_id=None):
         """
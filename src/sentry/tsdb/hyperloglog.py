@@ -0,0 +1,133 @@
+"""
+Client-side handling of the raw HyperLogLog values stored by Redis.
+
+This allows merging HyperLogLogs that live on different hosts (and counting
+the result) without writing temporary keys to Redis. The register layout and
+the cardinality estimator mirror ``hyperloglog.c`` of Redis 5.
+"""
+
+from __future__ import absolute_import, division
+
+import math
+
+from six.moves import xrange
+
+P = 14
+Q = 64 - P
+REGISTERS = 1 << P
+BITS = 6
+
+HEADER_SIZE = 16
+MAGIC = b"HYLL"
+DENSE = 0
+SPARSE = 1
+
+ALPHA_INF = 0.721347520444481703680  # 1 / (2 * ln(2))
+
+
+def new_registers():
+    return bytearray(REGISTERS)
+
+
+def _merge_dense(registers, data):
+    # Every 3 bytes hold 4 consecutive 6 bit registers (least significant
+    # bits first).
+    for index in xrange(0, REGISTERS // 4):
+        offset = HEADER_SIZE + index * 3
+        b0, b1, b2 = data[offset], data[offset + 1], data[offset + 2]
+        register = index * 4
+        for value in (b0 & 63, ((b0 >> 6) | (b1 << 2)) & 63, ((b1 >> 4) | (b2 << 4)) & 63, b2 >> 2):
+            if value > registers[register]:
+                registers[register] = value
+            register += 1
+
+
+def _merge_sparse(registers, data):
+    register = 0
+    offset = HEADER_SIZE
+    size = len(data)
+    while offset < size:
+        opcode = data[offset]
+        if opcode & 0x80:
+            # VAL: 1vvvvvxx, value vvvvv + 1 repeated xx + 1 times
+            value = ((opcode >> 2) & 0x1F) + 1
+            run = (opcode & 0x3) + 1
+            for index in xrange(register, register + run):
+                if value > registers[index]:
+                    registers[index] = value
+            register += run
+            offset += 1
+        elif opcode & 0x40:
+            # XZERO: 01xxxxxx yyyyyyyy, xxxxxxyyyyyyyy + 1 empty registers
+            register += (((opcode & 0x3F) << 8) | data[offset + 1]) + 1
+            offset += 2
+        else:
+            # ZERO: 00xxxxxx, xxxxxx + 1 empty registers
+            register += (opcode & 0x3F) + 1
+            offset += 1
+
+    if register != REGISTERS:
+        raise ValueError("Invalid sparse HyperLogLog representation")
+
+
+def merge(registers, value):
+    """
+    Merge the raw HyperLogLog ``value`` (as returned by ``GET``) into
+    ``registers`` by taking the maximum of every register.
+    """
+    data = bytearray(value)
+    if data[:4] != MAGIC:
+        raise ValueError("Value is not a HyperLogLog")
+
+    encoding = data[4]
+    if encoding == DENSE:
+        _merge_dense(registers, data)
+    elif encoding == SPARSE:
+        _merge_sparse(registers, data)
+    else:
+        raise ValueError("Unknown HyperLogLog encoding: %r" % (encoding,))
+
+
+def _sigma(x):
+    if x == 1.0:
+        return float("inf")
+    y = 1.0
+    z = x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if previous == z:
+            return z
+
+
+def _tau(x):
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y = 1.0
+    z = 1 - x
+    while True:
+        x = math.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= math.pow(1 - x, 2) * y
+        if previous == z:
+            return z / 3
+
+
+def count(registers):
+    """
+    Estimate the cardinality of ``registers`` the same way ``PFCOUNT`` does.
+    """
+    histogram = [0] * (Q + 2)
+    for value in registers:
+        histogram[value] += 1
+
+    m = float(REGISTERS)
+    z = m * _tau((m - histogram[Q + 1]) / m)
+    for value in xrange(Q, 0, -1):
+        z += histogram[value]
+        z *= 0.5
+    z += m * _sigma(histogram[0] / m)
+    return int(math.floor(ALPHA_INF * m * m / z + 0.5))
@@ -3,7 +3,6 @@ from __future__ import absolute_import
 import itertools
 import logging
 import operator
-import random
 import uuid
 from binascii import crc32
 from collections import defaultdict, namedtuple
@@ -14,11 +13,11 @@ from django.utils import timezone
 from pkg_resources import resource_string
 from redis.client import Script
 
+from sentry.tsdb import hyperloglog
 from sentry.tsdb.base import BaseTSDB
 from sentry.utils.dates import to_datetime, to_timestamp
 from sentry.utils.redis import check_cluster_versions, get_cluster_from_options
 from sentry.utils.versioning import Version
-from six.moves import reduce
 
 logger = logging.getLogger(__name__)
 
@@ -106,6 +105,19 @@ class RedisTSDB(BaseTSDB):
     frequency table can be displayed as percentages of the whole data set.
     (Additional documentation and the bulk of the logic for implementing the
     frequency table API can be found in the ``cmsketch.lua`` script.)
+
+    The accuracy and storage parameters of the frequency tables can be changed
+    with the ``sketch_parameters`` option (a ``(depth, width, capacity)``
+    sequence.) Since these parameters are used to address the estimation
+    matrix, changing them for a cluster that already contains data results in
+    incorrect estimates until the existing data has expired.
+
+    When the ``enable_frequency_summaries`` option is set, ranking queries
+    spanning several rollup intervals sum up the top-N index of every interval
+    instead of estimating every candidate item in every interval within the
+    ``cmsketch.lua`` script. This is significantly cheaper for Redis, but
+    items that are not part of the (filled) index of an interval do not
+    contribute to the score of that interval.
     """
 
     DEFAULT_SKETCH_PARAMETERS = SketchParameters(3, 128, 50)
@@ -115,6 +127,10 @@ class RedisTSDB(BaseTSDB):
         self.prefix = prefix
         self.vnodes = vnodes
         self.enable_frequency_sketches = options.pop("enable_frequency_sketches", False)
+        self.enable_frequency_summaries = options.pop("enable_frequency_summaries", False)
+        self.sketch_parameters = SketchParameters(
+            *options.pop("sketch_parameters", self.DEFAULT_SKETCH_PARAMETERS)
+        )
         super(RedisTSDB, self).__init__(**options)
 
     def validate(self):
@@ -167,8 +183,14 @@ class RedisTSDB(BaseTSDB):
 
         Returns a 2-tuple that contains the hash key and the hash field.
         """
-        model_key = self.get_model_key(key)
+        return self._make_counter_key(
+            model,
+            self.normalize_to_rollup(timestamp, rollup),
+            self.get_model_key(key),
+            environment_id,
+        )
 
+    def _make_counter_key(self, model, epoch, model_key, environment_id):
         if isinstance(model_key, six.integer_types):
             vnode = model_key % self.vnodes
         else:
@@ -178,10 +200,7 @@ class RedisTSDB(BaseTSDB):
 
         return (
             u"{prefix}{model}:{epoch}:{vnode}".format(
-                prefix=self.prefix,
-                model=model.value,
-                epoch=self.normalize_to_rollup(timestamp, rollup),
-                vnode=vnode,
+                prefix=self.prefix, model=model.value, epoch=epoch, vnode=vnode
             ),
             self.add_environment_parameter(model_key, environment_id),
         )
@@ -280,27 +299,36 @@ class RedisTSDB(BaseTSDB):
         self.validate_arguments([model], [environment_id])
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
-        series = map(to_datetime, series)
+        rollup_epochs = [self.normalize_ts_to_rollup(epoch, rollup) for epoch in series]
+
+        # Counters of different keys for the same model, rollup epoch and
+        # vnode share a hash, so all of them are fetched with a single HMGET.
+        # The map client pipelines these per host.
+        fields_by_hash_key = defaultdict(list)
+        for key in keys:
+            model_key = self.get_model_key(key)
+            for index, rollup_epoch in enumerate(rollup_epochs):
+                hash_key, hash_field = self._make_counter_key(
+                    model, rollup_epoch, model_key, environment_id
+                )
+                fields_by_hash_key[hash_key].append((key, index, hash_field))
 
-        results = []
         cluster, _ = self.get_cluster(environment_id)
         with cluster.map() as client:
-            for key in keys:
-                for timestamp in series:
-                    hash_key, hash_field = self.make_counter_key(
-                        model, rollup, timestamp, key, environment_id
-                    )
-                    results.append(
-                        (to_timestamp(timestamp), key, client.hget(hash_key, hash_field))
-                    )
+            responses = [
+                (fields, client.hmget(hash_key, [hash_field for _, _, hash_field in fields]))
+                for hash_key, fields in six.iteritems(fields_by_hash_key)
+            ]
 
-        results_by_key = defaultdict(dict)
-        for epoch, key, count in results:
-            results_by_key[key][epoch] = int(count.value or 0)
+        counts_by_key = {key: [0] * len(series) for key in keys}
+        for fields, promise in responses:
+            for (key, index, _), count in zip(fields, promise.value):
+                if count is not None:
+                    counts_by_key[key][index] = int(count)
 
-        for key, points in six.iteritems(results_by_key):
-            results_by_key[key] = sorted(points.items())
-        return dict(results_by_key)
+        # Same as ``to_timestamp(to_datetime(epoch))``.
+        timestamps = [float(epoch) for epoch in series]
+        return {key: list(zip(timestamps, counts)) for key, counts in six.iteritems(counts_by_key)}
 
     def merge(self, model, destination, sources, timestamp=None, environment_ids=None):
         environment_ids = (set(environment_ids) if environment_ids is not None else set()).union(
@@ -472,76 +500,31 @@ class RedisTSDB(BaseTSDB):
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
 
-        temporary_id = uuid.uuid1().hex
-
-        def make_temporary_key(key):
-            return u"{}{}:{}".format(self.prefix, temporary_id, key)
+        cluster, _ = self.get_cluster(environment_id)
+        router = cluster.get_router()
 
-        def expand_key(key):
-            """
-            Return a list containing all keys for each interval in the series for a key.
-            """
-            return [
+        # The HyperLogLogs of a key live on the host of the key (see
+        # ``record_multi``.) Fetch all raw values of each host with one MGET
+        # and merge them here, so that nothing is written while reading.
+        hosts = defaultdict(list)
+        for key in keys:
+            hosts[router.get_host_for_key(key)].extend(
                 self.make_key(model, rollup, timestamp, key, environment_id) for timestamp in series
+            )
+
+        with cluster.fanout() as client:
+            responses = [
+                (host, client.target([host]).mget(host_keys))
+                for host, host_keys in six.iteritems(hosts)
             ]
 
-        cluster, _ = self.get_cluster(environment_id)
-        router = cluster.get_router()
+        registers = hyperloglog.new_registers()
+        for host, promise in responses:
+            for value in promise.value[host]:
+                if value is not None:
+                    hyperloglog.merge(registers, value)
 
-        def map_key_to_host(hosts, key):
-            """
-            Identify the host where a key is located and add it to the host map.
-            """
-            hosts[router.get_host_for_key(key)].add(key)
-            return hosts
-
-        def get_partition_aggregate(value):
-            """
-            Fetch the HyperLogLog value (in its raw byte representation) that
-            results from merging all HyperLogLogs at the provided keys.
-            """
-            (host, keys) = value
-            destination = make_temporary_key(u"p:{}".format(host))
-            client = cluster.get_local_client(host)
-            with client.pipeline(transaction=False) as pipeline:
-                pipeline.execute_command(
-                    "PFMERGE", destination, *itertools.chain.from_iterable(map(expand_key, keys))
-                )
-                pipeline.get(destination)
-                pipeline.delete(destination)
-                return (host, pipeline.execute()[1])
-
-        def merge_aggregates(values):
-            """
-            Calculate the cardinality of the provided HyperLogLog values.
-            """
-            destination = make_temporary_key("a")  # all values will be merged into this key
-            aggregates = {make_temporary_key(u"a:{}".format(host)): value for host, value in values}
-
-            # Choose a random host to execute the reduction on. (We use a host
-            # here that we've already accessed as part of this process -- this
-            # way, we constrain the choices to only hosts that we know are
-            # running.)
-            client = cluster.get_local_client(random.choice(values)[0])
-            with client.pipeline(transaction=False) as pipeline:
-                pipeline.mset(aggregates)
-                pipeline.execute_command("PFMERGE", destination, *aggregates.keys())
-                pipeline.execute_command("PFCOUNT", destination)
-                pipeline.delete(destination, *aggregates.keys())
-                return pipeline.execute()[2]
-
-        # TODO: This could be optimized to skip the intermediate step for the
-        # host that has the largest number of keys if the final merge and count
-        # is performed on that host. If that host contains *all* keys, the
-        # final reduction could be performed as a single PFCOUNT, skipping the
-        # MSET and PFMERGE operations entirely.
-
-        return merge_aggregates(
-            [
-                get_partition_aggregate(x)
-                for x in reduce(map_key_to_host, keys, defaultdict(set)).items()
-            ]
-        )
+        return hyperloglog.count(registers)
 
     def merge_distinct_counts(
         self, model, destination, sources, timestamp=None, environment_ids=None
@@ -680,7 +663,7 @@ class RedisTSDB(BaseTSDB):
                         for k in chunk:
                             expirations[k] = expiry
 
-                    arguments = ["INCR"] + list(self.DEFAULT_SKETCH_PARAMETERS)
+                    arguments = ["INCR"] + list(self.sketch_parameters)
                     for member, score in items.items():
                         arguments.extend((score, member))
 
@@ -707,7 +690,12 @@ class RedisTSDB(BaseTSDB):
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
 
-        arguments = ["RANKED"] + list(self.DEFAULT_SKETCH_PARAMETERS)
+        if self.enable_frequency_summaries and len(series) > 1:
+            return self.get_most_frequent_from_summaries(
+                model, keys, rollup, series, limit, environment_id
+            )
+
+        arguments = ["RANKED"] + list(self.sketch_parameters)
         if limit is not None:
             arguments.append(int(limit))
 
@@ -727,6 +715,42 @@ class RedisTSDB(BaseTSDB):
 
         return results
 
+    def get_frequency_summary_commands(self, model, key, rollup, series, limit, environment_id):
+        # The index of a sketch is a sorted set of its most frequently observed
+        # items, so ranking a single interval doesn't require the script.
+        commands = []
+        for timestamp in series:
+            index, _ = self.make_frequency_table_keys(model, rollup, timestamp, key, environment_id)
+            commands.append(("ZREVRANGE", index, 0, limit - 1, "WITHSCORES"))
+        return commands
+
+    def unpack_frequency_summary(self, response):
+        members = response.value
+        return [(members[i], float(members[i + 1])) for i in range(0, len(members), 2)]
+
+    def get_most_frequent_from_summaries(self, model, keys, rollup, series, limit, environment_id):
+        commands = {}
+        for key in keys:
+            commands[key] = self.get_frequency_summary_commands(
+                model, key, rollup, series, self.sketch_parameters.capacity, environment_id
+            )
+
+        if limit is None:
+            limit = self.sketch_parameters.capacity
+
+        results = {}
+        cluster, _ = self.get_cluster(environment_id)
+        for key, responses in cluster.execute_commands(commands).items():
+            scores = defaultdict(float)
+            for response in responses:
+                for member, score in self.unpack_frequency_summary(response):
+                    scores[member] += score
+            results[key] = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[
+                : int(limit)
+            ]
+
+        return results
+
     def get_most_frequent_series(
         self, model, keys, start, end=None, rollup=None, limit=None, environment_id=None
     ):
@@ -737,23 +761,17 @@ class RedisTSDB(BaseTSDB):
 
         rollup, series = self.get_optimal_rollup_series(start, end, rollup)
 
-        arguments = ["RANKED"] + list(self.DEFAULT_SKETCH_PARAMETERS)
-        if limit is not None:
-            arguments.append(int(limit))
+        if limit is None:
+            limit = self.sketch_parameters.capacity
 
         commands = {}
         for key in keys:
-            commands[key] = [
-                (
-                    CountMinScript,
-                    self.make_frequency_table_keys(model, rollup, timestamp, key, environment_id),
-                    arguments,
-                )
-                for timestamp in series
-            ]
+            commands[key] = self.get_frequency_summary_commands(
+                model, key, rollup, series, int(limit), environment_id
+            )
 
         def unpack_response(response):
-            return {item: float(score) for item, score in response.value}
+            return dict(self.unpack_frequency_summary(response))
 
         results = {}
         cluster, _ = self.get_cluster(environment_id)
@@ -779,7 +797,7 @@ class RedisTSDB(BaseTSDB):
 
         commands = {}
 
-        arguments = ["ESTIMATE"] + list(self.DEFAULT_SKETCH_PARAMETERS)
+        arguments = ["ESTIMATE"] + list(self.sketch_parameters)
         for key, members in items.items():
             ks = []
             for timestamp in series:
@@ -851,7 +869,7 @@ class RedisTSDB(BaseTSDB):
                                     model, rollup, to_timestamp(timestamp), source, environment_id
                                 )
                             )
-                        arguments = ["EXPORT"] + list(self.DEFAULT_SKETCH_PARAMETERS)
+                        arguments = ["EXPORT"] + list(self.sketch_parameters)
                         exports[source].extend([(CountMinScript, keys, arguments), ["DEL"] + keys])
 
             try:
@@ -879,7 +897,7 @@ class RedisTSDB(BaseTSDB):
                                         destination,
                                         environment_id,
                                     ),
-                                    ["IMPORT"] + list(self.DEFAULT_SKETCH_PARAMETERS) + [payload],
+                                    ["IMPORT"] + list(self.sketch_parameters) + [payload],
                                 )
                             )
                         next(results)  # pop off the result of DEL
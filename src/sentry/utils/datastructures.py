@@ -1,6 +1,9 @@
 from __future__ import absolute_import
 
-from collections import Hashable, MutableMapping
+import threading
+import time
+
+from collections import Hashable, MutableMapping, OrderedDict
 
 __unset__ = object()
 
@@ -61,3 +64,93 @@ class BidirectionalMapping(MutableMapping):
 
     def inverse(self):
         return self.__inverse.copy()
+
+
+class LRUCache(object):
+    """\
+    A thread safe, size bounded cache that evicts the least recently used
+    entries first.
+
+    By default every entry has a size of 1 (so ``maxsize`` is the maximum
+    number of entries), a ``getsize`` function can be provided to weigh
+    entries differently (e.g. by their size in bytes.) Entries that are larger
+    than ``maxsize`` by themselves are never stored. When ``ttl`` is provided,
+    entries expire that many seconds after they have been set.
+
+    The ``hits`` and ``misses`` attributes count the results of ``get``,
+    ``evictions`` counts the entries that had to be evicted to make room.
+    """
+
+    def __init__(self, maxsize, ttl=None, getsize=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.getsize = getsize
+        self.timer = timer
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__data = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return self.get(key, __unset__) is not __unset__
+
+    def get(self, key, default=None):
+        with self.__lock:
+            try:
+                value, size, expires = self.__data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= self.timer():
+                self.size -= size
+                self.misses += 1
+                return default
+
+            # Re-insert the entry to mark it as the most recently used one.
+            self.__data[key] = (value, size, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Stores ``value`` and returns the number of entries that were evicted
+        to make room for it.
+        """
+        size = self.getsize(value) if self.getsize is not None else 1
+        expires = self.timer() + self.ttl if self.ttl is not None else None
+
+        with self.__lock:
+            previous = self.__data.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+
+            if size > self.maxsize:
+                return 0
+
+            self.__data[key] = (value, size, expires)
+            self.size += size
+
+            evictions = 0
+            while self.size > self.maxsize:
+                _, (_, evicted_size, _) = self.__data.popitem(last=False)
+                self.size -= evicted_size
+                evictions += 1
+            self.evictions += evictions
+            return evictions
+
+    def delete(self, key):
+        with self.__lock:
+            previous = self.__data.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+
+    def clear(self):
+        with self.__lock:
+            self.__data.clear()
+            self.size = 0
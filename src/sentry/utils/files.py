@@ -16,6 +16,18 @@ def compress_file(fp, level=6):
     return (b"".join(z_chunks) + compressor.flush(), b"".join(chunks))
 
 
+def iter_file(fp, chunk_size=4096):
+    """
+    Yields the contents of ``fp`` in chunks (e.g. for a streaming response)
+    and closes it once exhausted, or when the generator is closed early.
+    """
+    try:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            yield chunk
+    finally:
+        fp.close()
+
+
 def get_max_file_size(organization):
     """Returns the maximum allowed debug file size for this organization."""
     if features.has("organizations:large-debug-files", organization):
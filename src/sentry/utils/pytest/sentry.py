@@ -80,6 +80,10 @@ def pytest_configure(config):
     settings.SENTRY_TSDB = "sentry.tsdb.inmemory.InMemoryTSDB"
     settings.SENTRY_TSDB_OPTIONS = {}
 
+    # Source files would otherwise be fetched on other threads, which can't
+    # see the data of the test transaction.
+    settings.SENTRY_SOURCE_FETCH_CONCURRENCY = 1
+
     if settings.SENTRY_NEWSLETTER == "sentry.newsletter.base.Newsletter":
         settings.SENTRY_NEWSLETTER = "sentry.newsletter.dummy.DummyNewsletter"
         settings.SENTRY_NEWSLETTER_OPTIONS = {}
@@ -248,4 +252,8 @@ def pytest_runtest_teardown(item):
     for model in (OrganizationOption, ProjectOption, UserOption):
         model.objects.clear_local_cache()
 
+    from sentry.utils.relations import relations_cache
+
+    relations_cache.clear()
+
     Hub.main.bind_client(None)
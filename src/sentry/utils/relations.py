@@ -0,0 +1,53 @@
+from __future__ import absolute_import
+
+from django.conf import settings
+
+from sentry.utils import metrics
+from sentry.utils.cache import cache
+from sentry.utils.datastructures import LRUCache
+
+
+class RelationsCache(object):
+    """
+    A process local LRU cache in front of the Django cache.
+
+    Meant for rows that are looked up (or upserted) while saving (almost)
+    every event, so that repeated combinations of e.g. group, release and
+    environment do not require any network round trips. Any value other than
+    ``None`` can be cached, including negative entries. Since deletions only
+    invalidate the local cache of the process performing them, entries are
+    only kept locally for a limited amount of time.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.local = LRUCache(maxsize, ttl=ttl)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.incr("relations.cache", tags={"result": "local"}, skip_internal=True)
+            return value
+
+        value = cache.get(key)
+        if value is not None:
+            metrics.incr("relations.cache", tags={"result": "shared"}, skip_internal=True)
+            self.local.set(key, value)
+        else:
+            metrics.incr("relations.cache", tags={"result": "miss"}, skip_internal=True)
+        return value
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout)
+        self.local.set(key, value)
+
+    def delete(self, key):
+        cache.delete(key)
+        self.local.delete(key)
+
+    def clear(self):
+        self.local.clear()
+
+
+relations_cache = RelationsCache(
+    settings.SENTRY_RELATIONS_CACHE_SIZE, settings.SENTRY_RELATIONS_CACHE_TTL
+)
@@ -65,3 +65,29 @@ class BufferTest(TestCase):
         self.buf.process(ReleaseProject, columns, filters)
         release_project_ = ReleaseProject.objects.get(id=release_project.id)
         assert release_project_.new_groups == 1
+
+    @mock.patch("sentry.buffer.base.buffer_incr_complete")
+    def test_process_batch_saves_data(self, buffer_incr_complete):
+        group1 = Group.objects.create(project=Project(id=1))
+        group2 = Group.objects.create(project=Project(id=1))
+        self.buf.process_batch(
+            [
+                (Group, {"times_seen": 1}, {"id": group1.id}, None),
+                (Group, {"times_seen": 2}, {"id": group2.id}, None),
+                (Group, {"times_seen": 1}, {"message": "foo bar", "project_id": 1}, None),
+            ]
+        )
+        assert Group.objects.get(id=group1.id).times_seen == group1.times_seen + 1
+        assert Group.objects.get(id=group2.id).times_seen == group2.times_seen + 2
+        assert Group.objects.get(message="foo bar").times_seen == 2
+        assert len(buffer_incr_complete.send_robust.mock_calls) == 3
+
+    def test_process_batch_isolates_failures(self):
+        group = Group.objects.create(project=Project(id=1))
+        self.buf.process_batch(
+            [
+                (Group, {"times_seen": 1}, {"id": group.id}, None),
+                (Group, {"does_not_exist": 1}, {"id": group.id}, None),
+            ]
+        )
+        assert Group.objects.get(id=group.id).times_seen == group.times_seen + 1
@@ -0,0 +1,41 @@
+from __future__ import absolute_import
+
+from datetime import datetime
+from decimal import Decimal
+from django.utils import timezone
+
+from sentry.buffer import codec
+from sentry.event_manager import ScoreClause
+from sentry.models import Project
+from sentry.testutils import TestCase
+
+
+class BufferCodecTest(TestCase):
+    def test_roundtrip_primitives(self):
+        value = {"pk": 1, "name": u"”", "score": 1.5, "data": {"metadata": {"foo": [1, 2]}}}
+        payload = codec.encode(value)
+        assert codec.is_encoded(payload)
+        assert codec.decode(payload) == value
+
+    def test_roundtrip_datetime(self):
+        aware = datetime(2017, 5, 3, 6, 6, 6, 123456, tzinfo=timezone.utc)
+        naive = datetime(2017, 5, 3, 6, 6, 6)
+        assert codec.decode(codec.encode(aware)) == aware
+        assert codec.decode(codec.encode(naive)) == naive
+
+    def test_roundtrip_decimal(self):
+        assert codec.decode(codec.encode(Decimal("1.10"))) == Decimal("1.10")
+
+    def test_roundtrip_model(self):
+        rv = codec.decode(codec.encode({"project": Project(id=1)}))
+        assert isinstance(rv["project"], Project)
+        assert rv["project"].id == 1
+
+    def test_pickle_fallback(self):
+        rv = codec.decode(codec.encode(ScoreClause(times_seen=1)))
+        assert isinstance(rv, ScoreClause)
+        assert rv.times_seen == 1
+
+    def test_legacy_payloads_are_not_encoded(self):
+        assert not codec.is_encoded("(dp1\nS'pk'\np2\nI1\ns.")
+        assert not codec.is_encoded('{"pk": ["i","1"]}')
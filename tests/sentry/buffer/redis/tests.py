@@ -2,14 +2,15 @@
 
 from __future__ import absolute_import
 
-import pytest
 import mock
 
 from datetime import datetime
 from django.utils import timezone
-from sentry.buffer.redis import RedisBuffer
+from sentry.buffer import codec
+from sentry.buffer.redis import RedisBuffer, batch_buffers_incr
 from sentry.models import Group, Project
 from sentry.testutils import TestCase
+from sentry.utils.compat import pickle
 
 
 class RedisBufferTest(TestCase):
@@ -89,11 +90,30 @@ class RedisBufferTest(TestCase):
         self.buf.process("foo")
         process.assert_called_once_with(Group, columns, filters, extra)
 
-    # this test should be passing once we no longer serialize using pickle
-    @pytest.mark.xfail
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.base.Buffer.process")
+    def test_process_does_bubble_up_codec(self, process):
+        now = datetime(2017, 5, 3, 6, 6, 6, tzinfo=timezone.utc)
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo",
+            {
+                "e+foo": codec.encode("bar"),
+                "e+datetime": codec.encode(now),
+                "f": codec.encode({"pk": 1}),
+                "i+times_seen": "2",
+                "m": "sentry.models.Group",
+            },
+        )
+        self.buf.process("foo")
+        process.assert_called_once_with(
+            Group, {"times_seen": 2}, {"pk": 1}, {"foo": "bar", "datetime": now}
+        )
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.redis.process_incr", mock.Mock())
     def test_incr_saves_to_redis(self):
+        self.buf.legacy_pickle_writes = False
         now = datetime(2017, 5, 3, 6, 6, 6, tzinfo=timezone.utc)
         client = self.buf.cluster.get_routing_client()
         model = mock.Mock()
@@ -102,27 +122,33 @@ class RedisBufferTest(TestCase):
         filters = {"pk": 1, "datetime": now}
         self.buf.incr(model, columns, filters, extra={"foo": "bar", "datetime": now})
         result = client.hgetall("foo")
-        assert result == {
-            "e+foo": '["s","bar"]',
-            "e+datetime": '["d","1493791566.000000"]',
-            "f": '{"pk":["i","1"],"datetime":["d","1493791566.000000"]}',
-            "i+times_seen": "1",
-            "m": "mock.mock.Mock",
-        }
+        assert sorted(result) == ["e+datetime", "e+foo", "f", "i+times_seen", "m"]
+        assert codec.decode(result["e+foo"]) == "bar"
+        assert codec.decode(result["e+datetime"]) == now
+        assert codec.decode(result["f"]) == filters
+        assert result["i+times_seen"] == "1"
+        assert result["m"] == "mock.mock.Mock"
         pending = client.zrange("b:p", 0, -1)
         assert pending == ["foo"]
         self.buf.incr(model, columns, filters, extra={"foo": "baz"})
         result = client.hgetall("foo")
-        assert result == {
-            "e+foo": '["s","baz"]',
-            "e+datetime": '["d","1493791566.000000"]',
-            "f": '{"pk":["i","1"],"datetime":["d","1493791566.000000"]}',
-            "i+times_seen": "2",
-            "m": "mock.mock.Mock",
-        }
+        assert codec.decode(result["e+foo"]) == "baz"
+        assert codec.decode(result["e+datetime"]) == now
+        assert result["i+times_seen"] == "2"
         pending = client.zrange("b:p", 0, -1)
         assert pending == ["foo"]
 
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    @mock.patch("sentry.buffer.redis.process_incr", mock.Mock())
+    def test_incr_legacy_pickle_writes(self):
+        client = self.buf.cluster.get_routing_client()
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1}, extra={"foo": "bar"})
+        assert client.hget("foo", "e+foo") == "S'bar'\np1\n."
+
+        # the default writes can be read by workers that don't know the codec
+        assert pickle.loads(client.hget("foo", "f")) == {"pk": 1}
+        assert pickle.loads(client.hget("foo", "e+foo")) == "bar"
+
     @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
     @mock.patch("sentry.buffer.redis.process_incr")
     @mock.patch("sentry.buffer.redis.process_pending")
@@ -168,3 +194,145 @@ class RedisBufferTest(TestCase):
 
         # Make sure we didn't queue up more
         assert len(process_pending.apply_async.mock_calls) == 2
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    def test_incr_coalesces_until_max_keys(self):
+        self.buf.coalesce_max_keys = 2
+        self.buf.coalesce_max_age = 60
+        client = self.buf.cluster.get_routing_client()
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1})
+        self.buf.incr(Group, {"times_seen": 2}, {"pk": 1})
+        assert client.hgetall("foo") == {}
+        assert client.zrange("b:p", 0, -1) == []
+
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 2})
+        assert client.hget("foo", "i+times_seen") == "4"
+        assert client.zrange("b:p", 0, -1) == ["foo"]
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._make_key", mock.Mock(return_value="foo"))
+    def test_flush_writes_coalesced_incrs(self):
+        self.buf.legacy_pickle_writes = False
+        self.buf.coalesce_max_keys = 100
+        self.buf.coalesce_max_age = 60
+        client = self.buf.cluster.get_routing_client()
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1}, extra={"foo": "bar"})
+        self.buf.incr(Group, {"times_seen": 1}, {"pk": 1}, extra={"foo": "baz"})
+        assert client.hgetall("foo") == {}
+
+        self.buf.flush()
+        assert client.hget("foo", "i+times_seen") == "2"
+        assert codec.decode(client.hget("foo", "e+foo")) == "baz"
+        assert client.zrange("b:p", 0, -1) == ["foo"]
+
+        # nothing left to flush
+        client.delete("foo")
+        self.buf.flush()
+        assert client.hgetall("foo") == {}
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer.incr_multi")
+    def test_batch_buffers_incr_merges_per_key(self, incr_multi):
+        with mock.patch("sentry.app.buffer", self.buf):
+            with batch_buffers_incr():
+                self.buf.incr(Group, {"times_seen": 1}, {"pk": 1}, extra={"foo": "bar"})
+                self.buf.incr(Group, {"times_seen": 2}, {"pk": 1}, extra={"baz": "qux"})
+                self.buf.incr(Group, {"times_seen": 1}, {"pk": 2})
+
+        (items,), _ = incr_multi.call_args
+        assert sorted(items, key=lambda item: item[2]["pk"]) == [
+            (Group, {"times_seen": 3}, {"pk": 1}, {"foo": "bar", "baz": "qux"}),
+            (Group, {"times_seen": 1}, {"pk": 2}, None),
+        ]
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer.process_batch")
+    def test_process_batch_keys(self, process_batch):
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo", {"f": codec.encode({"pk": 1}), "i+times_seen": "2", "m": "sentry.models.Group"},
+        )
+        client.hmset(
+            "bar", {"f": codec.encode({"pk": 2}), "i+times_seen": "1", "m": "sentry.models.Group"},
+        )
+        client.zadd("b:p", 1, "foo")
+        client.zadd("b:p", 2, "bar")
+        # locked by someone else
+        client.set("l:baz", "1")
+
+        self.buf.process(batch_keys=["foo", "bar", "baz", "qux"])
+
+        (items,), _ = process_batch.call_args
+        assert sorted(items, key=lambda item: item[2]["pk"]) == [
+            (Group, {"times_seen": 2}, {"pk": 1}, {}),
+            (Group, {"times_seen": 1}, {"pk": 2}, {}),
+        ]
+        assert client.exists("foo") is False
+        assert client.exists("bar") is False
+        assert client.zrange("b:p", 0, -1) == []
+        assert client.get("l:foo") is None
+        assert client.get("l:baz") == "1"
+
+    def test_process_batch_keys_fallback(self):
+        group = self.create_group(times_seen=1)
+        group2 = self.create_group(times_seen=1)
+        client = self.buf.cluster.get_routing_client()
+        client.hmset(
+            "foo",
+            {"f": codec.encode({"pk": group.id}), "i+times_seen": "2", "m": "sentry.models.Group"},
+        )
+        client.hmset(
+            "bar",
+            {"f": codec.encode({"pk": group2.id}), "i+times_seen": "1", "m": "sentry.models.Group"},
+        )
+
+        process_update = self.buf._process_update
+        failed = []
+
+        def fail_once(*args):
+            if not failed:
+                failed.append(args)
+                raise Exception("boom")
+            return process_update(*args)
+
+        with mock.patch.object(self.buf, "_process_update", side_effect=fail_once):
+            self.buf.process(batch_keys=["foo", "bar"])
+
+        # the bulk write failed, so the rows are written one by one instead
+        assert len(failed) == 1
+        assert Group.objects.get(id=group.id).times_seen == 3
+        assert Group.objects.get(id=group2.id).times_seen == 2
+        assert client.exists("foo") is False
+        assert client.exists("bar") is False
+
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_chunked(self, process_incr):
+        self.buf.incr_batch_size = 2
+        self.buf.pending_chunk_size = 2
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", 1, "foo")
+            client.zadd("b:p", 2, "bar")
+            client.zadd("b:p", 3, "baz")
+        self.buf.process_pending()
+        assert process_incr.apply_async.mock_calls == [
+            mock.call(kwargs={"batch_keys": ["foo", "bar"]}),
+            mock.call(kwargs={"batch_keys": ["baz"]}),
+        ]
+        client = self.buf.cluster.get_routing_client()
+        assert client.zrange("b:p", 0, -1) == []
+
+    @mock.patch("sentry.buffer.redis.RedisBuffer._get_process_incr_queue_size")
+    @mock.patch("sentry.buffer.redis.process_incr")
+    def test_process_pending_chunked_backpressure(self, process_incr, get_queue_size):
+        self.buf.incr_batch_size = 1
+        self.buf.pending_chunk_size = 1
+        self.buf.pending_max_queue_size = 2
+        get_queue_size.side_effect = [0, 1, 2]
+        with self.buf.cluster.map() as client:
+            client.zadd("b:p", 1, "foo")
+            client.zadd("b:p", 2, "bar")
+            client.zadd("b:p", 3, "baz")
+        self.buf.process_pending()
+        assert process_incr.apply_async.mock_calls == [
+            mock.call(kwargs={"batch_keys": ["foo"]}),
+            mock.call(kwargs={"batch_keys": ["bar"]}),
+        ]
+        client = self.buf.cluster.get_routing_client()
+        assert client.zrange("b:p", 0, -1) == ["baz"]
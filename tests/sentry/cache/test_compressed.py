@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from sentry.cache.compressed import CompressedCache
+from sentry.cache.django import DjangoCache
+from sentry.testutils import TestCase
+
+
+class CompressedCacheTest(TestCase):
+    def setUp(self):
+        self.backend = CompressedCache(
+            "sentry.cache.django.DjangoCache", compress_threshold=100, chunk_size=64
+        )
+
+    def test_small_value(self):
+        self.backend.set("foo", {"foo": u"bär"}, 50)
+        assert self.backend.get("foo") == {"foo": u"bär"}
+        assert self.backend.inner.get("foo", raw=True).startswith(b"j")
+
+        self.backend.delete("foo")
+        assert self.backend.get("foo") is None
+
+    def test_compressed_value(self):
+        value = {"foo": "x" * 100}
+        self.backend.chunk_size = 1024
+        self.backend.set("foo", value, 50)
+        assert self.backend.get("foo") == value
+        assert self.backend.inner.get("foo", raw=True).startswith(b"z")
+
+    def test_chunked_value(self):
+        value = {"foo": [str(i) for i in range(100)]}
+        self.backend.set("foo", value, 50)
+        assert self.backend.inner.get("foo", raw=True).startswith(b"c")
+        assert self.backend.inner.get("foo:c:0", raw=True) is not None
+        assert self.backend.get("foo") == value
+
+        self.backend.delete("foo")
+        assert self.backend.get("foo") is None
+        assert self.backend.inner.get("foo:c:0", raw=True) is None
+
+    def test_chunked_value_with_missing_chunk(self):
+        self.backend.set("foo", {"foo": [str(i) for i in range(100)]}, 50)
+        self.backend.inner.delete("foo:c:1")
+        assert self.backend.get("foo") is None
+
+    def test_many(self):
+        values = {"foo": {"foo": "bar"}, "bar": {"bar": [str(i) for i in range(100)]}}
+        self.backend.set_many(values, 50)
+        assert self.backend.get_many(["foo", "bar", "baz"]) == values
+
+    def test_raw(self):
+        self.backend.set("foo", b"x" * 200, 50, raw=True)
+        assert self.backend.get("foo", raw=True) == b"x" * 200
+
+    def test_reads_values_of_inner_backend(self):
+        DjangoCache().set("foo", {"foo": "bar"}, 50)
+        assert self.backend.get("foo") == {"foo": "bar"}
@@ -23,3 +23,13 @@ class RedisCacheTest(TestCase):
 
         with self.assertRaises(ValueTooLarge):
             self.backend.set("foo", "x" * (RedisCache.max_size + 1), 0)
+
+    def test_many(self):
+        self.backend.set_many({"foo": {"foo": "bar"}, "bar": [1, 2]}, 50)
+
+        result = self.backend.get_many(["foo", "bar", "baz"])
+        assert result == {"foo": {"foo": "bar"}, "bar": [1, 2]}
+
+        with self.assertRaises(ValueTooLarge):
+            self.backend.set_many({"baz": 1, "qux": "x" * (RedisCache.max_size + 1)}, 0)
+        assert self.backend.get("baz") is None
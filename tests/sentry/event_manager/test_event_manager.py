@@ -15,7 +15,7 @@ from time import time
 from sentry import nodestore
 from sentry.app import tsdb
 from sentry.constants import MAX_VERSION_LENGTH
-from sentry.event_manager import HashDiscarded, EventManager, EventUser
+from sentry.event_manager import EventBatch, HashDiscarded, EventManager, EventUser
 from sentry.grouping.utils import hash_from_values
 from sentry.models import (
     Activity,
@@ -103,6 +103,68 @@ class EventManagerTest(TestCase):
 
         assert eventstream_insert.call_count == 2
 
+    @mock.patch("sentry.event_manager.eventstream.insert")
+    def test_batch(self, eventstream_insert):
+        batch = EventBatch()
+        events = []
+        for message in ("first", "second"):
+            manager = EventManager(make_event(message=message))
+            manager.normalize()
+            events.append(manager.save(self.project.id, batch=batch))
+
+        node_ids = [event.data.id for event in events]
+        assert nodestore.get_multi(node_ids) == {node_id: None for node_id in node_ids}
+        assert eventstream_insert.call_count == 0
+
+        assert batch.flush() == []
+
+        assert [nodestore.get(node_id)["logentry"]["formatted"] for node_id in node_ids] == [
+            "first",
+            "second",
+        ]
+        assert [call[1]["event"] for call in eventstream_insert.call_args_list] == events
+
+    @mock.patch("sentry.event_manager.eventstream.insert")
+    @mock.patch("sentry.event_manager.nodestore.set_multi")
+    def test_batch_failures(self, set_multi, eventstream_insert):
+        batch = EventBatch()
+        events = []
+        for message in ("first", "second", "third"):
+            manager = EventManager(make_event(message=message))
+            manager.normalize()
+            events.append(manager.save(self.project.id, batch=batch))
+
+        set_multi.side_effect = Exception("boom")
+
+        def insert(event, **kwargs):
+            if event is events[2]:
+                raise Exception("boom")
+
+        eventstream_insert.side_effect = insert
+
+        with mock.patch.object(events[1].data, "save", side_effect=Exception("boom")):
+            assert batch.flush() == [1, 2]
+
+        assert nodestore.get(events[0].data.id)["logentry"]["formatted"] == "first"
+        assert nodestore.get(events[1].data.id) is None
+
+    def test_cached_hash_of_deleted_group(self):
+        def save(event_id):
+            manager = EventManager(make_event(event_id=event_id, checksum="a" * 32))
+            manager.normalize()
+            return manager.save(self.project.id)
+
+        save("a" * 32)
+        group = save("b" * 32).group
+
+        # the hash is now cached, delete the group without invalidating it
+        GroupHash.objects.filter(group=group).delete()
+        Group.objects.filter(id=group.id).delete()
+
+        event = save("c" * 32)
+        assert event.group_id != group.id
+        assert GroupHash.objects.get(project=self.project, hash="a" * 32).group_id == event.group_id
+
     def test_updates_group(self):
         timestamp = time() - 300
         manager = EventManager(
@@ -199,3 +199,64 @@ def test_package_matching():
     assert not bool(
         bundled_rule.get_matching_frame_actions({"package": "/usr/lib/linux-gate.so"}, "native")
     )
+
+
+def test_compiled_rules_match_like_rules():
+    enhancement = Enhancements.from_config_string(
+        """
+        family:native function:std::*                  -app
+        family:native module:core::*                   -app
+        family:native function:panic                   -group
+        family:javascript path:**/test.js app:yes      +app
+        function:std::*                                +group
+    """,
+        bases=["common:v1"],
+    )
+    compiled = enhancement._get_compiled_rules()
+    rules = list(enhancement.iter_rules())
+
+    frames = [
+        ({"function": "std::whatever", "in_app": True}, "native"),
+        ({"function": "panic"}, "native"),
+        ({"function": "panic"}, "javascript"),
+        ({"module": "core::fmt", "function": "main"}, "native"),
+        ({"abs_path": "http://example.com/foo/TEST.js", "in_app": True}, "javascript"),
+        ({"abs_path": "http://example.com/foo/TEST.js", "in_app": False}, "javascript"),
+    ]
+    for frame, platform in frames:
+        matching = compiled.get_matching_rules(compiled.get_frame_values(frame, platform))
+        assert matching == set(
+            idx
+            for idx, rule in enumerate(rules)
+            if rule.get_matching_frame_actions(frame, platform)
+        )
+        # the second lookup is answered from the cache
+        assert compiled.get_matching_rules(compiled.get_frame_values(frame, platform)) == matching
+
+
+def test_apply_modifications_sees_in_app_changes():
+    enhancement = Enhancements.from_config_string(
+        """
+        function:foo                                   +app
+        function:foo app:yes                           v-app
+    """
+    )
+
+    frames = [{"function": "bar"}, {"function": "foo"}, {"function": "foo"}]
+    enhancement.apply_modifications_to_frame(frames, "native")
+
+    # the second rule only matches after the first one marked the frames as
+    # in-app, and then marks all frames below them out of app.
+    assert [frame["in_app"] for frame in frames] == [False, False, True]
+
+
+def test_loads_is_cached():
+    enhancement = Enhancements.from_config_string("function:foo +app", bases=["common:v1"])
+    dumped = enhancement.dumps()
+
+    loaded = Enhancements.loads(dumped)
+    assert loaded._to_config_structure() == enhancement._to_config_structure()
+    assert Enhancements.loads(dumped) is loaded
+
+    default = Enhancements(rules=[], bases=["common:v1"])
+    assert Enhancements.loads(default.dumps()) is Enhancements.loads(default.dumps())
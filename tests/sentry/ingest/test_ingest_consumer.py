@@ -3,15 +3,26 @@ from __future__ import absolute_import
 import datetime
 import time
 import logging
+import mock
 import msgpack
 import pytest
 
 from django.conf import settings
+from django.core.cache import cache
 
+from sentry.cache import default_cache
 from sentry.event_manager import EventManager
-from sentry.ingest.ingest_consumer import ConsumerType, get_ingest_consumer
+from sentry.ingest.ingest_consumer import (
+    ConsumerType,
+    IngestConsumerWorker,
+    MultiprocessIngestConsumerWorker,
+    _process_partition_batch,
+    get_ingest_consumer,
+)
 from sentry.models.event import Event
+from sentry.testutils.helpers.options import override_options
 from sentry.utils import json
+from sentry.utils.cache import cache_key_for_event
 from sentry.testutils.factories import Factories
 
 logger = logging.getLogger(__name__)
@@ -116,3 +127,184 @@ def test_ingest_consumer_reads_from_topic_and_calls_celery_task(
         assert message is not None
         # check that the data has not been scrambled
         assert message.data["extra"]["the_id"] == event_id
+
+
+class _FakeMessage(object):
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+
+@pytest.mark.django_db
+@mock.patch("sentry.ingest.ingest_consumer.preprocess_event")
+def test_ingest_consumer_flushes_batch(preprocess_event):
+    organization = Factories.create_organization()
+    project = Factories.create_project(organization=organization)
+
+    worker = IngestConsumerWorker()
+    message, event_id = _get_test_message(project)
+    duplicate = worker.process_message(_FakeMessage(message))
+    batch = [duplicate, duplicate]
+    for _ in range(2):
+        message, _ = _get_test_message(project)
+        batch.append(worker.process_message(_FakeMessage(message)))
+
+    worker.flush_batch(batch)
+    assert len(preprocess_event.mock_calls) == 3
+    for call in preprocess_event.mock_calls:
+        _, _, kwargs = call
+        assert kwargs["project"] == project
+        assert default_cache.get(kwargs["cache_key"]) == kwargs["data"]
+
+    # everything in the batch has been seen now
+    preprocess_event.reset_mock()
+    worker.flush_batch(batch)
+    assert preprocess_event.mock_calls == []
+
+
+@mock.patch("sentry.ingest.ingest_consumer.multiprocessing.Pool")
+def test_multiprocess_ingest_consumer_splits_batch_by_partition(pool_cls):
+    pool = pool_cls.return_value
+    pool.apply_async.side_effect = lambda func, args: mock.Mock(
+        get=mock.Mock(return_value=(args[0], len(args[1]), 0.1, 1.0))
+    )
+
+    worker = MultiprocessIngestConsumerWorker(processes=2)
+    messages = []
+    for partition, value in [(0, "a"), (1, "b"), (0, "c")]:
+        message = mock.Mock()
+        message.partition.return_value = partition
+        message.value.return_value = value
+        messages.append(worker.process_message(message))
+
+    worker.flush_batch(messages)
+    assert sorted(pool.apply_async.call_args_list) == [
+        mock.call(_process_partition_batch, (0, ["a", "c"])),
+        mock.call(_process_partition_batch, (1, ["b"])),
+    ]
+
+    worker.shutdown()
+    pool.close.assert_called_once_with()
+    pool.join.assert_called_once_with()
+
+
+@pytest.mark.django_db
+@mock.patch("sentry.ingest.ingest_consumer.save_events_inline")
+@mock.patch("sentry.ingest.ingest_consumer.preprocess_event")
+def test_ingest_consumer_saves_inline(preprocess_event, save_events_inline):
+    save_events_inline.return_value = []
+    organization = Factories.create_organization()
+    project = Factories.create_project(organization=organization)
+
+    worker = IngestConsumerWorker()
+    message, event_id = _get_test_message(project)
+    event = worker.process_message(_FakeMessage(message))
+
+    with override_options({"store.ingest-consumer-save-inline": True}):
+        worker.flush_batch([event])
+
+    assert preprocess_event.mock_calls == []
+    save_events_inline.assert_called_once_with(
+        [{"data": event["data"], "start_time": event["start_time"], "event_id": event_id}]
+    )
+    assert default_cache.get(cache_key_for_event(event["data"])) is None
+
+
+@pytest.mark.django_db
+@mock.patch("sentry.ingest.ingest_consumer.preprocess_event")
+def test_ingest_consumer_inline_save_failure(preprocess_event):
+    organization = Factories.create_organization()
+    project = Factories.create_project(organization=organization)
+
+    worker = IngestConsumerWorker()
+    failing_message, failing_event_id = _get_test_message(project)
+    message, event_id = _get_test_message(project)
+    batch = [
+        worker.process_message(_FakeMessage(failing_message)),
+        worker.process_message(_FakeMessage(message)),
+    ]
+
+    save = EventManager.save
+
+    def save_or_fail(self, *args, **kwargs):
+        if self._data["event_id"] == failing_event_id:
+            raise Exception("boom")
+        return save(self, *args, **kwargs)
+
+    with override_options({"store.ingest-consumer-save-inline": True}), mock.patch.object(
+        EventManager, "save", autospec=True, side_effect=save_or_fail
+    ):
+        worker.flush_batch(batch)
+
+    assert Event.objects.filter(event_id=event_id).exists()
+    assert not Event.objects.filter(event_id=failing_event_id).exists()
+
+    # the event that failed to save takes the regular path instead
+    assert len(preprocess_event.mock_calls) == 1
+    _, _, kwargs = preprocess_event.mock_calls[0]
+    assert kwargs["event_id"] == failing_event_id
+    assert kwargs["project"] == project
+    assert default_cache.get(kwargs["cache_key"]) == kwargs["data"]
+
+
+@pytest.mark.django_db
+@mock.patch("sentry.event_manager.eventstream.insert")
+@mock.patch("sentry.event_manager.nodestore.set_multi")
+@mock.patch("sentry.ingest.ingest_consumer.preprocess_event")
+def test_ingest_consumer_inline_flush_failure(preprocess_event, set_multi, eventstream_insert):
+    organization = Factories.create_organization()
+    project = Factories.create_project(organization=organization)
+
+    worker = IngestConsumerWorker()
+    failing_message, failing_event_id = _get_test_message(project)
+    message, event_id = _get_test_message(project)
+    batch = [
+        worker.process_message(_FakeMessage(failing_message)),
+        worker.process_message(_FakeMessage(message)),
+    ]
+
+    # the batched nodestore write fails and falls back to saving every node,
+    # after which publishing one of the events fails
+    set_multi.side_effect = Exception("boom")
+
+    def insert(event, **kwargs):
+        if event.event_id == failing_event_id:
+            raise Exception("boom")
+
+    eventstream_insert.side_effect = insert
+
+    deduplication_key = "ev:{}:{}".format(project.id, failing_event_id)
+
+    def requeue(**kwargs):
+        # the event must not be marked as seen before it has been handed on
+        assert cache.get(deduplication_key) is None
+
+    preprocess_event.side_effect = requeue
+
+    with override_options({"store.ingest-consumer-save-inline": True}):
+        worker.flush_batch(batch)
+
+    assert len(preprocess_event.mock_calls) == 1
+    _, _, kwargs = preprocess_event.mock_calls[0]
+    assert kwargs["event_id"] == failing_event_id
+    assert default_cache.get(kwargs["cache_key"]) == kwargs["data"]
+    assert cache.get(deduplication_key) is not None
+
+
+@pytest.mark.django_db
+@mock.patch("sentry.ingest.ingest_consumer.save_events_inline")
+@mock.patch("sentry.ingest.ingest_consumer.preprocess_event")
+def test_ingest_consumer_attachments_never_save_inline(preprocess_event, save_events_inline):
+    organization = Factories.create_organization()
+    project = Factories.create_project(organization=organization)
+
+    worker = IngestConsumerWorker(allow_inline_save=False)
+    message, _ = _get_test_message(project)
+
+    with override_options({"store.ingest-consumer-save-inline": True}):
+        worker.flush_batch([worker.process_message(_FakeMessage(message))])
+
+    assert len(preprocess_event.mock_calls) == 1
+    assert save_events_inline.mock_calls == []
@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 
-from sentry.lang.javascript.cache import SourceCache
+from mock import Mock
+
+from sentry.lang.javascript.cache import ParsedSourceMapCache, SourceCache
 from unittest import TestCase
 
 
@@ -38,3 +40,31 @@ class BasicCacheTest(TestCase):
         # fall back to utf-8
         cache.add(url, "foobar".encode("utf-32"), encoding="utf-32")
         assert cache.get(url)[0] == u"foobar"
+
+
+class ParsedSourceMapCacheTest(TestCase):
+    def test_get_or_parse(self):
+        cache = ParsedSourceMapCache(1000)
+        parse = Mock(side_effect=lambda body: body.upper())
+        key = (1, None, "http://example.com/foo.js.map")
+
+        assert cache.get_or_parse(key, b"foo", parse) == b"FOO"
+        assert cache.get_or_parse(key, b"foo", parse) == b"FOO"
+        assert parse.call_count == 1
+
+        # different contents for the same url are parsed again
+        assert cache.get_or_parse(key, b"bar", parse) == b"BAR"
+        assert parse.call_count == 2
+
+    def test_size_bound(self):
+        # every entry weighs 6 + 6 * 24 bytes, so only one of them fits
+        cache = ParsedSourceMapCache(300)
+        parse = Mock(side_effect=lambda body: body.upper())
+
+        cache.get_or_parse(("a",), b"123456", parse)
+        cache.get_or_parse(("b",), b"123456", parse)  # evicts "a"
+        cache.get_or_parse(("b",), b"123456", parse)
+        assert parse.call_count == 2
+
+        cache.get_or_parse(("a",), b"123456", parse)
+        assert parse.call_count == 3
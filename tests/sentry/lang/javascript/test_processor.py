@@ -58,6 +58,51 @@ class JavaScriptStacktraceProcessorTest(TestCase):
         r = JavaScriptStacktraceProcessor({}, None, project)
         assert not r.allow_scraping
 
+    # The test settings fetch sources on the calling thread, since pool
+    # threads have their own database connections and can't see the data of
+    # the test transaction. Fetching is mocked here, which is the only way to
+    # exercise the threaded path.
+    @patch("sentry.lang.javascript.processor.close_old_connections")
+    @patch("sentry.lang.javascript.processor.fetch_sourcemap")
+    @patch("sentry.lang.javascript.processor.fetch_file")
+    def test_cache_sources(self, mock_fetch_file, mock_fetch_sourcemap, close_old_connections):
+        def fetch_file(url, **kwargs):
+            if url == "http://example.com/c.js":
+                raise http.CannotFetch({"type": EventError.FETCH_GENERIC_ERROR, "url": url})
+            return http.UrlResult(url, {"sourcemap": "shared.js.map"}, b"foo()", 200, None)
+
+        mock_fetch_file.side_effect = fetch_file
+        mock_fetch_sourcemap.side_effect = UnparseableSourcemap(
+            {"url": "http://example.com/shared.js.map"}
+        )
+
+        r = JavaScriptStacktraceProcessor({}, None, self.project)
+        files = ["http://example.com/%s.js" % x for x in "abcd"]
+        r.max_fetches = 3
+        with self.settings(SENTRY_SOURCE_FETCH_CONCURRENCY=4):
+            r.cache_sources(files)
+
+        assert mock_fetch_file.call_count == 3
+        # before and after every fetch on the pool
+        assert close_old_connections.call_count == 6
+        assert r.fetch_count == 4
+        assert mock_fetch_sourcemap.call_count == 1
+        assert r.cache.get("http://example.com/a.js") is not None
+        assert r.cache.get("http://example.com/c.js") is None
+
+        sourcemap_error = {
+            "type": EventError.JS_INVALID_SOURCEMAP,
+            "url": "http://example.com/shared.js.map",
+        }
+        assert r.cache.get_errors("http://example.com/a.js") == [sourcemap_error]
+        assert r.cache.get_errors("http://example.com/b.js") == [sourcemap_error]
+        assert r.cache.get_errors("http://example.com/c.js") == [
+            {"type": EventError.FETCH_GENERIC_ERROR, "url": "http://example.com/c.js"}
+        ]
+        assert r.cache.get_errors("http://example.com/d.js") == [
+            {"type": EventError.JS_TOO_MANY_REMOTE_SOURCES}
+        ]
+
 
 class FetchReleaseFileTest(TestCase):
     def test_unicode(self):
@@ -94,6 +139,27 @@ class FetchReleaseFileTest(TestCase):
 
         assert result == new_result
 
+    def test_missing_file_uses_manifest(self):
+        project = self.project
+        release = Release.objects.create(organization_id=project.organization_id, version="abc")
+        release.add_project(project)
+
+        file = File.objects.create(name="file.min.js", type="release.file", headers={})
+        file.putfile(six.BytesIO(b"foo()"))
+        ReleaseFile.objects.create(
+            name="~/file.min.js",
+            release=release,
+            organization_id=project.organization_id,
+            file=file,
+        )
+        ReleaseFile.objects.get_manifest(release)
+
+        with self.assertNumQueries(0):
+            assert fetch_release_file("http://example.com/other.js", release) is None
+
+        result = fetch_release_file("http://example.com/file.min.js", release)
+        assert result.body == b"foo()"
+
     def test_distribution(self):
         project = self.project
         release = Release.objects.create(organization_id=project.organization_id, version="abc")
@@ -1,11 +1,13 @@
 from __future__ import absolute_import
 
+import io
 import os
 
 from django.core.files.base import ContentFile
 
 from sentry.models import File, FileBlob
 from sentry.testutils import TestCase
+from sentry.utils.files import iter_file
 
 
 class FileBlobTest(TestCase):
@@ -83,3 +85,68 @@ class FileTest(TestCase):
 
         f = file.getfile(prefetch=True)
         assert f.read() == random_data
+
+    def test_multi_chunk_read(self):
+        random_data = os.urandom(1000)
+
+        fileobj = ContentFile(random_data)
+        file = File.objects.create(name="test.bin", type="default", size=len(random_data))
+        file.putfile(fileobj, 64)
+
+        for readahead in (False, True):
+            with file.getfile(readahead=readahead) as fp:
+                assert fp.read(100) == random_data[:100]
+
+                buf = bytearray(200)
+                assert fp.readinto(buf) == 200
+                assert bytes(buf) == random_data[100:300]
+
+                fp.seek(900)
+                assert fp.read() == random_data[900:]
+
+                fp.seek(10)
+                assert fp.read(1) == random_data[10:11]
+
+    def test_buffered_reader(self):
+        random_data = os.urandom(1000)
+
+        fileobj = ContentFile(random_data)
+        file = File.objects.create(name="test.bin", type="default", size=len(random_data))
+        file.putfile(fileobj, 64)
+
+        with io.BufferedReader(file._get_chunked_blob(readahead=True)) as fp:
+            assert fp.read(10) == random_data[:10]
+            fp.seek(-100, io.SEEK_END)
+            assert fp.read() == random_data[-100:]
+
+    def test_readahead_stops_at_last_blob(self):
+        random_data = os.urandom(1000)
+
+        fileobj = ContentFile(random_data)
+        file = File.objects.create(name="test.bin", type="default", size=len(random_data))
+        file.putfile(fileobj, 64)
+
+        with file.getfile(readahead=True) as fp:
+            assert fp.read() == random_data
+            assert fp._readahead_executor is None
+
+            fp.seek(0)
+            assert fp.read() == random_data
+
+    def test_iter_file(self):
+        random_data = os.urandom(1000)
+
+        fileobj = ContentFile(random_data)
+        file = File.objects.create(name="test.bin", type="default", size=len(random_data))
+        file.putfile(fileobj, 64)
+
+        fp = file.getfile(readahead=True)
+        assert b"".join(iter_file(fp, 100)) == random_data
+        assert fp.closed
+
+        # closing the stream early (e.g. the client went away) closes the file
+        fp = file.getfile(readahead=True)
+        chunks = iter_file(fp, 100)
+        assert next(chunks) == random_data[:100]
+        chunks.close()
+        assert fp.closed
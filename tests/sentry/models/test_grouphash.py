@@ -0,0 +1,46 @@
+from __future__ import absolute_import
+
+from sentry.models import GroupHash
+from sentry.testutils import TestCase
+
+
+class GroupHashManagerTest(TestCase):
+    def setUp(self):
+        GroupHash.objects.invalidate_cache(self.project.id)
+
+    def test_get_or_create_many(self):
+        existing = GroupHash.objects.create(project=self.project, hash="a" * 32, group=self.group)
+
+        hashes = GroupHash.objects.get_or_create_many(
+            self.project, ["b" * 32, "a" * 32, "c" * 32, "b" * 32]
+        )
+
+        assert [h.hash for h in hashes] == ["b" * 32, "a" * 32, "c" * 32, "b" * 32]
+        assert hashes[1].id == existing.id
+        assert hashes[1].group_id == self.group.id
+        assert hashes[0].id == hashes[3].id
+        assert hashes[0].group_id is None
+        assert GroupHash.objects.filter(project=self.project).count() == 3
+
+        assert [
+            h.id for h in GroupHash.objects.get_or_create_many(self.project, ["c" * 32, "b" * 32])
+        ] == [hashes[2].id, hashes[0].id]
+
+    def test_get_or_create_many_empty(self):
+        assert GroupHash.objects.get_or_create_many(self.project, []) == []
+
+    def test_cache(self):
+        existing = GroupHash.objects.create(project=self.project, hash="a" * 32, group=self.group)
+        GroupHash.objects.get_or_create_many(self.project, ["a" * 32])
+
+        with self.assertNumQueries(0):
+            (h,) = GroupHash.objects.get_or_create_many(self.project, ["a" * 32])
+        assert h.id == existing.id
+        assert h.group_id == self.group.id
+
+        GroupHash.objects.filter(id=existing.id).update(group=None, group_tombstone_id=1)
+        GroupHash.objects.invalidate_cache(self.project.id)
+
+        (h,) = GroupHash.objects.get_or_create_many(self.project, ["a" * 32])
+        assert h.group_id is None
+        assert h.group_tombstone_id == 1
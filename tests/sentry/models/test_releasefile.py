@@ -1,7 +1,10 @@
 from __future__ import absolute_import
 
-from sentry.models import ReleaseFile
+import mock
+
+from sentry.models import File, Release, ReleaseFile
 from sentry.testutils import TestCase
+from sentry.utils.cache import cache
 
 
 class ReleaseFileTestCase(TestCase):
@@ -29,3 +32,82 @@ class ReleaseFileTestCase(TestCase):
         # unclear if we actually experience this case in the real
         # world, but worth documenting the behavior
         assert n("foo.js") == ["foo.js", "~foo.js"]
+
+    def test_manifest(self):
+        release = Release.objects.create(organization_id=self.organization.id, version="abc")
+
+        def create_file(name):
+            return ReleaseFile.objects.create(
+                name=name,
+                release=release,
+                organization_id=self.organization.id,
+                file=File.objects.create(name=name, type="release.file"),
+            )
+
+        foo = create_file("~/foo.js")
+        assert ReleaseFile.objects.get_manifest(release) == {foo.ident: foo.id}
+
+        with self.assertNumQueries(0):
+            assert ReleaseFile.objects.get_manifest(release) == {foo.ident: foo.id}
+
+        bar = create_file("~/bar.js")
+        assert ReleaseFile.objects.get_manifest(release) == {foo.ident: foo.id, bar.ident: bar.id}
+
+        foo.delete()
+        assert ReleaseFile.objects.get_manifest(release) == {bar.ident: bar.id}
+
+    def test_manifest_stale_writes(self):
+        release = Release.objects.create(organization_id=self.organization.id, version="abc")
+        manager = ReleaseFile.objects
+
+        def cache_stale_manifest(version):
+            # a worker that queried the files before the change became visible
+            cache.set(manager._get_manifest_cache_key(release.id, None, version), {}, 3600)
+
+        on_commit_callbacks = []
+        with mock.patch(
+            "sentry.models.releasefile.transaction.on_commit",
+            side_effect=lambda func, using=None: on_commit_callbacks.append(func),
+        ):
+            version = manager._get_manifest_version(release.id, None)
+            foo = ReleaseFile.objects.create(
+                name="~/foo.js",
+                release=release,
+                organization_id=self.organization.id,
+                file=File.objects.create(name="~/foo.js", type="release.file"),
+            )
+            # cached with the version from before the change
+            cache_stale_manifest(version)
+            assert manager.get_manifest(release) == {foo.ident: foo.id}
+
+            # cached before the transaction of the change commits
+            manager.invalidate_manifest(release.id, None)
+            cache_stale_manifest(manager._get_manifest_version(release.id, None))
+
+        assert len(on_commit_callbacks) == 2
+        for callback in on_commit_callbacks:
+            callback()
+        assert manager.get_manifest(release) == {foo.ident: foo.id}
+
+    def test_empty_manifest_ttl(self):
+        release = Release.objects.create(organization_id=self.organization.id, version="abc")
+
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            assert ReleaseFile.objects.get_manifest(release) == {}
+
+        (_, manifest, ttl), _ = cache_set.call_args
+        assert manifest == {}
+        assert ttl == ReleaseFile.objects.empty_manifest_cache_ttl
+
+    def test_manifest_too_many_files(self):
+        release = Release.objects.create(organization_id=self.organization.id, version="abc")
+        for name in ("~/foo.js", "~/bar.js"):
+            ReleaseFile.objects.create(
+                name=name,
+                release=release,
+                organization_id=self.organization.id,
+                file=File.objects.create(name=name, type="release.file"),
+            )
+
+        with mock.patch.object(ReleaseFile.objects, "max_manifest_files", 1):
+            assert ReleaseFile.objects.get_manifest(release) is None
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+from sentry.nodestore.cached.backend import CachedNodeStorage
+from sentry.nodestore.django.models import Node
+from sentry.testutils import TestCase
+
+
+class CachedNodeStorageTest(TestCase):
+    def setUp(self):
+        self.ns = CachedNodeStorage("sentry.nodestore.django.DjangoNodeStorage")
+        # the local cache outlives the backend
+        self.ns.local_cache.clear()
+
+    def test_get_multi(self):
+        self.ns.inner.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": u"bär"})
+
+        result = self.ns.get_multi(
+            ["d2502ebbd7df41ceba8d3275595cac33", "5394aa025b8e401ca6bc3ddee3130edc"]
+        )
+        assert result == {
+            "d2502ebbd7df41ceba8d3275595cac33": {"foo": u"bär"},
+            "5394aa025b8e401ca6bc3ddee3130edc": None,
+        }
+
+        with self.assertNumQueries(0):
+            assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": u"bär"}
+
+        # missing nodes are not cached
+        self.ns.inner.set("5394aa025b8e401ca6bc3ddee3130edc", {"foo": "baz"})
+        assert self.ns.get("5394aa025b8e401ca6bc3ddee3130edc") == {"foo": "baz"}
+
+    def test_get_returns_copies(self):
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+
+        self.ns.get("d2502ebbd7df41ceba8d3275595cac33")["foo"] = "baz"
+        assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": "bar"}
+
+    def test_set(self):
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+        assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "bar"}
+
+        self.ns.set_multi({"d2502ebbd7df41ceba8d3275595cac33": {"foo": "baz"}})
+        with self.assertNumQueries(0):
+            assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": "baz"}
+
+    def test_set_uncacheable(self):
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+        self.ns.set_multi({"d2502ebbd7df41ceba8d3275595cac33": {"foo": set([1])}})
+
+        assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": set([1])}
+        assert self.ns.local_cache.get("d2502ebbd7df41ceba8d3275595cac33") is None
+        assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": set([1])}
+
+        self.ns.set("5394aa025b8e401ca6bc3ddee3130edc", {"foo": (1, 2)})
+        assert self.ns.local_cache.get("5394aa025b8e401ca6bc3ddee3130edc") is None
+        assert self.ns.get("5394aa025b8e401ca6bc3ddee3130edc") == {"foo": (1, 2)}
+
+    def test_local_cache_shared(self):
+        other = CachedNodeStorage("sentry.nodestore.django.DjangoNodeStorage")
+        assert other.local_cache is self.ns.local_cache
+
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+        with self.assertNumQueries(0):
+            assert other.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": "bar"}
+
+    def test_delete(self):
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
+        self.ns.set("5394aa025b8e401ca6bc3ddee3130edc", {"foo": "baz"})
+
+        self.ns.delete("d2502ebbd7df41ceba8d3275595cac33")
+        assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") is None
+
+        self.ns.delete_multi(["5394aa025b8e401ca6bc3ddee3130edc"])
+        assert self.ns.get("5394aa025b8e401ca6bc3ddee3130edc") is None
+        assert not Node.objects.exists()
+
+    def test_local_cache_size(self):
+        self.ns = CachedNodeStorage(
+            "sentry.nodestore.django.DjangoNodeStorage", local_cache_size=20
+        )
+        self.ns.local_cache.clear()
+        # only one of these fits into the local cache
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "barbarbar"})
+        self.ns.set("5394aa025b8e401ca6bc3ddee3130edc", {"foo": "bazbazbaz"})
+
+        assert self.ns.local_cache.get("d2502ebbd7df41ceba8d3275595cac33") is None
+        with self.assertNumQueries(1):
+            assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": "barbarbar"}
+
+
+class SharedCachedNodeStorageTest(TestCase):
+    def setUp(self):
+        self.ns = CachedNodeStorage(
+            "sentry.nodestore.django.DjangoNodeStorage", local_cache_size=0, cluster="default"
+        )
+        self.ns.delete_multi(["d2502ebbd7df41ceba8d3275595cac33"])
+
+    def test_get(self):
+        self.ns.inner.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": u"bär"})
+        assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": u"bär"}
+
+        other = CachedNodeStorage("sentry.nodestore.django.DjangoNodeStorage", cluster="default")
+        other.local_cache.clear()
+        with self.assertNumQueries(0):
+            assert other.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": u"bär"}
+            # filled from the shared cache
+            assert other.local_cache.get("d2502ebbd7df41ceba8d3275595cac33") is not None
+
+        self.ns.delete("d2502ebbd7df41ceba8d3275595cac33")
+        assert self.ns.client.get(self.ns._make_key("d2502ebbd7df41ceba8d3275595cac33")) is None
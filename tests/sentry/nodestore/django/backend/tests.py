@@ -2,9 +2,12 @@
 
 from __future__ import absolute_import
 
+from base64 import b64decode, b64encode
 from datetime import timedelta
+from django.db import connection
 from django.utils import timezone
 
+from sentry.nodestore import codec
 from sentry.nodestore.django.models import Node
 from sentry.nodestore.django.backend import DjangoNodeStorage
 from sentry.testutils import TestCase
@@ -31,6 +34,20 @@ class DjangoNodeStorageTest(TestCase):
         )
         assert result == dict((n.id, n.data) for n in nodes)
 
+    def test_get_multi_missing(self):
+        Node.objects.create(id="d2502ebbd7df41ceba8d3275595cac33", data={"foo": "bar"})
+
+        with self.assertNumQueries(1):
+            result = self.ns.get_multi(
+                ["d2502ebbd7df41ceba8d3275595cac33", "5394aa025b8e401ca6bc3ddee3130edc"]
+            )
+        assert result == {
+            "d2502ebbd7df41ceba8d3275595cac33": {"foo": "bar"},
+            "5394aa025b8e401ca6bc3ddee3130edc": None,
+        }
+
+        assert self.ns.get_multi([]) == {}
+
     def test_set(self):
         self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": "bar"})
         assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "bar"}
@@ -45,6 +62,55 @@ class DjangoNodeStorageTest(TestCase):
         assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "bar"}
         assert Node.objects.get(id="5394aa025b8e401ca6bc3ddee3130edc").data == {"foo": "baz"}
 
+    def test_set_multi_existing(self):
+        Node.objects.create(id="d2502ebbd7df41ceba8d3275595cac33", data={"foo": "bar"})
+
+        with self.assertNumQueries(1):
+            self.ns.set_multi(
+                {
+                    "d2502ebbd7df41ceba8d3275595cac33": {"foo": "baz"},
+                    "5394aa025b8e401ca6bc3ddee3130edc": {"foo": "qux"},
+                }
+            )
+        assert Node.objects.get(id="d2502ebbd7df41ceba8d3275595cac33").data == {"foo": "baz"}
+        assert Node.objects.get(id="5394aa025b8e401ca6bc3ddee3130edc").data == {"foo": "qux"}
+
+    def test_codec(self):
+        self.ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": u"bär"})
+        ns = DjangoNodeStorage(codec="msgpack-zlib")
+        ns.set("5394aa025b8e401ca6bc3ddee3130edc", {"foo": u"bär"})
+
+        value = Node.objects.filter(id="5394aa025b8e401ca6bc3ddee3130edc").values_list(
+            "data", flat=True
+        )[0]
+        assert codec.is_encoded(b64decode(value))
+
+        # nodes are read in either format
+        for storage in (self.ns, ns):
+            assert storage.get_multi(
+                ["d2502ebbd7df41ceba8d3275595cac33", "5394aa025b8e401ca6bc3ddee3130edc"]
+            ) == {
+                "d2502ebbd7df41ceba8d3275595cac33": {"foo": u"bär"},
+                "5394aa025b8e401ca6bc3ddee3130edc": {"foo": u"bär"},
+            }
+
+    def test_malformed_payload(self):
+        for data in (u"not a payload", b64encode(b"\x02not msgpack").decode("utf-8")):
+            Node.objects.create(id="d2502ebbd7df41ceba8d3275595cac33", data={"foo": "bar"})
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "update nodestore_node set data = %s where id = %s",
+                    [data, "d2502ebbd7df41ceba8d3275595cac33"],
+                )
+
+            assert self.ns.get("d2502ebbd7df41ceba8d3275595cac33") == {}
+            Node.objects.all().delete()
+
+    def test_codec_fallback(self):
+        ns = DjangoNodeStorage(codec="msgpack-zlib")
+        ns.set("d2502ebbd7df41ceba8d3275595cac33", {"foo": set([1])})
+        assert ns.get("d2502ebbd7df41ceba8d3275595cac33") == {"foo": set([1])}
+
     def test_create(self):
         node_id = self.ns.create({"foo": "bar"})
         assert Node.objects.get(id=node_id).data == {"foo": "bar"}
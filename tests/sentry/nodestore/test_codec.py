@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+
+import pytest
+import zlib
+
+from sentry.nodestore import codec
+from sentry.utils import json
+
+
+DATA = {"event_id": "a" * 32, "message": u"bär", "tags": [["foo", "bar"]], "count": 1, "x": None}
+
+
+@pytest.mark.parametrize("name", ["msgpack", "msgpack-zlib"])
+def test_roundtrip(name):
+    payload = codec.encode(DATA, name)
+    assert codec.is_encoded(payload)
+    assert codec.decode(payload) == DATA
+
+
+def test_legacy_payloads():
+    assert not codec.is_encoded(zlib.compress(b"foo"))
+    assert not codec.is_encoded(json.dumps(DATA).encode("utf-8"))
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        codec.encode(DATA, "unknown")
+    with pytest.raises(ValueError):
+        codec.decode(b"\xff")
+
+
+def test_register_duplicate():
+    with pytest.raises(ValueError):
+        codec.register(codec.MsgpackCodec())
@@ -4,10 +4,12 @@ import mock
 import uuid
 from time import time
 
-from sentry import quotas, tsdb
+from sentry import nodestore, quotas, tsdb
+from sentry.cache import default_cache
 from sentry.event_manager import EventManager, HashDiscarded
+from sentry.models import Event
 from sentry.plugins.base.v2 import Plugin2
-from sentry.tasks.store import preprocess_event, process_event, save_event
+from sentry.tasks.store import _do_save_event_batch, preprocess_event, process_event, save_event
 from sentry.testutils import PluginTestCase
 from sentry.utils.dates import to_datetime
 
@@ -177,3 +179,67 @@ class StoreTasksTest(PluginTestCase):
                 ],
                 timestamp=to_datetime(now),
             )
+
+    @mock.patch("sentry.event_manager.eventstream.insert")
+    def test_save_event_batch(self, mock_eventstream_insert):
+        project = self.create_project()
+
+        def make_data(message):
+            manager = EventManager({"logentry": {"formatted": message}})
+            manager.normalize()
+            data = manager.get_data()
+            data["project"] = project.id
+            return dict(data)
+
+        cached = make_data("cached")
+        default_cache.set("e:cached", cached, 3600)
+        inline = make_data("inline")
+
+        broken = {"data": {"project": project.id, "platform": "python"}}
+        failed = _do_save_event_batch(
+            [
+                {"cache_key": "e:cached"},
+                # fails to save, which must not affect the other events
+                broken,
+                {"data": inline},
+            ]
+        )
+        assert failed == [broken]
+
+        event_ids = [cached["event_id"], inline["event_id"]]
+        for event_id in event_ids:
+            assert nodestore.get(Event.generate_node_id(project.id, event_id)) is not None
+        assert sorted(
+            call[1]["event"].event_id for call in mock_eventstream_insert.call_args_list
+        ) == sorted(event_ids)
+        assert default_cache.get("e:cached") is None
+
+    @mock.patch("sentry.event_manager.eventstream.insert")
+    def test_save_event_batch_flush_failure(self, mock_eventstream_insert):
+        project = self.create_project()
+
+        def make_data(message):
+            manager = EventManager({"logentry": {"formatted": message}})
+            manager.normalize()
+            data = manager.get_data()
+            data["project"] = project.id
+            return dict(data)
+
+        ok = make_data("ok")
+        broken = make_data("broken")
+        default_cache.set("e:ok", ok, 3600)
+        default_cache.set("e:broken", broken, 3600)
+
+        def insert(event, **kwargs):
+            if event.event_id == broken["event_id"]:
+                raise Exception("boom")
+
+        mock_eventstream_insert.side_effect = insert
+
+        broken_item = {"cache_key": "e:broken"}
+        failed = _do_save_event_batch([{"cache_key": "e:ok"}, broken_item])
+        assert failed == [broken_item]
+
+        # the payload of the failed event is kept around to retry it
+        assert default_cache.get("e:ok") is None
+        assert default_cache.get("e:broken") is not None
@@ -1,14 +1,18 @@
 from __future__ import absolute_import
 
 import pytest
+import mock
 
 from sentry.grouping.api import get_default_grouping_config_dict, load_grouping_config
 from sentry.stacktraces.processing import (
+    StacktraceProcessor,
     find_stacktraces_in_data,
     normalize_stacktraces_for_grouping,
     get_crash_frame_from_event_data,
+    process_stacktraces,
 )
 from sentry.testutils import TestCase
+from sentry.utils.cache import cache
 
 
 class FindStacktracesTest(TestCase):
@@ -152,6 +156,60 @@ class FindStacktracesTest(TestCase):
         assert len(infos[0].stacktrace["frames"]) == 3
 
 
+class UppercaseProcessor(StacktraceProcessor):
+    def handles_frame(self, frame, stacktrace_info):
+        return "function" in frame
+
+    def preprocess_frame(self, processable_frame):
+        processable_frame.set_cache_key_from_values([processable_frame["function"]])
+
+    def process_frame(self, processable_frame, processing_task):
+        function = processable_frame.cache_value
+        if function is None:
+            function = processable_frame["function"].upper()
+            processable_frame.set_cache_value(function)
+        return [dict(processable_frame.frame, function=function)], None, None
+
+
+class ProcessStacktracesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def make_processors(self, data, infos):
+        return [UppercaseProcessor(data, infos, project=self.project)]
+
+    def make_data(self):
+        return {
+            "platform": "java",
+            "stacktrace": {
+                "frames": [{"function": "foo"}, {"function": "bar"}, {"function": "foo"}]
+            },
+        }
+
+    def test_frame_cache_is_batched(self):
+        with mock.patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            data = process_stacktraces(self.make_data(), make_processors=self.make_processors)
+        assert [f["function"] for f in data["stacktrace"]["frames"]] == ["FOO", "BAR", "FOO"]
+        assert set_many.call_count == 1
+        assert sorted(set_many.call_args[0][0].values()) == ["BAR", "FOO"]
+
+        with mock.patch.object(cache, "get_many", wraps=cache.get_many) as get_many, mock.patch(
+            "sentry.stacktraces.processing.store_frame_cache"
+        ) as store_frame_cache:
+            data = process_stacktraces(self.make_data(), make_processors=self.make_processors)
+        assert [f["function"] for f in data["stacktrace"]["frames"]] == ["FOO", "BAR", "FOO"]
+        assert get_many.call_count == 1
+        assert not store_frame_cache.called
+
+    def test_frame_cache_failure(self):
+        with mock.patch.object(cache, "set_many", side_effect=Exception("boom")), mock.patch.object(
+            UppercaseProcessor, "close"
+        ) as close:
+            data = process_stacktraces(self.make_data(), make_processors=self.make_processors)
+        assert [f["function"] for f in data["stacktrace"]["frames"]] == ["FOO", "BAR", "FOO"]
+        assert close.call_count == 1
+
+
 class NormalizeInApptest(TestCase):
     def test_normalize_with_system_frames(self):
         data = {
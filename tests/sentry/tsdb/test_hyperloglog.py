@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+
+import pytest
+
+from sentry.testutils import TestCase
+from sentry.tsdb import hyperloglog
+from sentry.utils.redis import clusters
+
+
+def test_merge_invalid_value():
+    with pytest.raises(ValueError):
+        hyperloglog.merge(hyperloglog.new_registers(), b"not a hyperloglog")
+
+
+def test_count_empty():
+    assert hyperloglog.count(hyperloglog.new_registers()) == 0
+
+
+class HyperLogLogTest(TestCase):
+    def setUp(self):
+        self.client = clusters.get("default").get_local_client(0)
+        self.client.delete("hll:a", "hll:b", "hll:union")
+
+    def tearDown(self):
+        self.client.delete("hll:a", "hll:b", "hll:union")
+
+    def assert_matches_redis(self, keys):
+        registers = hyperloglog.new_registers()
+        for key in keys:
+            hyperloglog.merge(registers, self.client.get(key))
+
+        self.client.pfmerge("hll:union", *keys)
+        assert hyperloglog.count(registers) == self.client.pfcount("hll:union")
+
+    def test_sparse(self):
+        self.client.pfadd("hll:a", *range(0, 50))
+        self.client.pfadd("hll:b", *range(25, 100))
+        self.assert_matches_redis(["hll:a", "hll:b"])
+
+    def test_dense(self):
+        self.client.pfadd("hll:a", *range(0, 10000))
+        self.client.pfadd("hll:b", *range(5000, 20000))
+        self.assert_matches_redis(["hll:a", "hll:b"])
+
+    def test_mixed(self):
+        self.client.pfadd("hll:a", *range(0, 10))
+        self.client.pfadd("hll:b", *range(0, 20000))
+        self.assert_matches_redis(["hll:a", "hll:b"])
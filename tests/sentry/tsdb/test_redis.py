@@ -8,7 +8,7 @@ from datetime import datetime, timedelta
 
 from sentry.testutils import TestCase
 from sentry.tsdb.base import TSDBModel, ONE_MINUTE, ONE_HOUR, ONE_DAY
-from sentry.tsdb.redis import RedisTSDB, CountMinScript, SuppressionWrapper
+from sentry.tsdb.redis import RedisTSDB, CountMinScript, SketchParameters, SuppressionWrapper
 from sentry.utils.dates import to_datetime, to_timestamp
 
 
@@ -178,6 +178,25 @@ class RedisTSDBTest(TestCase):
         results = self.db.get_sums(TSDBModel.project, [1, 2], dts[0], dts[-1], environment_id=1)
         assert results == {1: 0, 2: 0}
 
+    def test_get_range_many_keys(self):
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(hours=4)
+        dts = [now + timedelta(hours=i) for i in range(4)]
+
+        def timestamp(d):
+            t = int(to_timestamp(d))
+            return t - (t % 3600)
+
+        # 1 and 65 share a vnode (and therefore a hash) per rollup epoch
+        keys = [1, 65, "foo", 3]
+        for i, key in enumerate(keys):
+            self.db.incr(TSDBModel.project, key, dts[i], count=i + 1)
+
+        results = self.db.get_range(TSDBModel.project, keys, dts[0], dts[-1])
+        assert results == {
+            key: [(timestamp(dt), i + 1 if j == i else 0) for j, dt in enumerate(dts)]
+            for i, key in enumerate(keys)
+        }
+
     def test_count_distinct(self):
         now = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(hours=4)
         dts = [now + timedelta(hours=i) for i in range(4)]
@@ -812,3 +831,60 @@ class RedisTSDBTest(TestCase):
             ["eta", "7"],
             ["bar", "7"],
         ]
+
+    def test_most_frequent_summaries(self):
+        now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        model = TSDBModel.frequent_issues_by_project
+        rollup = 3600
+
+        self.db.sketch_parameters = SketchParameters(3, 64, 3)
+        self.db.record_frequency_multi(
+            ((model, {"organization:1": {"project:1": 1, "project:2": 2}}),), now
+        )
+        self.db.record_frequency_multi(
+            (
+                (
+                    model,
+                    {
+                        "organization:1": {
+                            "project:2": 1,
+                            "project:3": 3,
+                            "project:4": 4,
+                            "project:5": 5,
+                        }
+                    },
+                ),
+            ),
+            now - timedelta(hours=1),
+        )
+
+        self.db.enable_frequency_summaries = True
+
+        # Only the indexed items of each interval are taken into account.
+        assert self.db.get_most_frequent(
+            model,
+            ("organization:1", "organization:2"),
+            now - timedelta(hours=1),
+            now,
+            rollup=rollup,
+        ) == {
+            "organization:1": [("project:5", 5.0), ("project:4", 4.0), ("project:3", 3.0)],
+            "organization:2": [],
+        }
+
+        assert self.db.get_most_frequent(
+            model, ("organization:1",), now - timedelta(hours=1), now, rollup=rollup, limit=10,
+        ) == {
+            "organization:1": [
+                ("project:5", 5.0),
+                ("project:4", 4.0),
+                ("project:3", 3.0),
+                ("project:2", 2.0),
+                ("project:1", 1.0),
+            ]
+        }
+
+        # A single interval is still ranked by the script.
+        assert self.db.get_most_frequent(model, ("organization:1",), now, rollup=rollup) == {
+            "organization:1": [("project:2", 2.0), ("project:1", 1.0)]
+        }
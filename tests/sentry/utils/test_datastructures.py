@@ -2,7 +2,7 @@ from __future__ import absolute_import
 
 import pytest
 
-from sentry.utils.datastructures import BidirectionalMapping
+from sentry.utils.datastructures import BidirectionalMapping, LRUCache
 
 
 def test_bidirectional_mapping():
@@ -32,3 +32,49 @@ def test_bidirectional_mapping():
     del value["c"]
 
     assert len(value) == len(value.inverse()) == 2
+
+
+def test_lru_cache():
+    cache = LRUCache(3)
+    for key in "abc":
+        cache.set(key, key.upper())
+
+    assert cache.get("a") == "A"
+    cache.set("d", "D")  # evicts "b", since "a" has been used more recently
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert len(cache) == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (4, 1, 1)
+
+    cache.delete("a")
+    assert "a" not in cache
+    cache.clear()
+    assert len(cache) == cache.size == 0
+
+
+def test_lru_cache_ttl():
+    now = [0]
+    cache = LRUCache(10, ttl=60, timer=lambda: now[0])
+    cache.set("a", False)
+
+    now[0] = 59
+    assert cache.get("a") is False
+    now[0] = 60
+    assert cache.get("a", "missing") == "missing"
+    assert len(cache) == cache.size == 0
+
+
+def test_lru_cache_getsize():
+    cache = LRUCache(10, getsize=len)
+    cache.set("a", b"1234")
+    cache.set("b", b"123456")
+    assert cache.size == 10
+
+    assert cache.set("c", b"1") == 1
+    assert "a" not in cache
+    assert cache.size == 7
+    assert cache.evictions == 1
+
+    assert cache.set("d", b"12345678901") == 0  # larger than the cache itself
+    assert "d" not in cache
+    assert cache.size == 7
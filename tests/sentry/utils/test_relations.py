@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+
+from django.utils import timezone
+
+from sentry.models import Environment, GroupRelease, Release
+from sentry.testutils import TestCase
+from sentry.utils.cache import cache
+from sentry.utils.relations import RelationsCache, relations_cache
+
+
+class RelationsCacheTest(TestCase):
+    def test_tiers(self):
+        relations = RelationsCache(10, 60)
+        assert relations.get("foo") is None
+
+        cache.set("foo", "bar", 60)
+        assert relations.get("foo") == "bar"
+
+        # served from the local cache from now on
+        cache.delete("foo")
+        assert relations.get("foo") == "bar"
+
+        relations.set("baz", -1, 60)
+        assert cache.get("baz") == -1
+        assert relations.get("baz") == -1
+
+        relations.delete("baz")
+        assert relations.get("baz") is None
+
+    def test_repeated_upserts(self):
+        release = Release.get_or_create(project=self.project, version="abc")
+        environment = Environment.get_or_create(project=self.project, name="prod")
+        GroupRelease.get_or_create(
+            group=self.group, release=release, environment=environment, datetime=timezone.now()
+        )
+
+        cache.clear()
+        with self.assertNumQueries(0):
+            assert Release.get_or_create(project=self.project, version="abc") == release
+            assert Environment.get_or_create(project=self.project, name="prod") == environment
+            GroupRelease.get_or_create(
+                group=self.group, release=release, environment=environment, datetime=timezone.now()
+            )
+        assert cache.get(Release.get_cache_key(self.project.organization_id, "abc")) is None
+
+    def test_invalidate_on_delete(self):
+        environment = Environment.get_or_create(project=self.project, name="prod")
+        release = Release.get_or_create(project=self.project, version="abc")
+        grouprelease = GroupRelease.get_or_create(
+            group=self.group, release=release, environment=environment, datetime=timezone.now()
+        )
+        cache_key = GroupRelease.get_cache_key(self.group.id, release.id, "prod")
+        assert relations_cache.get(cache_key) == grouprelease
+
+        grouprelease.delete()
+        assert relations_cache.get(cache_key) is None